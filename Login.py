@@ -1,6 +1,7 @@
 import streamlit as st
 import streamlit_extras.switch_page_button as spb
 import hashlib
+from accounts import ADMIN_LOGIN_QUERY, USER_LOGIN_QUERY
 from db_utils import execute_query
 
 def verify_password(stored_password, input_password):
@@ -24,13 +25,7 @@ def main():
     if st.button("Login"):
         if mode == "Admin":
             # Query admin table via users table with admin role
-            query = """
-            SELECT u.user_id, u.username, u.password, a.admin_id, a.admin_role 
-            FROM users u 
-            JOIN admin a ON u.customer_id = a.admin_id 
-            WHERE u.username = %s
-            """
-            results = execute_query(query, (username,))
+            results = execute_query(ADMIN_LOGIN_QUERY, (username,))
             
             if results and len(results) > 0:
                 stored_password = results[0]['password']
@@ -52,12 +47,7 @@ def main():
                 
         elif mode == "User":
             # Query users table for regular user
-            query = """
-            SELECT user_id, username, password, customer_id 
-            FROM users 
-            WHERE username = %s
-            """
-            results = execute_query(query, (username,))
+            results = execute_query(USER_LOGIN_QUERY, (username,))
             
             if results and len(results) > 0:
                 stored_password = results[0]['password']
@@ -0,0 +1,16 @@
+# User and admin lookups shared by the login page and `schema.py check`
+
+# Admin account by username
+ADMIN_LOGIN_QUERY = """
+SELECT u.user_id, u.username, u.password, a.admin_id, a.admin_role
+FROM users u
+JOIN admin a ON u.customer_id = a.admin_id
+WHERE u.username = %s
+"""
+
+# Customer account by username
+USER_LOGIN_QUERY = """
+SELECT user_id, username, password, customer_id
+FROM users
+WHERE username = %s
+"""
@@ -0,0 +1,132 @@
+# Move past shows and tickets out of the live tables.
+#
+# Tickets (with their ticket_seats), schedule rules that ended and one-off
+# schedule changes older than the horizon are copied to the *_history tables
+# and deleted from the live ones, batch_size rows per short transaction, so
+# the booking queries only ever touch current data. Seat holds and seat
+# counters of past shows are simply deleted; the sold seats live on in
+# ticket_seats_history.
+#
+#     python archive.py --days 30 --batch-size 1000
+import argparse
+import datetime
+import json
+import time
+
+from mysql.connector import Error
+
+from db_utils import transaction
+
+# Shows older than this many days are archived
+ARCHIVE_AFTER_DAYS = 30
+ARCHIVE_BATCH_SIZE = 1000
+
+def _marks(keys):
+    return ", ".join(["%s"] * len(keys))
+
+# Copy the rows of table matching where into its history table, then delete
+# them. A plain INSERT so a row already in the history table fails the batch
+# rather than being skipped; and if the DELETE removes a different number of
+# rows than were copied (e.g. one changed in between), raise so the whole
+# batch rolls back instead of losing or duplicating rows.
+def _move(uow, table, where, params):
+    copied = uow.execute(f"INSERT INTO {table}_history SELECT * FROM {table} WHERE {where}", params)
+    deleted = uow.execute(f"DELETE FROM {table} WHERE {where}", params)
+    if deleted != copied:
+        raise Error(f"Archiving {table} copied {copied} rows but would delete {deleted}; batch rolled back")
+    return deleted
+
+def _tickets_batch(uow, horizon, batch_size):
+    ticket_ids = [row[0] for row in uow.fetch("""
+    SELECT ticket_id FROM tickets
+    WHERE show_date < %s
+    ORDER BY show_date
+    LIMIT %s
+    """, (horizon, batch_size))]
+    if ticket_ids:
+        where = f"ticket_id IN ({_marks(ticket_ids)})"
+        _move(uow, 'ticket_seats', where, ticket_ids)
+        _move(uow, 'tickets', where, ticket_ids)
+    return len(ticket_ids)
+
+def _rules_batch(uow, horizon, batch_size):
+    rule_ids = [row[0] for row in uow.fetch("""
+    SELECT rule_id FROM schedule_rules
+    WHERE end_date < %s
+    LIMIT %s
+    """, (horizon, batch_size))]
+    if rule_ids:
+        where = f"rule_id IN ({_marks(rule_ids)})"
+        _move(uow, 'schedule_rule_times', where, rule_ids)
+        _move(uow, 'schedule_rules', where, rule_ids)
+    return len(rule_ids)
+
+def _exceptions_batch(uow, horizon, batch_size):
+    keys = uow.fetch("""
+    SELECT movie_id, show_date, show_time FROM schedule_exceptions
+    WHERE show_date < %s
+    LIMIT %s
+    """, (horizon, batch_size))
+    if keys:
+        marks = ", ".join(["(%s, %s, %s)"] * len(keys))
+        params = [value for key in keys for value in key]
+        _move(uow, 'schedule_exceptions', f"(movie_id, show_date, show_time) IN ({marks})", params)
+    return len(keys)
+
+def _seat_counts_batch(uow, horizon, batch_size):
+    return uow.execute("DELETE FROM show_seat_counts WHERE show_date < %s LIMIT %s", (horizon, batch_size))
+
+def _seat_holds_batch(uow, horizon, batch_size):
+    return uow.execute("DELETE FROM seat_holds WHERE show_date < %s LIMIT %s", (horizon, batch_size))
+
+# (name, batch function); each call moves at most batch_size rows and returns how many
+TIERS = [
+    ('tickets', _tickets_batch),
+    ('schedule_rules', _rules_batch),
+    ('schedule_exceptions', _exceptions_batch),
+    ('seat_holds', _seat_holds_batch),
+    ('show_seat_counts', _seat_counts_batch),
+]
+
+# Archive everything dated before horizon (a date). Returns rows moved per
+# table and the size and duration of every batch. pause is slept between
+# batches to leave room for live traffic.
+def archive_before(horizon, batch_size=ARCHIVE_BATCH_SIZE, pause=0.0):
+    started = time.perf_counter()
+    moved = {name: 0 for name, _ in TIERS}
+    batches = []
+    for name, move_batch in TIERS:
+        while True:
+            batch_started = time.perf_counter()
+            with transaction() as uow:
+                rows = move_batch(uow, horizon, batch_size)
+            if rows:
+                moved[name] += rows
+                batches.append({'table': name, 'rows': rows, 'seconds': round(time.perf_counter() - batch_started, 4)})
+            if rows < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+    return {
+        'horizon': horizon,
+        'moved': moved,
+        'batches': batches,
+        'elapsed': round(time.perf_counter() - started, 3)
+    }
+
+def archive_old_shows(days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE, pause=0.0):
+    return archive_before(datetime.date.today() - datetime.timedelta(days=days), batch_size, pause)
+
+def main():
+    parser = argparse.ArgumentParser(description="Move past shows and tickets into the history tables.")
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS, help="archive shows older than this many days")
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=0.0, help="seconds to sleep between batches")
+    args = parser.parse_args()
+
+    report = archive_old_shows(args.days, args.batch_size, args.pause)
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+# Booking load benchmark.
+#
+# N simulated users run the same query sequence as pages/user.py, back to back:
+# catalog -> showtimes -> screen -> booked seats -> seat hold -> ticket insert.
+# Latency percentiles per step and overall throughput are printed as JSON so
+# runs can be compared across changes. Seed data first with bench/seed_data.py.
+#
+#     python bench/booking_load.py --users 50 --duration 60 --output results.json
+import argparse
+import datetime
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_utils
+from mysql.connector import Error
+from bookings import book_held_seats
+from catalog import load_catalog, get_catalog, get_showtimes, get_movie_screen
+from seat_holds import SeatUnavailable, new_hold_token, place_hold, unavailable_seats
+from seat_index import SeatOccupancyIndex, split_seats, show_key
+from seed_data import MOVIE_PREFIX, add_db_arguments, apply_db_arguments
+
+SHARED_INDEX = SeatOccupancyIndex()
+
+PHASES = ("catalog", "showtimes", "screen", "booked_seats", "hold", "ticket_insert", "booking")
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {phase: [] for phase in PHASES}
+        self.outcomes = {"booked": 0, "seat_conflict": 0, "sold_out": 0, "no_show": 0, "error": 0}
+        self._lock = threading.Lock()
+
+    def sample(self, phase, elapsed):
+        with self._lock:
+            self.samples[phase].append(elapsed)
+
+    def outcome(self, name):
+        with self._lock:
+            self.outcomes[name] += 1
+
+
+@contextmanager
+def timed(recorder, phase):
+    started = time.perf_counter()
+    yield
+    recorder.sample(phase, time.perf_counter() - started)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+
+def summarize(values):
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3),
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3)
+    }
+
+
+def simulate_booking(rng, recorder, args, customer_ids, occupancy_index):
+    today = datetime.date.today()
+    booking_started = time.perf_counter()
+
+    with timed(recorder, "catalog"):
+        movies = get_catalog() if args.use_cache else load_catalog()
+    candidates = [movie for movie in movies or []
+                  if movie["start_date"] and movie["stop_date"] and movie["stop_date"] >= today
+                  and (args.all_movies or movie["name"].startswith(MOVIE_PREFIX))]
+    if not candidates:
+        recorder.outcome("no_show")
+        return
+    movie = rng.choice(candidates)
+
+    first_day = max(movie["start_date"], today)
+    show_date = first_day + datetime.timedelta(days=rng.randint(0, (movie["stop_date"] - first_day).days))
+    with timed(recorder, "showtimes"):
+        shows = get_showtimes(movie["id"], show_date)
+    if not shows:
+        recorder.outcome("no_show")
+        return
+    show = rng.choice(shows)
+
+    with timed(recorder, "screen"):
+        screen = get_movie_screen(movie["id"])
+    if not screen:
+        recorder.outcome("no_show")
+        return
+    gold_count, standard_count = split_seats(screen[0]["number_of_seats"])
+
+    key = show_key(movie["id"], show_date, show["show_time"])
+    hold_token = new_hold_token()
+    with timed(recorder, "booked_seats"):
+        occupancy = occupancy_index.get(key, gold_count, standard_count)
+        taken = unavailable_seats(key, hold_token)
+
+    free = [seat for seat in range(1, standard_count + 1)
+            if not occupancy.is_booked("standard", seat) and ("standard", seat) not in taken]
+    seat_count = rng.randint(1, 4)
+    if len(free) < seat_count:
+        recorder.outcome("sold_out")
+        return
+    seats = sorted(rng.sample(free, seat_count))
+
+    try:
+        with timed(recorder, "hold"):
+            place_hold(key, [], seats, hold_token)
+
+        base_cost = 100 * seat_count
+        booking = {
+            "show": key, "movie_id": movie["id"], "movie_title": movie["name"],
+            "show_date": show_date, "show_time": show["show_time"], "screen_id": screen[0]["screen_id"],
+            "gold_seats": [], "standard_seats": seats,
+            "base_cost": base_cost, "gst_amount": 0.18 * base_cost, "convenience_fee": 10 * seat_count,
+            "total_cost": base_cost * 1.18 + 10 * seat_count, "payment_method": "UPI"
+        }
+        with timed(recorder, "ticket_insert"):
+            book_held_seats(booking, rng.choice(customer_ids), hold_token)
+    except SeatUnavailable:
+        recorder.outcome("seat_conflict")
+        return
+    except Error:
+        recorder.outcome("error")
+        return
+
+    recorder.sample("booking", time.perf_counter() - booking_started)
+    recorder.outcome("booked")
+
+
+def user_loop(user_number, args, recorder, customer_ids, deadline):
+    rng = random.Random(args.seed * 1000 + user_number)
+    # A shared index mirrors the app; a fresh one per booking measures the raw query
+    occupancy_index = SHARED_INDEX if args.use_cache else None
+    while time.monotonic() < deadline:
+        try:
+            simulate_booking(rng, recorder, args, customer_ids, occupancy_index or SeatOccupancyIndex(max_age=0))
+        except Error:
+            recorder.outcome("error")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the user booking flow from concurrent simulated users.")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--use-cache", action="store_true", help="use the app's catalog cache and shared seat index")
+    parser.add_argument("--all-movies", action="store_true", help="book any movie, not only seeded [bench] ones")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--pool-size", type=int, help="connection pool size (default: --users)")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    add_db_arguments(parser)
+    args = parser.parse_args()
+    apply_db_arguments(args)
+
+    # execute_query reports errors through st.error, which only logs outside a Streamlit run
+    logging.getLogger("streamlit").setLevel(logging.CRITICAL)
+    db_utils.configure_pool(pool_size=args.pool_size or args.users, max_overflow=args.users)
+
+    customer_ids = [row["customer_id"] for row in
+                    db_utils.execute_query("SELECT customer_id FROM customer WHERE first_name = 'bench' LIMIT 10000") or []]
+    if not customer_ids:
+        sys.exit("No seeded customers found; run bench/seed_data.py first.")
+
+    recorder = Recorder()
+    started_at = datetime.datetime.now().isoformat(timespec="seconds")
+    started = time.perf_counter()
+    deadline = time.monotonic() + args.duration
+    threads = [threading.Thread(target=user_loop, args=(n, args, recorder, customer_ids, deadline))
+               for n in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    report = {
+        "started_at": started_at,
+        "config": {"users": args.users, "duration": args.duration, "use_cache": args.use_cache,
+                   "database": {key: db_utils.DB_CONFIG.get(key) for key in ("host", "port", "database")}},
+        "elapsed_s": round(elapsed, 3),
+        "outcomes": recorder.outcomes,
+        "throughput_bookings_per_s": round(recorder.outcomes["booked"] / elapsed, 2),
+        "phases": {phase: summarize(values) for phase, values in recorder.samples.items()},
+        "pool": db_utils.get_pool_stats()
+    }
+    output = json.dumps(report, indent=2, default=str)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
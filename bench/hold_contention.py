@@ -0,0 +1,226 @@
+# Seat hold contention check.
+#
+# Many threads fight over a small block of seats of one show, each one holding
+# a few seats and immediately converting the hold into a ticket. Each thread
+# keeps one hold token, like a browser session, so it books the same show many
+# times. Afterwards every ticket of the show is read back and the run fails
+# (exit status 1) if any seat was sold more than once or a sold hold does not
+# point at the ticket that sold its seat. A last check holds a spare seat with
+# a short TTL and fails the run unless a second token is refused the seat
+# while the hold lives and gets it once the hold has expired.
+#
+# The show is created for the run and removed afterwards; --seeded-show uses a
+# show from bench/seed_data.py instead.
+#
+#     python bench/hold_contention.py --threads 64 --seats 24 --duration 20
+import argparse
+import collections
+import datetime
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_utils
+from mysql.connector import Error
+from bookings import book_held_seats
+from seat_holds import SeatUnavailable, new_hold_token, place_hold, release_hold
+from seat_index import show_key, split_seats
+from seed_data import MOVIE_PREFIX, add_db_arguments, apply_db_arguments
+
+
+CONTENTION_MOVIE = MOVIE_PREFIX + " Hold contention"
+CONTENTION_SCREEN = "Bench Screen hold contention"
+
+
+# A one-off show tomorrow evening on its own screen
+def create_show(number_of_seats=200):
+    show_date = datetime.date.today() + datetime.timedelta(days=1)
+    show_time = datetime.time(20, 0)
+    with db_utils.transaction() as uow:
+        screen_id = uow.insert("INSERT INTO screen (screen_name, screen_number, number_of_seats) VALUES (%s, 0, %s)",
+                               (CONTENTION_SCREEN, number_of_seats))
+        movie_id = uow.insert("INSERT INTO movie (movie_title, movie_description) VALUES (%s, 'Seat hold contention check')",
+                              (CONTENTION_MOVIE,))
+        uow.execute("INSERT INTO movie_played_on_screen (movie_id, screen_id) VALUES (%s, %s)", (movie_id, screen_id))
+        rule_id = uow.insert("INSERT INTO schedule_rules (movie_id, start_date, end_date) VALUES (%s, %s, %s)",
+                             (movie_id, show_date, show_date))
+        uow.execute("INSERT INTO schedule_rule_times (rule_id, show_time) VALUES (%s, %s)", (rule_id, show_time))
+    return {"movie_id": movie_id, "show_date": show_date, "show_time": show_time, "movie_title": CONTENTION_MOVIE,
+            "screen_id": screen_id, "number_of_seats": number_of_seats}
+
+
+def drop_show(show):
+    with db_utils.transaction() as uow:
+        uow.execute("""
+        DELETE rt FROM schedule_rule_times rt JOIN schedule_rules r ON r.rule_id = rt.rule_id
+        WHERE r.movie_id = %s
+        """, (show["movie_id"],))
+        for table in ("tickets", "ticket_seats", "seat_holds", "show_seat_counts", "daily_sales",
+                      "schedule_rules", "movie_played_on_screen", "movie"):
+            uow.execute(f"DELETE FROM {table} WHERE movie_id = %s", (show["movie_id"],))
+        uow.execute("DELETE FROM screen WHERE screen_id = %s", (show["screen_id"],))
+
+
+def pick_show():
+    rows = db_utils.execute_query("""
+    SELECT r.movie_id, r.end_date as show_date, rt.show_time, m.movie_title, mps.screen_id, sc.number_of_seats
+    FROM schedule_rules r
+    JOIN schedule_rule_times rt ON rt.rule_id = r.rule_id
+    JOIN movie m ON m.movie_id = r.movie_id
+    JOIN movie_played_on_screen mps ON mps.movie_id = r.movie_id
+    JOIN screen sc ON sc.screen_id = mps.screen_id
+    WHERE m.movie_title LIKE %s AND r.end_date > %s
+    ORDER BY r.end_date DESC
+    LIMIT 1
+    """, (MOVIE_PREFIX + "%", datetime.date.today()))
+    if not rows:
+        sys.exit("No future [bench] show found; run bench/seed_data.py first.")
+    return rows[0]
+
+
+def booked_seat_counts(show):
+    counts = collections.Counter()
+    rows = db_utils.execute_query("""
+    SELECT standard_seats FROM tickets
+    WHERE movie_id = %s AND show_date = %s AND show_time = %s AND standard_seats IS NOT NULL
+    """, (show["movie_id"], show["show_date"], show["show_time"]), primary=True)
+    for row in rows or []:
+        counts.update(int(seat) for seat in row["standard_seats"].split(","))
+    return counts
+
+
+# Sold holds whose ticket_id is not the ticket that holds the seat in ticket_seats
+def mismatched_holds(show):
+    rows = db_utils.execute_query("""
+    SELECT h.seat_class, h.seat_number, h.ticket_id as hold_ticket, ts.ticket_id as sold_ticket
+    FROM seat_holds h
+    LEFT JOIN ticket_seats ts ON ts.movie_id = h.movie_id AND ts.show_date = h.show_date
+        AND ts.show_time = h.show_time AND ts.seat_class = h.seat_class AND ts.seat_number = h.seat_number
+    WHERE h.movie_id = %s AND h.show_date = %s AND h.show_time = %s AND h.expires_at IS NULL
+      AND (ts.ticket_id IS NULL OR ts.ticket_id <> h.ticket_id)
+    """, (show["movie_id"], show["show_date"], show["show_time"]), primary=True)
+    return [f"{row['seat_class']} {row['seat_number']}: hold {row['hold_ticket']}, sold {row['sold_ticket']}"
+            for row in rows or []]
+
+
+# Hold a seat for ttl seconds with one token and try it with another while the
+# hold lives and after it has expired. Returns what went wrong, if anything.
+def expired_hold_takeover(show, seat, ttl):
+    key = show_key(show["movie_id"], show["show_date"], show["show_time"])
+    first, second = new_hold_token(), new_hold_token()
+    problems = []
+    place_hold(key, [], [seat], first, ttl=ttl)
+    try:
+        try:
+            place_hold(key, [], [seat], second)
+            problems.append(f"seat {seat} was held by a second token while the first hold was live")
+        except SeatUnavailable:
+            pass
+        # NOW() has whole-second precision, so wait a second past the expiry
+        time.sleep(ttl + 1.5)
+        try:
+            place_hold(key, [], [seat], second)
+        except SeatUnavailable:
+            problems.append(f"seat {seat} stayed blocked after its hold expired")
+    finally:
+        release_hold(key, first)
+        release_hold(key, second)
+    return problems
+
+
+def worker(number, args, show, customer_id, seat_block, deadline, outcomes, lock):
+    rng = random.Random(args.seed * 1000 + number)
+    key = show_key(show["movie_id"], show["show_date"], show["show_time"])
+    hold_token = new_hold_token()
+    while time.monotonic() < deadline:
+        seats = sorted(rng.sample(seat_block, rng.randint(1, 3)))
+        try:
+            place_hold(key, [], seats, hold_token)
+            booking = {
+                "show": key, "movie_id": show["movie_id"], "movie_title": show["movie_title"],
+                "show_date": show["show_date"], "show_time": show["show_time"], "screen_id": show["screen_id"],
+                "gold_seats": [], "standard_seats": seats, "base_cost": 0, "gst_amount": 0,
+                "convenience_fee": 0, "total_cost": 0, "payment_method": "UPI"
+            }
+            book_held_seats(booking, customer_id, hold_token)
+            outcome = "booked"
+        except SeatUnavailable:
+            outcome = "conflict"
+        except Error:
+            outcome = "error"
+        with lock:
+            outcomes[outcome] += 1
+
+
+def contend(args, show):
+    customer = db_utils.execute_query("SELECT customer_id FROM customer WHERE first_name = 'bench' LIMIT 1")
+    customer_id = customer[0]["customer_id"] if customer else None
+    already_booked = booked_seat_counts(show)
+    # Contest seats nobody has bought yet so every sale happens during this run
+    _, standard_count = split_seats(show["number_of_seats"])
+    free_seats = [seat for seat in range(1, standard_count + 1) if seat not in already_booked]
+    seat_block, spare_seats = free_seats[:args.seats], free_seats[args.seats:]
+    if len(seat_block) < 3 or not spare_seats:
+        sys.exit("The chosen show has too few free standard seats left.")
+
+    outcomes = collections.Counter()
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+    threads = [threading.Thread(target=worker, args=(n, args, show, customer_id, seat_block, deadline, outcomes, lock))
+               for n in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    counts = booked_seat_counts(show)
+    overlaps = {seat: count for seat, count in counts.items() if count > 1}
+    mismatches = mismatched_holds(show)
+    expiry_problems = expired_hold_takeover(show, spare_seats[0], args.hold_ttl)
+    return {
+        "show": {key: show[key] for key in ("movie_id", "show_date", "show_time")},
+        "threads": args.threads,
+        "contested_seats": len(seat_block),
+        "outcomes": dict(outcomes),
+        "contested_seats_sold": sum(1 for seat in seat_block if counts.get(seat)),
+        "double_booked_seats": overlaps,
+        "mismatched_holds": mismatches,
+        "expired_hold_problems": expiry_problems,
+        "passed": not overlaps and not mismatches and not expiry_problems
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hammer one show's seats from many threads and check for double booking.")
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--seats", type=int, default=24, help="size of the contested seat block")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--hold-ttl", type=int, default=2, help="seconds the expiry check holds its seat for")
+    parser.add_argument("--seeded-show", action="store_true",
+                        help="contest a show from bench/seed_data.py instead of creating one")
+    add_db_arguments(parser)
+    args = parser.parse_args()
+    apply_db_arguments(args)
+
+    logging.getLogger("streamlit").setLevel(logging.CRITICAL)
+    db_utils.configure_pool(pool_size=args.threads, max_overflow=0)
+
+    show = pick_show() if args.seeded_show else create_show()
+    try:
+        report = contend(args, show)
+    finally:
+        if not args.seeded_show:
+            drop_show(show)
+    print(json.dumps(report, indent=2, default=str))
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+# Seed the database with synthetic MTBS data for load benchmarks.
+#
+# All generated rows are tagged (movie titles start with "[bench]", customers are
+# named "bench", usernames start with "bench_user_", ticket ids with "BENCH-") so
+# --reset removes exactly what a previous run created.
+#
+#     python bench/seed_data.py --movies 500 --screens 50 --customers 20000 --tickets 1000000
+import argparse
+import collections
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_utils
+import rollups
+from db_utils import pooled_connection, bulk_insert, timed_execute
+from seat_index import split_seats
+
+MOVIE_PREFIX = "[bench]"
+SHOW_TIMES = [datetime.time(10, 0), datetime.time(13, 0), datetime.time(16, 0),
+              datetime.time(19, 0), datetime.time(22, 0)]
+
+
+def add_db_arguments(parser):
+    parser.add_argument("--host", help="database host (default from db_utils.DB_CONFIG)")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--user")
+    parser.add_argument("--password")
+    parser.add_argument("--database")
+    parser.add_argument("--replica", action="append", metavar="HOST:PORT",
+                        help="read replica for execute_query reads; repeat for several")
+
+
+def apply_db_arguments(args):
+    for option in ("host", "port", "user", "password", "database"):
+        value = getattr(args, option)
+        if value is not None:
+            db_utils.DB_CONFIG[option] = value
+    replicas = []
+    for replica in getattr(args, "replica", None) or []:
+        host, _, port = replica.partition(":")
+        replicas.append({"host": host or "localhost", "port": int(port or 3306)})
+    if replicas:
+        db_utils.configure_replicas(*replicas)
+
+
+def run(cursor, query, params=None):
+    return timed_execute(cursor, query, params, label="bench.seed")
+
+
+def fetch(cursor, query, params=None):
+    return timed_execute(cursor, query, params, label="bench.seed", fetch=True)
+
+
+def reset(connection):
+    cursor = connection.cursor()
+    try:
+        movie_ids = [row[0] for row in fetch(cursor, "SELECT movie_id FROM movie WHERE movie_title LIKE %s",
+                                             (MOVIE_PREFIX + "%",))]
+        customer_ids = [row[0] for row in fetch(cursor, "SELECT customer_id FROM customer WHERE first_name = 'bench'")]
+        for table in ("tickets", "tickets_history"):
+            run(cursor, f"DELETE FROM {table} WHERE ticket_id LIKE 'BENCH-%%' OR movie_title LIKE %s", (MOVIE_PREFIX + "%",))
+        for start in range(0, len(movie_ids), 500):
+            chunk = movie_ids[start:start + 500]
+            marks = ", ".join(["%s"] * len(chunk))
+            for suffix in ("", "_history"):
+                run(cursor, f"""
+                DELETE rt FROM schedule_rule_times{suffix} rt JOIN schedule_rules{suffix} r ON r.rule_id = rt.rule_id
+                WHERE r.movie_id IN ({marks})
+                """, chunk)
+            for table in ("seat_holds", "ticket_seats", "ticket_seats_history", "show_seat_counts", "daily_sales", "schedule_exceptions",
+                          "schedule_exceptions_history", "schedule_rules", "schedule_rules_history",
+                          "movie_played_on_schedule", "schedule", "movie_played_on_screen", "movie"):
+                run(cursor, f"DELETE FROM {table} WHERE movie_id IN ({marks})", chunk)
+        for start in range(0, len(customer_ids), 500):
+            chunk = customer_ids[start:start + 500]
+            marks = ", ".join(["%s"] * len(chunk))
+            for table in ("users", "customer_cpy", "customer"):
+                run(cursor, f"DELETE FROM {table} WHERE customer_id IN ({marks})", chunk)
+        run(cursor, "DELETE FROM screen WHERE screen_name LIKE 'Bench Screen %'")
+    finally:
+        cursor.close()
+
+
+def seed(connection, args):
+    rng = random.Random(args.seed)
+    cursor = connection.cursor()
+    counts = {}
+    try:
+        web = fetch(cursor, "SELECT web_id FROM website LIMIT 1")
+        web_id = web[0][0] if web else None
+
+        counts["screen"] = bulk_insert(
+            cursor, "INSERT INTO screen (screen_name, screen_number, number_of_seats)",
+            [(f"Bench Screen {n}", n, rng.choice([80, 120, 200, 300, 500])) for n in range(1, args.screens + 1)],
+            batch_size=args.batch_size, label="bench.seed")
+        screens = fetch(cursor, "SELECT screen_id, number_of_seats FROM screen WHERE screen_name LIKE 'Bench Screen %' ORDER BY screen_id")
+
+        counts["movie"] = bulk_insert(
+            cursor, "INSERT INTO movie (movie_title, movie_description, poster_url, customer_id, web_id)",
+            [(f"{MOVIE_PREFIX} Movie {n}", f"Synthetic movie {n}", None, None, web_id) for n in range(1, args.movies + 1)],
+            batch_size=args.batch_size, label="bench.seed")
+        movie_ids = [row[0] for row in fetch(cursor, "SELECT movie_id FROM movie WHERE movie_title LIKE %s ORDER BY movie_id",
+                                             (MOVIE_PREFIX + "%",))]
+
+        # Each movie plays on one screen with shows_per_day show times
+        movie_screens = {movie_id: screens[i % len(screens)] for i, movie_id in enumerate(movie_ids)}
+        counts["movie_played_on_screen"] = bulk_insert(
+            cursor, "INSERT INTO movie_played_on_screen (movie_id, screen_id)",
+            [(movie_id, screen[0]) for movie_id, screen in movie_screens.items()],
+            batch_size=args.batch_size, label="bench.seed")
+
+        show_times = SHOW_TIMES[:args.shows_per_day]
+        today = datetime.date.today()
+        dates = [today + datetime.timedelta(days=offset) for offset in range(-args.past_days, args.future_days + 1)]
+        shows = [(movie_id, show_date, show_time) for movie_id in movie_ids for show_date in dates for show_time in show_times]
+        # One rule per movie covering the whole run
+        counts["schedule_rules"] = bulk_insert(
+            cursor, "INSERT INTO schedule_rules (movie_id, start_date, end_date)",
+            [(movie_id, dates[0], dates[-1]) for movie_id in movie_ids],
+            batch_size=args.batch_size, label="bench.seed")
+        rule_ids = [row[0] for row in fetch(cursor, """
+        SELECT r.rule_id FROM schedule_rules r JOIN movie m ON m.movie_id = r.movie_id
+        WHERE m.movie_title LIKE %s
+        """, (MOVIE_PREFIX + "%",))]
+        counts["schedule_rule_times"] = bulk_insert(
+            cursor, "INSERT INTO schedule_rule_times (rule_id, show_time)",
+            [(rule_id, show_time) for rule_id in rule_ids for show_time in show_times],
+            batch_size=args.batch_size, label="bench.seed")
+        counts["movie_played_on_schedule"] = bulk_insert(
+            cursor, "INSERT IGNORE INTO movie_played_on_schedule (show_time, movie_id)",
+            [(show_time, movie_id) for movie_id in movie_ids for show_time in show_times],
+            batch_size=args.batch_size, label="bench.seed")
+        connection.commit()
+
+        counts["customer"] = bulk_insert(
+            cursor, "INSERT INTO customer (first_name, last_name, customer_contact)",
+            [("bench", f"customer{n}", f"bench{n}@example.com") for n in range(1, args.customers + 1)],
+            batch_size=args.batch_size, label="bench.seed")
+        customer_ids = [row[0] for row in fetch(cursor, "SELECT customer_id FROM customer WHERE first_name = 'bench' ORDER BY customer_id")]
+        counts["customer_cpy"] = bulk_insert(
+            cursor, "INSERT INTO customer_cpy (customer_id, customer_contact)",
+            [(customer_id, f"9{customer_id:09d}") for customer_id in customer_ids],
+            batch_size=args.batch_size, label="bench.seed")
+        counts["users"] = bulk_insert(
+            cursor, "INSERT INTO users (username, email, password, customer_id, created_at)",
+            [(f"bench_user_{customer_id}", f"bench{customer_id}@example.com", "bench", customer_id, datetime.datetime.now())
+             for customer_id in customer_ids],
+            batch_size=args.batch_size, label="bench.seed")
+        connection.commit()
+
+        counts["tickets"] = seed_tickets(connection, cursor, rng, args, shows, movie_screens, customer_ids)
+    finally:
+        cursor.close()
+    return counts
+
+
+# Tickets are generated and written one batch at a time so memory stays flat.
+# Seats are handed out in order per show so no two tickets overlap.
+def seed_tickets(connection, cursor, rng, args, shows, movie_screens, customer_ids):
+    next_seat = {}
+    written = 0
+    batch = []
+    attempts = 0
+    while written + len(batch) < args.tickets and attempts < args.tickets * 3:
+        attempts += 1
+        movie_id, show_date, show_time = shows[rng.randrange(len(shows))]
+        screen_id, capacity = movie_screens[movie_id]
+        gold_capacity, standard_capacity = split_seats(capacity)
+        next_gold, next_standard = next_seat.get((movie_id, show_date, show_time), (1, 1))
+
+        seat_count = rng.randint(1, 4)
+        if rng.random() < 0.3 and next_gold + seat_count - 1 <= gold_capacity:
+            gold = list(range(next_gold, next_gold + seat_count))
+            standard = []
+            next_gold += seat_count
+        elif next_standard + seat_count - 1 <= standard_capacity:
+            gold = []
+            standard = list(range(next_standard, next_standard + seat_count))
+            next_standard += seat_count
+        else:
+            continue  # show sold out
+        next_seat[(movie_id, show_date, show_time)] = (next_gold, next_standard)
+
+        base_cost = 150 * len(gold) + 100 * len(standard)
+        gst_amount = 0.18 * base_cost
+        convenience_fee = 10 * seat_count
+        batch.append((
+            f"BENCH-{written + len(batch) + 1:09d}", show_time, show_date, screen_id,
+            base_cost + gst_amount + convenience_fee, base_cost, gst_amount, convenience_fee, "UPI",
+            ",".join(map(str, gold)) or None, ",".join(map(str, standard)) or None,
+            movie_id, f"{MOVIE_PREFIX} Movie", rng.choice(customer_ids)
+        ))
+        if len(batch) >= args.batch_size:
+            written += flush_tickets(connection, cursor, batch, args.batch_size)
+            batch = []
+    if batch:
+        written += flush_tickets(connection, cursor, batch, args.batch_size)
+    return written
+
+
+def flush_tickets(connection, cursor, batch, batch_size):
+    written = bulk_insert(
+        cursor,
+        "INSERT INTO tickets (ticket_id, show_time, show_date, screen_id, cost, base_cost, gst_amount, "
+        "convenience_fee, payment_method, gold_seats, standard_seats, movie_id, movie_title, customer_id)",
+        batch, batch_size=batch_size, label="bench.seed")
+    seat_rows = [(movie_id, show_date, show_time, seat_class, int(seat), ticket_id)
+                 for ticket_id, show_time, show_date, *_, gold, standard, movie_id, _, _ in batch
+                 for seat_class, seats in (("gold", gold), ("standard", standard)) if seats
+                 for seat in seats.split(",")]
+    bulk_insert(
+        cursor,
+        "INSERT INTO ticket_seats (movie_id, show_date, show_time, seat_class, seat_number, ticket_id)",
+        seat_rows, batch_size=batch_size, label="bench.seed")
+    sold = collections.Counter()
+    for movie_id, show_date, show_time, seat_class, _, _ in seat_rows:
+        sold[(movie_id, show_date, show_time, seat_class)] += 1
+    bulk_insert(
+        cursor,
+        "INSERT INTO show_seat_counts (movie_id, show_date, show_time, gold_booked, standard_booked)",
+        [(movie_id, show_date, show_time, sold[(movie_id, show_date, show_time, "gold")],
+          sold[(movie_id, show_date, show_time, "standard")])
+         for movie_id, show_date, show_time in {key[:3] for key in sold}],
+        batch_size=batch_size,
+        suffix="ON DUPLICATE KEY UPDATE gold_booked = gold_booked + VALUES(gold_booked), "
+               "standard_booked = standard_booked + VALUES(standard_booked)",
+        label="bench.seed")
+    connection.commit()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed synthetic MTBS data for load benchmarks.")
+    parser.add_argument("--movies", type=int, default=500)
+    parser.add_argument("--screens", type=int, default=50)
+    parser.add_argument("--shows-per-day", type=int, default=3, choices=range(1, len(SHOW_TIMES) + 1))
+    parser.add_argument("--past-days", type=int, default=30)
+    parser.add_argument("--future-days", type=int, default=30)
+    parser.add_argument("--customers", type=int, default=20000)
+    parser.add_argument("--tickets", type=int, default=1000000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="delete rows from a previous seed run first")
+    add_db_arguments(parser)
+    args = parser.parse_args()
+    apply_db_arguments(args)
+
+    started = time.perf_counter()
+    with pooled_connection() as connection:
+        connection.autocommit = False
+        try:
+            if args.reset:
+                reset(connection)
+                connection.commit()
+            counts = seed(connection, args)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.autocommit = True
+
+    # Tickets were written directly, so the sales rollup is rebuilt from them
+    counts["daily_sales"] = rollups.rebuild()["rows"]
+
+    elapsed = time.perf_counter() - started
+    for table, count in counts.items():
+        print(f"{table:28s} {count:>10,d}")
+    print(f"seeded in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
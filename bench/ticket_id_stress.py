@@ -0,0 +1,117 @@
+# Ticket id uniqueness stress test.
+#
+# Many processes, each with several threads, generate ticket ids as fast as
+# they can with ticket_ids.new_ticket_id(). Every id is collected and the run
+# fails (exit status 1) if any id appears twice, if a thread ever got an id
+# that does not sort after its previous one, if an id does not parse back or
+# if two processes (including forked children) share an instance id.
+# --nodes spreads the processes over that many node ids to mimic several
+# machines. No database is needed.
+#
+#     python bench/ticket_id_stress.py --processes 8 --threads 4 --ids 500000
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ticket_ids
+
+
+def generate(count):
+    ids = [None] * count
+    for n in range(count):
+        ids[n] = ticket_ids.new_ticket_id()
+    return ids
+
+# One process: generate ids from several threads, return them packed as
+# (high, low) 64-bit halves plus what the process saw
+def worker(task):
+    process_number, node_id, threads, count = task
+    if node_id is not None:
+        ticket_ids.configure_ticket_ids(node_id)
+    per_thread = [count // threads + (1 if n < count % threads else 0) for n in range(threads)]
+    results = [None] * threads
+
+    def run(n):
+        results[n] = generate(per_thread[n])
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=run, args=(n,)) for n in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    out_of_order = sum(1 for ids in results for previous, current in zip(ids, ids[1:]) if current <= previous)
+    values = np.empty((count, 2), dtype=np.uint64)
+    row = 0
+    for ids in results:
+        for ticket_id in ids:
+            value = ticket_ids.parse_ticket_id(ticket_id)
+            values[row] = (value >> 64, value & 0xFFFFFFFFFFFFFFFF)
+            row += 1
+    return {
+        'process': process_number,
+        'instance_id': ticket_ids.describe_ticket_id(results[0][0])['instance_id'] if results[0] else None,
+        'elapsed': elapsed,
+        'out_of_order': out_of_order,
+        'sample': results[0][:1],
+        'values': values
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate ticket ids from many processes and check for duplicates.")
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=4, help="threads per process")
+    parser.add_argument("--ids", type=int, default=500000, help="ids per process")
+    parser.add_argument("--nodes", type=int, default=0,
+                        help="node ids to spread the processes over (default: none, random instance ids only)")
+    parser.add_argument("--start-method", choices=multiprocessing.get_all_start_methods(),
+                        default="fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+    args = parser.parse_args()
+
+    # Use the generator before forking so the children must not inherit its state
+    parent_id = ticket_ids.new_ticket_id()
+    tasks = [(n, n % args.nodes if args.nodes else None, args.threads, args.ids) for n in range(args.processes)]
+    started = time.perf_counter()
+    with multiprocessing.get_context(args.start_method).Pool(args.processes) as pool:
+        results = pool.map(worker, tasks)
+    elapsed = time.perf_counter() - started
+
+    values = np.concatenate([result['values'] for result in results]
+                            + [np.array([[ticket_ids.parse_ticket_id(parent_id) >> 64,
+                                          ticket_ids.parse_ticket_id(parent_id) & 0xFFFFFFFFFFFFFFFF]],
+                                        dtype=np.uint64)])
+    unique = np.unique(values, axis=0)
+    duplicates = len(values) - len(unique)
+    out_of_order = sum(result['out_of_order'] for result in results)
+    # Every worker, forked or not, must have drawn its own instance id
+    instances = {result['instance_id'] for result in results} | {ticket_ids.describe_ticket_id(parent_id)['instance_id']}
+    report = {
+        "processes": args.processes,
+        "threads_per_process": args.threads,
+        "nodes": args.nodes or None,
+        "ids": len(values),
+        "duplicates": duplicates,
+        "out_of_order": out_of_order,
+        "distinct_instances": len(instances),
+        "ids_per_second_per_process": round(args.ids / max(max(result['elapsed'] for result in results), 1e-9)),
+        "elapsed": round(elapsed, 2),
+        "sample": [parent_id] + [result['sample'][0] for result in results[:3] if result['sample']],
+        "passed": duplicates == 0 and out_of_order == 0 and len(instances) == args.processes + 1
+    }
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import datetime
+
+from db_utils import execute_query
+from pricing import note_seats_sold
+from rollups import record_sale
+from seat_holds import confirm_hold
+from seat_index import mark_seats_booked
+from ticket_ids import new_ticket_id
+
+TICKET_INSERT_QUERY = """
+INSERT INTO tickets
+(ticket_id, show_time, show_date, screen_id, cost, base_cost, gst_amount, convenience_fee,
+payment_method, gold_seats, standard_seats, movie_id, movie_title, customer_id)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+# Tickets shown per page in My Tickets
+MY_TICKETS_PAGE_SIZE = 10
+
+# (tickets table, seats table) of the live and the archived tier
+TICKET_TIERS = [("tickets", "ticket_seats"), ("tickets_history", "ticket_seats_history")]
+
+# Write the ticket for a paid booking by converting the session's seat holds.
+# booking carries the show key, seats and price breakdown captured at checkout.
+# Returns the ticket id; raises SeatUnavailable if the holds were lost.
+def book_held_seats(booking, customer_id, hold_token):
+    ticket_id = new_ticket_id()
+
+    # Save tickets to database
+    gold_seats_str = ','.join(str(seat) for seat in booking["gold_seats"])
+    standard_seats_str = ','.join(str(seat) for seat in booking["standard_seats"])
+
+    ticket_params = (
+        ticket_id,
+        booking["show_time"],
+        booking["show_date"],
+        booking["screen_id"],
+        booking["total_cost"],
+        booking["base_cost"],
+        booking["gst_amount"],
+        booking["convenience_fee"],
+        booking["payment_method"],
+        gold_seats_str if gold_seats_str else None,
+        standard_seats_str if standard_seats_str else None,
+        booking["movie_id"],
+        booking["movie_title"],
+        customer_id
+    )
+
+    # Convert the seat holds into the ticket atomically
+    confirm_hold(
+        booking["show"],
+        booking["gold_seats"],
+        booking["standard_seats"],
+        hold_token,
+        ticket_id,
+        TICKET_INSERT_QUERY,
+        ticket_params,
+        # Sales rollups are updated in the booking transaction
+        on_confirm=lambda uow, first_sale: record_sale(uow, booking, first_sale)
+    )
+    mark_seats_booked(booking["show"], booking["gold_seats"], booking["standard_seats"])
+    note_seats_sold(booking["show"], len(booking["gold_seats"]), len(booking["standard_seats"]))
+    return ticket_id
+
+# One page of a customer's tickets, keyset-paginated on
+# (show_date, show_time, ticket_id). Upcoming tickets (shows that have not
+# started yet) come soonest first and are all in the live table; past ones
+# (shows that have started) come most recent first from both the live and
+# the history table. after is the key of the last ticket of the previous page
+# (None for the first page).
+# Returns (tickets, next_key); next_key is None on the last page and tickets
+# is None if a query failed.
+def get_customer_tickets(customer_id, upcoming=True, after=None, page_size=MY_TICKETS_PAGE_SIZE):
+    tickets_query, params = customer_tickets_query(customer_id, upcoming, after, page_size)
+    tickets = execute_query(tickets_query, params)
+    if tickets is None:
+        return None, None
+    next_key = None
+    if len(tickets) > page_size:
+        tickets = tickets[:page_size]
+        last = tickets[-1]
+        next_key = (last["show_date"], last["show_time"], last["ticket_id"])
+    if not tickets:
+        return tickets, None
+
+    # Seats of just this page's tickets
+    tiers = _customer_ticket_tiers(upcoming)
+    marks = ", ".join(["%s"] * len(tickets))
+    ticket_ids = [ticket["ticket_id"] for ticket in tickets]
+    seats_query = " UNION ALL ".join(
+        f"SELECT ticket_id, seat_class, seat_number FROM {seats_table} WHERE ticket_id IN ({marks})"
+        for _, seats_table in tiers
+    ) + " ORDER BY seat_number"
+    seats = execute_query(seats_query, ticket_ids * len(tiers)) or []
+
+    seats_by_ticket = {}
+    for seat in seats:
+        seats_by_ticket.setdefault((seat["ticket_id"], seat["seat_class"]), []).append(str(seat["seat_number"]))
+    for ticket in tickets:
+        ticket["gold_seats"] = ",".join(seats_by_ticket.get((ticket["ticket_id"], "gold"), [])) or None
+        ticket["standard_seats"] = ",".join(seats_by_ticket.get((ticket["ticket_id"], "standard"), [])) or None
+    return tickets, next_key
+
+# Upcoming tickets are all in the live table; past ones may also be archived
+def _customer_ticket_tiers(upcoming):
+    return [TICKET_TIERS[0]] if upcoming else TICKET_TIERS
+
+# The query behind one page of get_customer_tickets and its parameters
+def customer_tickets_query(customer_id, upcoming=True, after=None, page_size=MY_TICKETS_PAGE_SIZE):
+    # A show starting later today is still upcoming, one that started is past
+    if upcoming:
+        now_filter, op, order = "(show_date > %s OR (show_date = %s AND show_time >= %s))", ">", "ASC"
+    else:
+        now_filter, op, order = "(show_date < %s OR (show_date = %s AND show_time < %s))", "<", "DESC"
+    now = datetime.datetime.now()
+
+    # Each tier returns at most one page in index order; the outer query merges them
+    parts = []
+    params = []
+    for tickets_table, _ in _customer_ticket_tiers(upcoming):
+        query = f"""
+        (SELECT ticket_id, movie_title, show_date, show_time,
+                TIME_FORMAT(show_time, '%h:%i %p') as formatted_time, cost
+         FROM {tickets_table}
+         WHERE customer_id = %s AND {now_filter}"""
+        params += [customer_id, now.date(), now.date(), now.time().replace(microsecond=0)]
+        if after is not None:
+            after_date, after_time, after_ticket = after
+            query += f"""
+           AND (show_date {op} %s OR (show_date = %s AND (show_time {op} %s OR (show_time = %s AND ticket_id {op} %s))))"""
+            params += [after_date, after_date, after_time, after_time, after_ticket]
+        query += f"""
+         ORDER BY show_date {order}, show_time {order}, ticket_id {order}
+         LIMIT %s)"""
+        params.append(page_size + 1)
+        parts.append(query)
+    tickets_query = " UNION ALL ".join(parts) + f"""
+    ORDER BY show_date {order}, show_time {order}, ticket_id {order}
+    LIMIT %s
+    """
+    params.append(page_size + 1)
+    return tickets_query, params
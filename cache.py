@@ -0,0 +1,62 @@
+import threading
+import time
+
+
+# Small process-wide cache with a per-entry TTL. Concurrent misses for the same
+# key wait for a single load instead of all hitting the database.
+class TTLCache:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}  # key -> (value, loaded_at)
+        self._loading = {}  # key -> lock held while that key is loaded
+        self._generation = 0  # bumped on invalidation so in-flight loads aren't stored
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _fresh(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[1] <= self.ttl:
+            return entry
+        return None
+
+    def get(self, key, loader):
+        with self._lock:
+            entry = self._fresh(key)
+            if entry is not None:
+                self._stats['hits'] += 1
+                return entry[0]
+            self._stats['misses'] += 1
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                entry = self._fresh(key)
+                generation = self._generation
+            if entry is not None:
+                return entry[0]
+
+            value = loader()
+            # Failed loads (None) are not cached so the next rerun retries
+            if value is not None:
+                with self._lock:
+                    if generation == self._generation:
+                        self._entries[key] = (value, time.monotonic())
+            return value
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+            self._generation += 1
+            self._stats['invalidations'] += 1
+
+    # Hit/miss counters plus the age in seconds of every cached snapshot
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            stats = dict(self._stats)
+            stats['ttl'] = self.ttl
+            stats['entries'] = {key: round(now - loaded_at, 1) for key, (_, loaded_at) in self._entries.items()}
+        return stats
@@ -0,0 +1,212 @@
+import datetime
+import time
+
+from cache import TTLCache
+from db_utils import READ_YOUR_WRITES_SECONDS, execute_query
+
+# How long the processed movie list is served before it is rebuilt
+CATALOG_TTL = 60
+
+_catalog_cache = TTLCache(CATALOG_TTL)
+_invalidated_at = None
+
+# Run the catalog query and build the movie list, bypassing the cache
+def load_catalog():
+    # Fetch movies from database with their schedule
+    movies_query = """
+    SELECT m.movie_id, m.movie_title, m.movie_description, m.poster_url,
+        runs.start_date, runs.stop_date, runs.show_times,
+        sc.screen_name, sc.screen_number
+    FROM movie m
+    LEFT JOIN (
+        SELECT shows.movie_id, MIN(shows.start_date) as start_date, MAX(shows.end_date) as stop_date,
+            GROUP_CONCAT(DISTINCT TIME_FORMAT(shows.show_time, '%h:%i %p') ORDER BY shows.show_time SEPARATOR ',') as show_times
+        FROM (
+            SELECT r.movie_id, r.start_date, r.end_date, rt.show_time
+            FROM schedule_rules r
+            JOIN schedule_rule_times rt ON rt.rule_id = r.rule_id
+            UNION ALL
+            SELECT movie_id, show_date, show_date, show_time
+            FROM schedule_exceptions
+            WHERE action = 'add'
+        ) shows
+        GROUP BY shows.movie_id
+    ) runs ON runs.movie_id = m.movie_id
+    LEFT JOIN movie_played_on_screen mps ON m.movie_id = mps.movie_id
+    LEFT JOIN screen sc ON mps.screen_id = sc.screen_id
+    """
+
+    # Right after an admin change a replica may not have it yet, and whatever
+    # is loaded now is served for CATALOG_TTL, so read the primary
+    recently_changed = _invalidated_at is not None and time.monotonic() - _invalidated_at < READ_YOUR_WRITES_SECONDS
+    movie_data = execute_query(movies_query, primary=recently_changed)
+    if movie_data is None:
+        return None
+
+    # Process movie data
+    movies = []
+    for movie in movie_data:
+        # Format show times
+        show_times = movie['show_times'].split(',') if movie['show_times'] else []
+
+        # Create details string
+        screen_info = f"{movie['screen_name']} (Screen {movie['screen_number']})" if movie['screen_name'] else "Standard Screen"
+
+        movies.append({
+            "id": movie['movie_id'],
+            "name": movie['movie_title'],
+            "details": screen_info,
+            "shows": show_times,
+            "start_date": movie['start_date'],
+            "stop_date": movie['stop_date'],
+            "description": movie['movie_description'],
+            "poster_url": movie['poster_url']
+        })
+    return movies
+
+# Processed movie list shared by every session; None if the query failed
+def get_catalog():
+    return _catalog_cache.get('movies', load_catalog)
+
+# Call after any write to movie, schedule or movie_played_on_screen
+def invalidate_catalog():
+    global _invalidated_at
+    _invalidated_at = time.monotonic()
+    _catalog_cache.invalidate()
+
+def catalog_cache_stats():
+    return _catalog_cache.stats()
+
+# Shows of a movie on one date: the times of every rule covering the date plus
+# added shows, minus cancelled ones. Reads a handful of rule rows, never a
+# row per show.
+SHOWTIMES_QUERY = """
+SELECT TIME_FORMAT(shows.show_time, '%h:%i %p') as formatted_time, shows.show_time
+FROM (
+    SELECT rt.show_time
+    FROM schedule_rules r
+    JOIN schedule_rule_times rt ON rt.rule_id = r.rule_id
+    WHERE r.movie_id = %(movie_id)s AND r.start_date <= %(show_date)s AND r.end_date >= %(show_date)s
+    UNION
+    SELECT show_time
+    FROM schedule_exceptions
+    WHERE movie_id = %(movie_id)s AND show_date = %(show_date)s AND action = 'add'
+) shows
+WHERE shows.show_time NOT IN (
+    SELECT show_time
+    FROM schedule_exceptions
+    WHERE movie_id = %(movie_id)s AND show_date = %(show_date)s AND action = 'cancel'
+)
+ORDER BY shows.show_time
+"""
+
+# Show times of a movie on one date, as formatted_time / show_time rows
+def get_showtimes(movie_id, show_date):
+    return execute_query(SHOWTIMES_QUERY, {'movie_id': movie_id, 'show_date': show_date})
+
+MOVIE_SCREEN_QUERY = """
+SELECT sc.screen_id, sc.screen_name, sc.number_of_seats
+FROM screen sc
+JOIN movie_played_on_screen mps ON sc.screen_id = mps.screen_id
+WHERE mps.movie_id = %s
+LIMIT 1
+"""
+
+# Screen a movie plays on, as a one-row list (or empty / None)
+def get_movie_screen(movie_id):
+    return execute_query(MOVIE_SCREEN_QUERY, (movie_id,))
+
+# Movies shown per page in the admin Movie List
+MOVIE_LIST_PAGE_SIZE = 20
+
+# TIME columns come back as timedelta; format like TIME_FORMAT(..., '%h:%i %p')
+def _format_show_time(show_time):
+    if isinstance(show_time, datetime.timedelta):
+        show_time = (datetime.datetime.min + show_time).time()
+    return show_time.strftime('%I:%M %p')
+
+def _like_pattern(text):
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+# One page of movies with a compact run summary each: first and last show date,
+# distinct show times, screens and number of shows. Keyset-paginated on
+# (movie_title, movie_id); after is that key of the previous page's last movie.
+# Returns (movies, next_key); movies is None if a query failed.
+def get_movie_summaries(title_filter="", after=None, page_size=MOVIE_LIST_PAGE_SIZE):
+    movies_query = """
+    SELECT movie_id, movie_title, movie_description
+    FROM movie
+    WHERE movie_title LIKE %s
+    """
+    params = [_like_pattern(title_filter.strip())]
+    if after is not None:
+        movies_query += " AND (movie_title > %s OR (movie_title = %s AND movie_id > %s))"
+        params += [after[0], after[0], after[1]]
+    movies_query += " ORDER BY movie_title, movie_id LIMIT %s"
+    params.append(page_size + 1)
+
+    movies = execute_query(movies_query, params)
+    if movies is None:
+        return None, None
+    next_key = None
+    if len(movies) > page_size:
+        movies = movies[:page_size]
+        next_key = (movies[-1]['movie_title'], movies[-1]['movie_id'])
+    if not movies:
+        return movies, None
+
+    movie_ids = [movie['movie_id'] for movie in movies]
+    marks = ", ".join(["%s"] * len(movie_ids))
+    summaries = {movie_id: {'first_date': None, 'last_date': None, 'times': set(), 'screens': [], 'show_count': 0}
+                 for movie_id in movie_ids}
+
+    def extend_run(summary, first_date, last_date):
+        if summary['first_date'] is None or first_date < summary['first_date']:
+            summary['first_date'] = first_date
+        if summary['last_date'] is None or last_date > summary['last_date']:
+            summary['last_date'] = last_date
+
+    # Rules: one row per rule and show time, never one per show
+    rules = execute_query(f"""
+    SELECT r.movie_id, r.start_date, r.end_date, rt.show_time
+    FROM schedule_rules r
+    JOIN schedule_rule_times rt ON rt.rule_id = r.rule_id
+    WHERE r.movie_id IN ({marks})
+    """, movie_ids) or []
+    for rule in rules:
+        summary = summaries[rule['movie_id']]
+        extend_run(summary, rule['start_date'], rule['end_date'])
+        summary['times'].add(rule['show_time'])
+        summary['show_count'] += (rule['end_date'] - rule['start_date']).days + 1
+
+    # Cancelled shows come off the count, extra shows are added to it
+    exceptions = execute_query(f"""
+    SELECT movie_id, action, show_time, COUNT(*) as shows, MIN(show_date) as first_date, MAX(show_date) as last_date
+    FROM schedule_exceptions
+    WHERE movie_id IN ({marks})
+    GROUP BY movie_id, action, show_time
+    """, movie_ids) or []
+    for exception in exceptions:
+        summary = summaries[exception['movie_id']]
+        if exception['action'] == 'cancel':
+            summary['show_count'] -= exception['shows']
+        else:
+            summary['show_count'] += exception['shows']
+            summary['times'].add(exception['show_time'])
+            extend_run(summary, exception['first_date'], exception['last_date'])
+
+    screens = execute_query(f"""
+    SELECT mps.movie_id, sc.screen_name
+    FROM movie_played_on_screen mps
+    JOIN screen sc ON sc.screen_id = mps.screen_id
+    WHERE mps.movie_id IN ({marks})
+    """, movie_ids) or []
+    for screen in screens:
+        summaries[screen['movie_id']]['screens'].append(screen['screen_name'])
+
+    for movie in movies:
+        summary = summaries[movie['movie_id']]
+        movie.update(summary)
+        movie['times'] = [_format_show_time(show_time) for show_time in sorted(summary['times'])]
+    return movies, next_key
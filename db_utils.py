@@ -1,76 +1,621 @@
+import contextvars
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, InterfaceError, OperationalError
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from streamlit.runtime.scriptrunner_utils.script_run_context import SCRIPT_RUN_CONTEXT_ATTR_NAME
 
-# Create a connection pool or cache the connection in session state
-def get_database_connection():
-    # Check if connection exists in session state
-    if 'db_conn' not in st.session_state:
-        try:
-            # Replace these with your actual database credentials
-            connection = mysql.connector.connect(
-                host='localhost',
-                database='movie',
-                user='root',  # Replace with your MySQL username
-                password='subu1209'   # Replace with your MySQL password
-            )
-            
-            if connection.is_connected():
-                st.session_state['db_conn'] = connection
-                return connection
-                
-        except Error as e:
-            st.error(f"Error connecting to MySQL database: {e}")
-            return None
-    else:
-        # Return existing connection from session state
-        connection = st.session_state['db_conn']
-        if not connection.is_connected():
-            # Reconnect if connection was closed
-            connection.reconnect()
+# Replace these with your actual database credentials
+DB_CONFIG = {
+    'host': 'localhost',
+    'database': 'movie',
+    'user': 'root',  # Replace with your MySQL username
+    'password': 'subu1209',  # Replace with your MySQL password
+    'autocommit': True  # explicit transactions use start_transaction()
+}
+
+# Pool sizing. pool_size connections are kept open for the life of the process,
+# up to max_overflow extra ones are opened under load and closed when returned.
+POOL_CONFIG = {
+    'pool_size': 10,
+    'max_overflow': 20,
+    'timeout': 10,        # seconds to wait for a free connection
+    'recycle': 3600,      # seconds before a connection is closed and replaced
+    'pre_ping': True,     # check the connection is alive before handing it out
+    'ping_idle': 5        # ...but only if it has been idle longer than this many seconds
+}
+
+# Read replicas that execute_query reads go to, e.g. [{'host': 'localhost', 'port': 3307}].
+# Each entry overrides keys of DB_CONFIG; empty sends every read to the primary.
+REPLICAS = []
+
+# After a session writes, its reads stay on the primary for this many seconds
+# so it sees its own booking while the replicas catch up
+READ_YOUR_WRITES_SECONDS = 5
+
+# A replica that cannot be reached is skipped for this many seconds
+REPLICA_RETRY_SECONDS = 30
+
+# Worker threads shared by run_parallel; each running call holds one pooled connection
+PARALLEL_WORKERS = 8
+
+# Queries slower than this (seconds) go to the slow query log, parameters redacted
+SLOW_QUERY_THRESHOLD = 0.2
+SLOW_QUERY_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'slow_queries.log')
+SLOW_QUERY_LOG_MAX_BYTES = 5 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 5
+
+
+class PoolTimeout(Error):
+    pass
+
+
+# Bounded pool of MySQL connections shared by every Streamlit session in the process
+class ConnectionPool:
+    def __init__(self, db_config, pool_size=10, max_overflow=20, timeout=10, recycle=3600, pre_ping=True, ping_idle=5):
+        self.db_config = dict(db_config)
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.ping_idle = ping_idle
+
+        self._idle = deque()  # (connection, returned_at)
+        self._created_at = {}  # id(connection) -> created_at
+        self._open = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'checkout_waits': 0,
+            'checkout_timeouts': 0,
+            'wait_time': 0.0,
+            'connects': 0,
+            'recycled': 0,
+            'ping_failures': 0
+        }
+
+    def _connect(self):
+        connection = mysql.connector.connect(**self.db_config)
+        with self._cond:
+            self._stats['connects'] += 1
         return connection
 
-# Execute SELECT queries and return results
-def execute_query(query, params=None):
-    connection = get_database_connection()
-    if connection:
+    # Open the core connections up front so the first rerun of a new session
+    # does not pay for the TCP + auth handshake
+    def warm_up(self):
+        with self._cond:
+            missing = self.pool_size - self._open
+            self._open += max(missing, 0)
+        opened = 0
         try:
-            cursor = connection.cursor(dictionary=True)
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
-            
-            results = cursor.fetchall()
-            cursor.close()
-            return results
-        except Error as e:
-            st.error(f"Error executing query: {e}")
-            return None
-    return None
+            for _ in range(max(missing, 0)):
+                connection = self._connect()
+                opened += 1
+                with self._cond:
+                    self._created_at[id(connection)] = time.monotonic()
+                    self._idle.append((connection, time.monotonic()))
+                    self._cond.notify()
+        except Error:
+            # The database may not be up yet; connections are then opened on demand
+            pass
+        finally:
+            if opened < missing:
+                with self._cond:
+                    self._open -= missing - opened
+                    self._cond.notify_all()
 
-# Execute INSERT, UPDATE, DELETE queries
-def execute_update(query, params=None):
-    connection = get_database_connection()
-    if connection:
+    def _is_usable(self, connection, returned_at):
+        now = time.monotonic()
+        if now - self._created_at.get(id(connection), 0) > self.recycle:
+            with self._cond:
+                self._stats['recycled'] += 1
+            return False
+        if self.pre_ping and now - returned_at > self.ping_idle:
+            try:
+                connection.ping(reconnect=False)
+            except Error:
+                with self._cond:
+                    self._stats['ping_failures'] += 1
+                return False
+        return True
+
+    def _discard(self, connection):
+        with self._cond:
+            self._created_at.pop(id(connection), None)
+            self._open -= 1
+            self._cond.notify()
+        try:
+            connection.close()
+        except Error:
+            pass
+
+    def checkout(self):
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        wait_started = time.monotonic()
+        while True:
+            with self._cond:
+                while not self._idle and self._open >= self.pool_size + self.max_overflow:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['checkout_timeouts'] += 1
+                        raise PoolTimeout(msg=f"Timed out after {self.timeout}s waiting for a database connection")
+                    waited = True
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+                if self._idle:
+                    connection, returned_at = self._idle.pop()
+                else:
+                    connection = None
+                    self._open += 1
+
+            if connection is None:
+                try:
+                    connection = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._created_at[id(connection)] = time.monotonic()
+            elif not self._is_usable(connection, returned_at):
+                self._discard(connection)
+                continue
+
+            with self._cond:
+                self._stats['checkouts'] += 1
+                if waited:
+                    self._stats['checkout_waits'] += 1
+                    self._stats['wait_time'] += time.monotonic() - wait_started
+            return connection
+
+    def release(self, connection):
+        # Never hand a connection with an open transaction to the next borrower
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        except Error:
+            self._discard(connection)
+            return
+
+        # Overflow connections are closed on return unless someone is queued for one
+        with self._cond:
+            overflow = self._open > self.pool_size and not self._waiting
+        if overflow or not connection.is_connected():
+            self._discard(connection)
+            return
+
+        with self._cond:
+            self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+        for connection in idle:
+            self._discard(connection)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'pool_size': self.pool_size,
+                'max_overflow': self.max_overflow,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._open - len(self._idle)
+            })
+        return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+# Held while the primary or the replica pools are built and warmed, so only
+# one thread opens their connections; warming one never holds up the other
+# or close_pool(), and _pool_lock is only taken to publish the result
+_pool_build_lock = threading.Lock()
+_replica_build_lock = threading.Lock()
+
+# Return the process-wide pool, creating and warming it on first use
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_build_lock:
+            if _pool is None:
+                pool = ConnectionPool(DB_CONFIG, **POOL_CONFIG)
+                pool.warm_up()
+                with _pool_lock:
+                    _pool = pool
+    return _pool
+
+# Override pool settings; only takes effect before the pool is first used
+def configure_pool(**settings):
+    unknown = set(settings) - set(POOL_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown pool settings: {', '.join(sorted(unknown))}")
+    POOL_CONFIG.update(settings)
+
+# Pool counters for sizing: open/idle/in_use connections, checkouts, waits and timeouts
+def get_pool_stats():
+    if _pool is None:
+        return None
+    return _pool.stats()
+
+_replica_pools = None
+_replica_down_until = {}  # pool -> monotonic time it is tried again
+_replica_turn = itertools.count()
+
+# One pool per entry of REPLICAS, created and warmed on first use
+def get_replica_pools():
+    global _replica_pools
+    if _replica_pools is None:
+        with _replica_build_lock:
+            if _replica_pools is None:
+                pools = []
+                for replica in REPLICAS:
+                    pool = ConnectionPool(dict(DB_CONFIG, **replica), **POOL_CONFIG)
+                    pool.warm_up()
+                    pools.append(pool)
+                with _pool_lock:
+                    _replica_pools = pools
+    return _replica_pools
+
+# Override the replicas; only takes effect before the first read
+def configure_replicas(*replicas):
+    REPLICAS[:] = [dict(replica) for replica in replicas]
+
+# Per replica: its host and port, whether it is being skipped, and its pool counters
+def get_replica_stats():
+    if not _replica_pools:
+        return []
+    now = time.monotonic()
+    return [{
+        'host': pool.db_config.get('host'),
+        'port': pool.db_config.get('port', 3306),
+        'down': _replica_down_until.get(pool, 0) > now,
+        'pool': pool.stats()
+    } for pool in _replica_pools]
+
+def _mark_replica_down(pool):
+    _replica_down_until[pool] = time.monotonic() + REPLICA_RETRY_SECONDS
+
+# Borrow a connection from the next reachable replica in turn; (None, None)
+# when there are no replicas or none of them can be reached
+def _checkout_replica():
+    pools = get_replica_pools()
+    if not pools:
+        return None, None
+    start = next(_replica_turn)
+    for offset in range(len(pools)):
+        pool = pools[(start + offset) % len(pools)]
+        if _replica_down_until.get(pool, 0) > time.monotonic():
+            continue
         try:
+            return pool, pool.checkout()
+        except PoolTimeout:
+            continue
+        except Error:
+            _mark_replica_down(pool)
+    return None, None
+
+# Where the read-your-writes deadline lives: the Streamlit session when there
+# is one, otherwise the current thread (scripts and benchmarks)
+_thread_reads = threading.local()
+
+def _read_state():
+    if get_script_run_ctx(suppress_warning=True) is not None:
+        return st.session_state
+    return _thread_reads.__dict__
+
+# Called after every write: keep this session's reads on the primary for a while
+def note_write():
+    if REPLICAS:
+        _read_state()['_read_primary_until'] = time.monotonic() + READ_YOUR_WRITES_SECONDS
+
+def reads_pinned_to_primary():
+    return _read_state().get('_read_primary_until', 0) > time.monotonic()
+
+# Borrow a connection for the duration of a with-block and always give it back
+@contextmanager
+def pooled_connection():
+    pool = get_pool()
+    connection = pool.checkout()
+    try:
+        yield connection
+    finally:
+        pool.release(connection)
+
+_DB_UTILS_FILE = os.path.abspath(__file__)
+
+# Process-wide totals per call site: label -> {'calls', 'time', 'max_time', 'rows'}
+_site_stats = {}
+_site_stats_lock = threading.Lock()
+
+# Stats of the script run currently executing in this context (see begin_query_run)
+_current_run = contextvars.ContextVar('query_run', default=None)
+
+_slow_log = logging.getLogger('mtbs.slow_queries')
+_slow_log_ready = False
+_slow_log_lock = threading.Lock()
+
+def _get_slow_log():
+    global _slow_log_ready
+    if not _slow_log_ready:
+        with _slow_log_lock:
+            if not _slow_log_ready:
+                os.makedirs(os.path.dirname(SLOW_QUERY_LOG), exist_ok=True)
+                handler = RotatingFileHandler(SLOW_QUERY_LOG, maxBytes=SLOW_QUERY_LOG_MAX_BYTES,
+                                              backupCount=SLOW_QUERY_LOG_BACKUPS)
+                handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+                _slow_log.addHandler(handler)
+                _slow_log.setLevel(logging.WARNING)
+                _slow_log.propagate = False
+                _slow_log_ready = True
+    return _slow_log
+
+# First caller outside this module, e.g. "user.py:main:231"
+def _call_site():
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_code.co_filename in (_DB_UTILS_FILE, contextmanager.__code__.co_filename):
+        frame = frame.f_back
+    if frame is None:
+        return 'unknown'
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}:{frame.f_lineno}"
+
+def _record(label, query, params, elapsed, rows):
+    with _site_stats_lock:
+        site = _site_stats.setdefault(label, {'calls': 0, 'time': 0.0, 'max_time': 0.0, 'rows': 0})
+        site['calls'] += 1
+        site['time'] += elapsed
+        site['max_time'] = max(site['max_time'], elapsed)
+        site['rows'] += max(rows, 0)
+
+    run = _current_run.get()
+    if run is not None:
+        with run['lock']:
+            run['queries'] += 1
+            run['db_time'] += elapsed
+            site = run['sites'].setdefault(label, {'calls': 0, 'time': 0.0, 'rows': 0})
+            site['calls'] += 1
+            site['time'] += elapsed
+            site['rows'] += max(rows, 0)
+
+    if elapsed >= SLOW_QUERY_THRESHOLD:
+        # Values are never logged, only how many were bound
+        statement = " ".join(query.split())
+        if len(statement) > 500:
+            statement = statement[:500] + "..."
+        param_count = len(params) if params else 0
+        _get_slow_log().warning("%.3fs site=%s rows=%s params=<%d redacted> %s",
+                                elapsed, label, rows, param_count, statement)
+
+# Execute one statement on a cursor, timing it and attributing it to a call site.
+# Returns the fetched rows when fetch is set, otherwise the affected row count.
+def timed_execute(cursor, query, params=None, label=None, fetch=False):
+    label = label or _call_site()
+    started = time.perf_counter()
+    if params:
+        cursor.execute(query, params)
+    else:
+        cursor.execute(query)
+    if fetch:
+        result = cursor.fetchall()
+        rows = len(result)
+    else:
+        result = rows = cursor.rowcount
+    _record(label, query, params, time.perf_counter() - started, rows)
+    return result
+
+# Start counting queries for a new script run; call at the top of each page
+def begin_query_run():
+    run = {'queries': 0, 'db_time': 0.0, 'sites': {}, 'started': time.perf_counter(), 'lock': threading.Lock()}
+    _current_run.set(run)
+    return run
+
+# Counters of the current script run: queries, total DB time and per-site breakdown
+def get_query_run():
+    return _current_run.get()
+
+# Process-wide per-call-site totals since start-up
+def get_query_site_stats():
+    with _site_stats_lock:
+        return {label: dict(site) for label, site in _site_stats.items()}
+
+# Insert rows with multi-row VALUES statements, batch_size rows per round trip.
+# insert_prefix is everything before VALUES, e.g. "INSERT IGNORE INTO t (a, b)";
+# placeholder overrides the per-row "(%s, ...)" when a column needs an expression
+def bulk_insert(cursor, insert_prefix, rows, batch_size=500, suffix="", placeholder=None, label=None):
+    label = label or _call_site()
+    rows = list(rows)
+    if not rows:
+        return 0
+    if placeholder is None:
+        placeholder = "(" + ", ".join(["%s"] * len(rows[0])) + ")"
+    written = 0
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        query = f"{insert_prefix} VALUES {', '.join([placeholder] * len(batch))} {suffix}"
+        written += timed_execute(cursor, query, [value for row in batch for value in row], label=label)
+    return written
+
+def _fetch_dicts(connection, query, params, label):
+    cursor = connection.cursor(dictionary=True)
+    try:
+        return timed_execute(cursor, query, params, label=label, fetch=True)
+    finally:
+        cursor.close()
+
+# Execute SELECT queries and return results. Reads go to a replica when any
+# are configured, unless primary is set or this session wrote recently; if
+# no replica can be reached the primary answers instead.
+def execute_query(query, params=None, label=None, primary=False):
+    label = label or _call_site()
+    try:
+        if not primary and not reads_pinned_to_primary():
+            pool, connection = _checkout_replica()
+            if connection is not None:
+                try:
+                    return _fetch_dicts(connection, query, params, label)
+                except (InterfaceError, OperationalError):
+                    # The replica went away mid-query; retry on the primary below
+                    _mark_replica_down(pool)
+                finally:
+                    pool.release(connection)
+        with pooled_connection() as connection:
+            return _fetch_dicts(connection, query, params, label)
+    except Error as e:
+        st.error(f"Error executing query: {e}")
+        return None
+
+# Execute INSERT, UPDATE, DELETE queries
+def execute_update(query, params=None, label=None):
+    label = label or _call_site()
+    try:
+        with pooled_connection() as connection:
             cursor = connection.cursor()
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
-            
+            try:
+                return timed_execute(cursor, query, params, label=label)
+            finally:
+                cursor.close()
+                note_write()
+    except Error as e:
+        st.error(f"Error executing update: {e}")
+        return 0
+
+# Statements of one transaction, all run on the same pooled connection.
+# Use through transaction(); nothing is visible to others until it commits.
+class UnitOfWork:
+    def __init__(self, connection, dictionary=False):
+        self.connection = connection
+        self.cursor = connection.cursor(dictionary=dictionary)
+
+    # INSERT / UPDATE / DELETE; returns the affected row count
+    def execute(self, query, params=None, label=None):
+        return timed_execute(self.cursor, query, params, label=label)
+
+    # Single-row INSERT; returns the generated AUTO_INCREMENT id straight from
+    # the protocol reply, without a SELECT LAST_INSERT_ID() round trip
+    def insert(self, query, params=None, label=None):
+        timed_execute(self.cursor, query, params, label=label)
+        return self.cursor.lastrowid
+
+    # SELECT; returns every row
+    def fetch(self, query, params=None, label=None):
+        return timed_execute(self.cursor, query, params, label=label, fetch=True)
+
+    # SELECT; returns the first row or None
+    def fetch_one(self, query, params=None, label=None):
+        rows = self.fetch(query, params, label=label)
+        return rows[0] if rows else None
+
+    def bulk_insert(self, insert_prefix, rows, batch_size=500, suffix="", placeholder=None, label=None):
+        return bulk_insert(self.cursor, insert_prefix, rows, batch_size, suffix, placeholder, label)
+
+# Run several statements as one transaction:
+#
+#     with transaction() as uow:
+#         customer_id = uow.insert("INSERT INTO customer ...", params)
+#         uow.execute("INSERT INTO users ...", (..., customer_id))
+#
+# Commits once when the block ends and rolls back if it raises; database
+# errors are re-raised for the caller to report. dictionary=True makes
+# fetch() return dicts.
+@contextmanager
+def transaction(dictionary=False):
+    with pooled_connection() as connection:
+        uow = UnitOfWork(connection, dictionary)
+        try:
+            connection.start_transaction()
+            yield uow
             connection.commit()
-            affected_rows = cursor.rowcount
-            cursor.close()
-            return affected_rows
-        except Error as e:
-            st.error(f"Error executing update: {e}")
-            return 0
-    return 0
-
-# Close database connection when app is done
-def close_connection():
-    if 'db_conn' in st.session_state and st.session_state['db_conn'].is_connected():
-        st.session_state['db_conn'].close()
-        del st.session_state['db_conn']
+            note_write()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            uow.cursor.close()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=PARALLEL_WORKERS, thread_name_prefix='mtbs-query')
+    return _executor
+
+def _set_script_ctx(thread, script_ctx):
+    # add_script_run_ctx(thread, None) would attach the current context again,
+    # so detaching removes the attribute itself
+    if script_ctx is not None:
+        add_script_run_ctx(thread, script_ctx)
+    elif hasattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME):
+        delattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME)
+
+# Runs on a worker thread: the caller's query run counters and Streamlit
+# script context are attached so stats and st.error land on the right page.
+# The thread's own context (normally none) is put back afterwards, so a pooled
+# thread never keeps a finished session alive or hands it to the next caller.
+def _run_in_context(context, script_ctx, function, args):
+    thread = threading.current_thread()
+    previous = getattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME, None)
+    _set_script_ctx(thread, script_ctx)
+    try:
+        return context.run(function, *args)
+    finally:
+        _set_script_ctx(thread, previous)
+
+# Run independent reads concurrently and return their results in call order:
+#
+#     screen, holds = run_parallel(
+#         (get_movie_screen, movie_id),
+#         (unavailable_seats, show, hold_token),
+#     )
+#
+# Each call is (function, *args) and gets its own pooled connection, so the
+# database wall time is that of the slowest call rather than the sum. Only for
+# calls that do not depend on each other's results; an exception raised by a
+# call is re-raised here once every call has finished.
+def run_parallel(*calls):
+    if len(calls) < 2:
+        return [function(*args) for function, *args in calls]
+    script_ctx = get_script_run_ctx(suppress_warning=True)
+    futures = [_get_executor().submit(_run_in_context, contextvars.copy_context(), script_ctx, function, args)
+               for function, *args in calls]
+    errors = [future.exception() for future in futures]
+    for error in errors:
+        if error is not None:
+            raise error
+    return [future.result() for future in futures]
+
+# Close every idle pooled connection, e.g. on shutdown
+def close_pool():
+    global _pool, _replica_pools
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+        for pool in _replica_pools or []:
+            pool.close()
+        _replica_pools = None
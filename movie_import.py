@@ -0,0 +1,290 @@
+# Bulk import of movies with their screen and run from a CSV or JSON file.
+#
+# Each record is one movie:
+#
+#     title, description, poster_url, screen, release_date, last_date, show_times
+#
+# screen is a screen name or id, dates are YYYY-MM-DD and show_times is a list
+# of times ("10:00;13:30;19:00" in CSV, a list or that string in JSON). JSON
+# files are either an array of objects or one object per line. The file is
+# read as a stream and written IMPORT_BATCH_SIZE movies per transaction, so
+# memory stays flat however long it is. Bad records are skipped and reported
+# with their record number; the rest are imported.
+#
+#     python movie_import.py slate.csv --admin-id 1
+import argparse
+import csv
+import datetime
+import json
+import os
+import time
+
+from db_utils import execute_query, transaction
+
+IMPORT_BATCH_SIZE = 200
+MAX_SHOW_TIMES = 10
+# Errors kept in the report; further ones are only counted
+MAX_REPORTED_ERRORS = 1000
+
+FIELDS = ('title', 'description', 'poster_url', 'screen', 'release_date', 'last_date', 'show_times')
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+# Objects of a top-level JSON array, decoded one at a time from the stream
+def _iter_json_array(stream, chunk_size=65536):
+    decoder = json.JSONDecoder()
+    buffer = stream.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise ImportRowError("expected a JSON array of movies")
+    buffer = buffer[1:]
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if buffer.startswith(','):
+            buffer = buffer[1:]
+            continue
+        if buffer.startswith(']'):
+            return
+        if buffer:
+            try:
+                record, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError as e:
+                # Most likely the object goes on in the next chunk
+                if eof:
+                    raise ImportRowError(f"the JSON array is malformed: {e.msg}")
+            else:
+                yield record
+                buffer = buffer[end:]
+                continue
+        elif eof:
+            raise ImportRowError("the JSON array is not closed")
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+# Records of a CSV, JSON array or JSON lines text stream, as dicts. A JSON
+# line that does not parse comes out as an ImportRowError for that record.
+def iter_records(stream, file_format):
+    if file_format == 'csv':
+        yield from csv.DictReader(stream)
+    elif file_format == 'jsonl':
+        for line in stream:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield ImportRowError(f"not valid JSON: {e}")
+    else:
+        # A .json file may hold an array or one object per line
+        head = stream.read(4096)
+        stream = _Prefixed(head, stream)
+        if head.lstrip().startswith('['):
+            yield from _iter_json_array(stream)
+        else:
+            yield from iter_records(stream, 'jsonl')
+
+
+# A text stream with some already-read text put back in front of it
+class _Prefixed:
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def read(self, size=-1):
+        text, self.prefix = self.prefix, ""
+        if size is None or size < 0:
+            return text + self.stream.read()
+        if len(text) >= size:
+            text, self.prefix = text[:size], text[size:]
+            return text
+        return text + self.stream.read(size - len(text))
+
+    def __iter__(self):
+        lines = self.prefix.splitlines(keepends=True)
+        self.prefix = ""
+        if lines and not lines[-1].endswith('\n'):
+            lines[-1] += self.stream.readline()
+        yield from lines
+        yield from self.stream
+
+
+def _parse_date(value, field):
+    try:
+        return datetime.date.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ImportRowError(f"{field} '{value}' is not a YYYY-MM-DD date")
+
+def _parse_time(value):
+    text = value.strip().upper()
+    for time_format in ('%H:%M', '%H:%M:%S', '%I:%M %p', '%I:%M%p'):
+        try:
+            return datetime.datetime.strptime(text, time_format).time()
+        except ValueError:
+            pass
+    raise ImportRowError(f"show time '{value}' is not a time like 19:30 or 07:30 PM")
+
+# Check one record and turn it into the values to write
+def validate_record(record, screens):
+    if isinstance(record, ImportRowError):
+        raise record
+    if not isinstance(record, dict):
+        raise ImportRowError("record is not an object")
+    title = str(record.get('title') or '').strip()
+    if not title:
+        raise ImportRowError("title is missing")
+    if len(title) > 255:
+        raise ImportRowError("title is longer than 255 characters")
+    poster_url = str(record.get('poster_url') or '').strip() or None
+    if poster_url and len(poster_url) > 500:
+        raise ImportRowError("poster_url is longer than 500 characters")
+
+    screen = str(record.get('screen') or '').strip()
+    screen_id = screens.get(screen.lower())
+    if screen_id is None:
+        raise ImportRowError(f"unknown screen '{screen}'")
+
+    release_date = _parse_date(record.get('release_date'), 'release_date')
+    last_date = _parse_date(record.get('last_date'), 'last_date')
+    if last_date < release_date:
+        raise ImportRowError("last_date is before release_date")
+
+    show_times = record.get('show_times') or []
+    if isinstance(show_times, str):
+        show_times = show_times.replace('|', ';').split(';')
+    show_times = sorted({_parse_time(str(value)) for value in show_times if str(value).strip()})
+    if not show_times:
+        raise ImportRowError("no show times")
+    if len(show_times) > MAX_SHOW_TIMES:
+        raise ImportRowError(f"more than {MAX_SHOW_TIMES} show times")
+
+    return {
+        'title': title,
+        'description': str(record.get('description') or '').strip(),
+        'poster_url': poster_url,
+        'screen_id': screen_id,
+        'release_date': release_date,
+        'last_date': last_date,
+        'show_times': show_times
+    }
+
+# Screen names (lower-cased) and ids -> screen_id
+def _load_screens():
+    rows = execute_query("SELECT screen_id, screen_name FROM screen", primary=True)
+    if rows is None:
+        raise ImportRowError("could not read the screens")
+    screens = {}
+    for row in rows:
+        screens[str(row['screen_id'])] = row['screen_id']
+        if row['screen_name']:
+            screens[row['screen_name'].strip().lower()] = row['screen_id']
+    return screens
+
+# Write one batch of validated movies in a single transaction: a movie and a
+# rule insert per movie (their ids are needed), the rest as multi-row inserts
+def _write_batch(batch, admin_id, web_id):
+    screen_links, rule_times, played_times = [], [], []
+    with transaction() as uow:
+        for movie in batch:
+            movie_id = uow.insert("""
+            INSERT INTO movie (movie_title, movie_description, poster_url, customer_id, web_id)
+            VALUES (%s, %s, %s, %s, %s)
+            """, (movie['title'], movie['description'], movie['poster_url'], admin_id, web_id))
+            rule_id = uow.insert("""
+            INSERT INTO schedule_rules (movie_id, start_date, end_date)
+            VALUES (%s, %s, %s)
+            """, (movie_id, movie['release_date'], movie['last_date']))
+            screen_links.append((movie_id, movie['screen_id']))
+            rule_times += [(rule_id, show_time) for show_time in movie['show_times']]
+            played_times += [(show_time, movie_id) for show_time in movie['show_times']]
+        uow.bulk_insert("INSERT INTO movie_played_on_screen (movie_id, screen_id)", screen_links)
+        uow.bulk_insert("INSERT IGNORE INTO schedule_rule_times (rule_id, show_time)", rule_times)
+        uow.bulk_insert("INSERT IGNORE INTO movie_played_on_schedule (show_time, movie_id)", played_times)
+
+# Import every record of a text stream. progress(report), if given, is called
+# after each batch. Returns the report: records read, movies imported, shows
+# scheduled, failed records with (record number, message) and throughput.
+def import_movies(stream, file_format, admin_id=None, web_id=None, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    started = time.perf_counter()
+    report = {'records': 0, 'imported': 0, 'failed': 0, 'shows_scheduled': 0, 'errors': [],
+              'elapsed': 0.0, 'movies_per_second': 0.0}
+
+    def fail(number, message):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append((number, message))
+
+    def timing():
+        elapsed = time.perf_counter() - started
+        report['elapsed'] = round(elapsed, 3)
+        report['movies_per_second'] = round(report['imported'] / elapsed, 1) if elapsed else 0.0
+
+    def flush(batch):
+        try:
+            _write_batch([movie for _, movie in batch], admin_id, web_id)
+        except Exception as e:
+            for number, _ in batch:
+                fail(number, f"not written, the batch failed: {e}")
+        else:
+            report['imported'] += len(batch)
+            report['shows_scheduled'] += sum(((movie['last_date'] - movie['release_date']).days + 1)
+                                             * len(movie['show_times']) for _, movie in batch)
+        timing()
+        if progress is not None:
+            progress(report)
+
+    screens = _load_screens()
+    if web_id is None:
+        website = execute_query("SELECT web_id FROM website LIMIT 1", primary=True)
+        web_id = website[0]['web_id'] if website else None
+
+    batch = []
+    records = iter_records(stream, file_format)
+    while True:
+        number = report['records'] + 1
+        try:
+            record = next(records)
+        except StopIteration:
+            break
+        except (ImportRowError, ValueError, csv.Error) as e:
+            # The file itself is unreadable from here on
+            fail(number, str(e))
+            break
+        report['records'] = number
+        try:
+            batch.append((number, validate_record(record, screens)))
+        except ImportRowError as e:
+            fail(number, str(e))
+            continue
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    timing()
+    return report
+
+# 'csv', 'jsonl' or 'json' from a file name
+def file_format_of(name):
+    extension = os.path.splitext(name)[1].lower()
+    return {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}.get(extension, 'json')
+
+def main():
+    parser = argparse.ArgumentParser(description="Import movies, their screens and runs from a CSV or JSON file.")
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=['csv', 'json', 'jsonl'], help="default: from the file extension")
+    parser.add_argument('--admin-id', type=int, help="admin credited with the movies")
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    with open(args.path, encoding='utf-8-sig', newline='') as stream:
+        report = import_movies(stream, args.format or file_format_of(args.path), args.admin_id,
+                               batch_size=args.batch_size)
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,20 @@
 import streamlit as st
 import datetime
+import io
 import streamlit_extras.switch_page_button as spb
-from db_utils import execute_query, execute_update
+from mysql.connector import Error
+from db_utils import execute_query, transaction, get_pool_stats, get_replica_stats, begin_query_run
+from query_debug import render_query_debug_panel
+from catalog import invalidate_catalog, catalog_cache_stats, get_movie_summaries
+from schedule_writer import add_movie_with_schedule
+from movie_import import FIELDS as IMPORT_FIELDS, ImportRowError, file_format_of, import_movies
+from archive import ARCHIVE_AFTER_DAYS, archive_old_shows
+from poster_store import ingest_poster, poster_cache_stats
+from seat_counts import reconcile as reconcile_seat_counts
+from pricing import price_book_stats
+from payments import pending_refund_count, retry_pending_refunds
+from rollups import DIMENSIONS as SALES_DIMENSIONS, rebuild as rebuild_rollups, sales_report
+from schedules import ShowClash, ShowHasSales, get_schedule_rules, get_shows, shift_shows, cancel_shows, cancel_date_range, add_date_range
 
 def check_authentication():
     # Check if user is logged in and is an admin
@@ -14,11 +27,12 @@ def main():
     
     # Verify admin authentication
     check_authentication()
+    begin_query_run()
 
     st.title("🎬 Admin Panel")
 
     # Sidebar menu
-    menu = st.radio("Select an option:", ["Add Movie", "Remove Movie", "Adjust Shows", "Movie List"])
+    menu = st.radio("Select an option:", ["Add Movie", "Import Movies", "Remove Movie", "Adjust Shows", "Movie List", "Sales Report"])
 
     if menu == "Add Movie":
         st.subheader("➕ Add a New Movie")
@@ -60,63 +74,65 @@ def main():
                 submit = st.button("Add Movie")
                 
                 if submit and movie_title and movie_desc and show_times:
-                    # Insert movie data
-                    movie_query = """
-                    INSERT INTO movie (movie_title, movie_description, poster_url, customer_id, web_id) 
-                    VALUES (%s, %s, %s, %s, %s)
-                    """
-                    movie_result = execute_update(movie_query, (movie_title, movie_desc, poster_url, admin_id, web_id))
-                    
-                    if movie_result > 0:
-                        # Get the newly inserted movie ID
-                        movie_id_query = "SELECT LAST_INSERT_ID() as movie_id"
-                        movie_id_result = execute_query(movie_id_query)
-                        
-                        if movie_id_result:
-                            movie_id = movie_id_result[0]['movie_id']
-                            
-                            # Link movie to screen
-                            screen_link_query = """
-                            INSERT INTO movie_played_on_screen (movie_id, screen_id) 
-                            VALUES (%s, %s)
-                            """
-                            execute_update(screen_link_query, (movie_id, screen_id))
-                            
-
-                            # Add schedules
-                            current_date = release_date
-                                
-                            while current_date <= screen_till:
-                                for show_time in show_times:
-                                    # Use INSERT IGNORE to skip duplicates
-                                    schedule_query = """
-                                    INSERT IGNORE INTO schedule (show_time, show_date, movie_id) 
-                                    VALUES (%s, %s, %s)
-                                    """
-                                    execute_update(schedule_query, (show_time, current_date, movie_id))
-                                
-                                # Move to next date
-                                current_date += datetime.timedelta(days=1)
-                            
-                            # Add to movie_played_on_schedule using INSERT IGNORE
-                            for show_time in show_times:
-                                movie_schedule_query = """
-                                INSERT IGNORE INTO movie_played_on_schedule (show_time, movie_id) 
-                                VALUES (%s, %s)
-                                """
-                                execute_update(movie_schedule_query, (show_time, movie_id))
-                                
-                                                            
-                            st.success(f"Movie '{movie_title}' added successfully!")
-                        else:
-                            st.error("Failed to retrieve movie ID.")
+                    if screen_till < release_date:
+                        st.error("Last screening date must be on or after the release date.")
                     else:
-                        st.error("Failed to add movie.")
+                        # Movie, screen link and every schedule row go in one transaction
+                        try:
+                            result = add_movie_with_schedule(
+                                movie_title, movie_desc, poster_url, admin_id, web_id,
+                                screen_id, release_date, screen_till, show_times
+                            )
+                        except Error as e:
+                            st.error(f"Failed to add movie: {e}")
+                        else:
+                            invalidate_catalog()
+                            # Thumbnails are made now so the first visitor is not the one waiting
+                            if poster_url and not ingest_poster(poster_url):
+                                st.warning("Could not fetch the poster; it will be retried when the movie is first shown.")
+                            st.success(f"Movie '{movie_title}' added successfully!")
+                            st.caption(f"{result['shows_scheduled']} shows scheduled, "
+                                       f"{result['rows_written']} rows written in {result['elapsed']:.2f}s")
             else:
                 st.error("No screens available. Please add screens first.")
         else:
             st.error("Website information not found.")
 
+    elif menu == "Import Movies":
+        st.subheader("📥 Import Movies")
+        st.caption("One movie per row or object with the fields " + ", ".join(IMPORT_FIELDS) + ". "
+                   "screen is a screen name or id, dates are YYYY-MM-DD and show_times are separated by ';'.")
+        
+        uploaded = st.file_uploader("CSV or JSON file", type=["csv", "json", "jsonl"])
+        
+        if uploaded is not None and st.button("Import"):
+            progress = st.empty()
+            
+            def show_progress(report):
+                progress.info(f"{report['imported']} of {report['records']} movies imported "
+                              f"({report['movies_per_second']:.0f}/s)...")
+            
+            # The upload is read as a stream and written in batches
+            stream = io.TextIOWrapper(uploaded, encoding="utf-8-sig", newline="")
+            try:
+                report = import_movies(stream, file_format_of(uploaded.name), st.session_state.get('admin_id'),
+                                       progress=show_progress)
+            except (Error, ImportRowError) as e:
+                progress.empty()
+                st.error(f"Import failed: {e}")
+            else:
+                progress.empty()
+                if report['imported']:
+                    invalidate_catalog()
+                    st.success(f"Imported {report['imported']} movies with {report['shows_scheduled']} shows "
+                               f"in {report['elapsed']:.2f}s ({report['movies_per_second']:.0f} movies/s)")
+                if report['failed']:
+                    st.warning(f"{report['failed']} of {report['records']} records were not imported.")
+                    st.dataframe([{"Record": number, "Error": message} for number, message in report['errors']],
+                                 hide_index=True)
+                elif not report['imported']:
+                    st.info("The file has no movies.")
+
     elif menu == "Remove Movie":
         st.subheader("🗑️ Remove a Movie")
         
@@ -142,18 +158,24 @@ def main():
                 if movie_check:
                     movie_title = movie_check[0]['movie_title']
                     
-                    # Delete from dependent tables first
-                    execute_update("DELETE FROM movie_played_on_schedule WHERE movie_id = %s", (movie_to_remove,))
-                    execute_update("DELETE FROM schedule WHERE movie_id = %s", (movie_to_remove,))
-                    execute_update("DELETE FROM movie_played_on_screen WHERE movie_id = %s", (movie_to_remove,))
-                    
-                    # Now delete the movie
-                    movie_delete = execute_update("DELETE FROM movie WHERE movie_id = %s", (movie_to_remove,))
-                    
-                    if movie_delete > 0:
-                        st.warning(f"Movie '{movie_title}' (ID: {movie_to_remove}) removed successfully!")
+                    # Dependent tables first, then the movie, all in one transaction
+                    try:
+                        with transaction() as uow:
+                            uow.execute("DELETE FROM movie_played_on_schedule WHERE movie_id = %s", (movie_to_remove,))
+                            uow.execute("DELETE FROM schedule_exceptions WHERE movie_id = %s", (movie_to_remove,))
+                            uow.execute("""
+                            DELETE rt FROM schedule_rule_times rt
+                            JOIN schedule_rules r ON r.rule_id = rt.rule_id
+                            WHERE r.movie_id = %s
+                            """, (movie_to_remove,))
+                            uow.execute("DELETE FROM schedule_rules WHERE movie_id = %s", (movie_to_remove,))
+                            uow.execute("DELETE FROM movie_played_on_screen WHERE movie_id = %s", (movie_to_remove,))
+                            uow.execute("DELETE FROM movie WHERE movie_id = %s", (movie_to_remove,))
+                    except Error as e:
+                        st.error(f"Failed to remove movie: {e}")
                     else:
-                        st.error("Failed to remove movie.")
+                        invalidate_catalog()
+                        st.warning(f"Movie '{movie_title}' (ID: {movie_to_remove}) removed successfully!")
                 else:
                     st.error(f"No movie found with ID {movie_to_remove}")
         else:
@@ -171,114 +193,249 @@ def main():
             selected_movie = st.selectbox("Select Movie", list(movie_options.keys()))
             movie_id = movie_options[selected_movie]
             
-            # Get current show times for this movie
-            shows_query = """
-            SELECT schedule_id, show_time, show_date 
-            FROM schedule 
-            WHERE movie_id = %s
-            """
-            shows = execute_query(shows_query, (movie_id,))
+            # Runs (rules) of this movie
+            rules = get_schedule_rules(movie_id)
+            if rules:
+                for rule in rules:
+                    st.caption(f"Run: {rule['start_date']} to {rule['end_date']} - Times: {rule['show_times']}")
+            else:
+                st.info(f"No runs scheduled for '{selected_movie}'")
+            
+            # Shows in the chosen date range, worked out from the rules
+            col1, col2, col3 = st.columns(3)
+            from_date = col1.date_input("From", datetime.date.today(), key="shows_from")
+            to_date = col2.date_input("To", datetime.date.today() + datetime.timedelta(days=13), key="shows_to")
+            page_size = col3.selectbox("Shows per page", [25, 50, 100], index=1, key="shows_page_size")
             
+            if to_date < from_date:
+                st.error("'To' must be on or after 'From'.")
+                shows = []
+            else:
+                try:
+                    shows = get_shows(movie_id, from_date, to_date)
+                except Error as e:
+                    st.error(f"Failed to load shows: {e}")
+                    shows = []
+            
+            selected_shows = []
             if shows:
-                st.write("Current Show Times:")
-                for show in shows:
-                    st.write(f"ID: {show['schedule_id']} - Date: {show['show_date']} - Time: {show['show_time']}")
-                
-                # Allow updating a specific show
-                schedule_id = st.number_input("Enter Schedule ID to update", min_value=1, step=1)
-                new_time = st.time_input("Select New Show Time")
-                new_date = st.date_input("Select New Show Date")
-                
-                update = st.button("Update Show")
+                page_count = (len(shows) + page_size - 1) // page_size
+                page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1,
+                                       key=f"shows_page_{movie_id}_{from_date}_{to_date}_{page_size}")
+                page_shows = shows[(page - 1) * page_size:page * page_size]
                 
-                if update:
-                    # Check if schedule exists
-                    check_query = "SELECT schedule_id FROM schedule WHERE schedule_id = %s"
-                    schedule_check = execute_query(check_query, (schedule_id,))
-                    
-                    if schedule_check:
-                        # Update the schedule
-                        update_query = """
-                        UPDATE schedule 
-                        SET show_time = %s, show_date = %s 
-                        WHERE schedule_id = %s
-                        """
-                        schedule_update = execute_update(update_query, (new_time, new_date, schedule_id))
-                        
-                        if schedule_update > 0:
-                            # Also update movie_played_on_schedule if necessary
-                            execute_update("""
-                            UPDATE movie_played_on_schedule 
-                            SET show_time = %s 
-                            WHERE movie_id = %s
-                            """, (new_time, movie_id))
-                            
-                            st.info(f"Show for '{selected_movie}' updated to {new_time} on {new_date}")
-                        else:
-                            st.error("Failed to update show.")
-                    else:
-                        st.error(f"No schedule found with ID {schedule_id}")
+                grid = st.data_editor(
+                    [{"Select": False,
+                      "Date": show['show_date'],
+                      "Time": show['show_time'].strftime('%I:%M %p'),
+                      "Type": "Extra" if show['extra'] else "Regular"} for show in page_shows],
+                    disabled=["Date", "Time", "Type"],
+                    hide_index=True,
+                    key=f"shows_grid_{movie_id}_{from_date}_{to_date}_{page_size}_{page}"
+                )
+                selected_shows = [(show['show_date'], show['show_time'])
+                                  for show, row in zip(page_shows, grid) if row["Select"]]
+                st.caption(f"{len(shows)} shows between {from_date} and {to_date}, {len(selected_shows)} selected")
             else:
-                st.info(f"No show times scheduled for '{selected_movie}'")
-                
-                # Option to add a new show time
-                st.subheader("Add New Show Time")
-                new_time = st.time_input("New Show Time")
-                new_date = st.date_input("New Show Date")
-                
-                add_show = st.button("Add Show")
-                
-                if add_show:
-                    # Add new schedule
-                    schedule_query = """
-                    INSERT INTO schedule (show_time, show_date, movie_id) 
-                    VALUES (%s, %s, %s)
-                    """
-                    schedule_add = execute_update(schedule_query, (new_time, new_date, movie_id))
-                    
-                    if schedule_add > 0:
-                        # Add to movie_played_on_schedule
-                        execute_update("""
-                        INSERT INTO movie_played_on_schedule (show_time, movie_id) 
-                        VALUES (%s, %s)
-                        """, (new_time, movie_id))
-                        
-                        st.success(f"New show time added for '{selected_movie}': {new_time} on {new_date}")
+                st.info(f"No shows of '{selected_movie}' between {from_date} and {to_date}")
+            
+            # Bulk operations; each one is a single transaction
+            st.subheader("Bulk Changes")
+            change = None
+            
+            col1, col2 = st.columns(2)
+            shift_minutes = col1.number_input("Shift selected shows by (minutes)", min_value=-720, max_value=720,
+                                              value=30, step=15)
+            if col1.button("Shift Selected", disabled=not selected_shows):
+                change = (f"Shifted {len(selected_shows)} shows by {shift_minutes} minutes",
+                          lambda: shift_shows(movie_id, selected_shows, shift_minutes))
+            if col2.button("Cancel Selected", disabled=not selected_shows):
+                change = (f"Cancelled {len(selected_shows)} shows",
+                          lambda: cancel_shows(movie_id, selected_shows))
+            
+            with st.expander("Cancel a date range"):
+                cancel_from = st.date_input("Cancel from", key="cancel_from")
+                cancel_to = st.date_input("Cancel to", key="cancel_to")
+                if st.button("Cancel Range"):
+                    if cancel_to < cancel_from:
+                        st.error("'Cancel to' must be on or after 'Cancel from'.")
                     else:
-                        st.error("Failed to add show time.")
+                        change = (f"Cancelled every show from {cancel_from} to {cancel_to}",
+                                  lambda: cancel_date_range(movie_id, cancel_from, cancel_to))
+            
+            with st.expander("Add dates"):
+                add_from = st.date_input("Add from", key="add_from")
+                add_to = st.date_input("Add to", key="add_to")
+                add_times = []
+                for i in range(3):  # Allow adding up to 3 show times
+                    show_time = st.time_input(f"Show Time {i+1}", datetime.time(10 + i*3, 0), key=f"add_time_{i}")
+                    if st.checkbox(f"Include Show Time {i+1}", value=i == 0, key=f"add_time_on_{i}"):
+                        add_times.append(show_time)
+                if st.button("Add Dates"):
+                    if add_to < add_from:
+                        st.error("'Add to' must be on or after 'Add from'.")
+                    elif not add_times:
+                        st.error("Pick at least one show time.")
+                    else:
+                        change = (f"Added shows from {add_from} to {add_to}",
+                                  lambda: add_date_range(movie_id, add_from, add_to, add_times))
+            
+            if change:
+                message, apply_change = change
+                try:
+                    apply_change()
+                except ShowClash as e:
+                    st.error(f"Shows not shifted: {e}")
+                except ShowHasSales as e:
+                    st.error(f"Shows not changed: {e}. Refund or move those bookings first.")
+                except Error as e:
+                    st.error(f"Failed to update shows: {e}")
+                else:
+                    invalidate_catalog()
+                    st.session_state["schedule_message"] = f"{message} for '{selected_movie}'"
+                    st.rerun()
+            if "schedule_message" in st.session_state:
+                st.success(st.session_state.pop("schedule_message"))
         else:
             st.info("No movies available in the database.")
 
     elif menu == "Movie List":
         st.subheader("📋 Current Movies")
         
-        # Fetch all movies with details
-        movies_query = """
-        SELECT m.movie_id, m.movie_title, m.movie_description,
-               GROUP_CONCAT(DISTINCT s.show_time ORDER BY s.show_time SEPARATOR ', ') as show_times,
-               GROUP_CONCAT(DISTINCT s.show_date ORDER BY s.show_date SEPARATOR ', ') as show_dates,
-               GROUP_CONCAT(DISTINCT sc.screen_name SEPARATOR ', ') as screens
-        FROM movie m
-        LEFT JOIN schedule s ON m.movie_id = s.movie_id
-        LEFT JOIN movie_played_on_screen mps ON m.movie_id = mps.movie_id
-        LEFT JOIN screen sc ON mps.screen_id = sc.screen_id
-        GROUP BY m.movie_id
-        """
-        movies = execute_query(movies_query)
+        # Keys of the pages seen so far; the last one is the page on screen
+        if "movie_list_pages" not in st.session_state:
+            st.session_state["movie_list_pages"] = [None]
+        
+        def reset_movie_list_pages():
+            st.session_state["movie_list_pages"] = [None]
+        
+        col1, col2 = st.columns([3, 1])
+        title_filter = col1.text_input("Filter by title", key="movie_list_filter", on_change=reset_movie_list_pages)
+        page_size = col2.selectbox("Per page", [10, 20, 50, 100], index=1, key="movie_list_page_size",
+                                   on_change=reset_movie_list_pages)
+        
+        movie_list_pages = st.session_state["movie_list_pages"]
+        movies, next_key = get_movie_summaries(title_filter, movie_list_pages[-1], page_size)
         
         if movies:
+            first = (len(movie_list_pages) - 1) * page_size + 1
+            st.caption(f"Showing movies {first}–{first + len(movies) - 1}")
             for movie in movies:
                 st.markdown(f"### {movie['movie_title']} (ID: {movie['movie_id']})")
                 st.write(f"**Description:** {movie['movie_description']}")
-                st.write(f"**Screens:** {movie['screens'] if movie['screens'] else 'None'}")
-                st.write(f"**Show Dates:** {movie['show_dates'] if movie['show_dates'] else 'None'}")
-                st.write(f"**Show Times:** {movie['show_times'] if movie['show_times'] else 'None'}")
+                st.write(f"**Screens:** {', '.join(movie['screens']) if movie['screens'] else 'None'}")
+                if movie['first_date']:
+                    st.write(f"**Run:** {movie['first_date']} to {movie['last_date']} ({movie['show_count']} shows)")
+                else:
+                    st.write("**Run:** None")
+                st.write(f"**Show Times:** {', '.join(movie['times']) if movie['times'] else 'None'}")
                 st.markdown("---")
+            
+            col1, col2 = st.columns(2)
+            if len(movie_list_pages) > 1 and col1.button("⬅ Previous", key="movies_previous"):
+                movie_list_pages.pop()
+                st.rerun()
+            if next_key is not None and col2.button("Next ➡", key="movies_next"):
+                movie_list_pages.append(next_key)
+                st.rerun()
+        elif movies is not None:
+            if title_filter:
+                st.info(f"No movies match '{title_filter}'.")
+            else:
+                st.info("No movies available in the database.")
+
+    elif menu == "Sales Report":
+        st.subheader("📈 Sales Report")
+        
+        # Read from the daily_sales rollup, so the cost does not grow with ticket volume
+        today = datetime.date.today()
+        col1, col2, col3 = st.columns(3)
+        report_from = col1.date_input("From", today - datetime.timedelta(days=30), key="report_from")
+        report_to = col2.date_input("To", today, key="report_to")
+        dimension = col3.selectbox("Group by", list(SALES_DIMENSIONS), key="report_dimension")
+        
+        if report_to < report_from:
+            st.error("The end date must be on or after the start date.")
         else:
-            st.info("No movies available in the database.")
+            rows = sales_report(dimension, report_from, report_to)
+            if rows:
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Revenue", f"₹{sum(row['revenue'] for row in rows):,.2f}")
+                col2.metric("Tickets sold", f"{sum(int(row['tickets']) for row in rows):,}")
+                col3.metric("Seats sold", f"{sum(int(row['seats']) for row in rows):,}")
+                st.dataframe(
+                    [{dimension: str(row['name']), "Tickets": int(row['tickets']), "Seats": int(row['seats']),
+                      "Revenue (₹)": float(row['revenue']), "Shows": int(row['shows']),
+                      "Occupancy %": None if row['occupancy'] is None else float(row['occupancy'])}
+                     for row in rows],
+                    hide_index=True
+                )
+                st.caption("Occupancy is seats sold over the seats of shows that sold at least one ticket.")
+            elif rows is not None:
+                st.info("No sales in this period.")
+        
+        if st.button("Rebuild Rollups"):
+            try:
+                result = rebuild_rollups(report_from, report_to)
+            except Error as e:
+                st.error(f"Rebuild failed: {e}")
+            else:
+                st.success(f"Rebuilt {result['rows']} rollup rows in {result['elapsed']}s")
 
     st.sidebar.success("Admin Controls")
     
+    with st.sidebar.expander("📊 Cache & Pool Stats"):
+        st.write("**Movie catalog cache**")
+        st.json(catalog_cache_stats())
+        st.write("**Poster thumbnails**")
+        st.json(poster_cache_stats())
+        st.write("**Price book**")
+        st.json(price_book_stats())
+        st.write("**Connection pool**")
+        st.json(get_pool_stats() or {})
+        replicas = get_replica_stats()
+        if replicas:
+            st.write("**Read replicas**")
+            st.json(replicas)
+    
+    with st.sidebar.expander("🗄 Archive Past Shows"):
+        archive_days = st.number_input("Archive shows older than (days)", min_value=0, value=ARCHIVE_AFTER_DAYS, step=1)
+        if st.button("Archive Now"):
+            try:
+                report = archive_old_shows(archive_days)
+            except Error as e:
+                st.error(f"Archiving failed: {e}")
+            else:
+                invalidate_catalog()
+                st.success(f"Archived rows: {report['moved']}")
+                st.caption(f"{len(report['batches'])} batches in {report['elapsed']}s")
+                st.json(report['batches'])
+    
+    with st.sidebar.expander("🎟 Seat Counters"):
+        st.caption("Recount seats sold per upcoming show from the booked seats and fix any drift.")
+        if st.button("Reconcile Now"):
+            try:
+                report = reconcile_seat_counts()
+            except Error as e:
+                st.error(f"Reconciliation failed: {e}")
+            else:
+                st.success(f"Checked {report['shows_checked']} shows, fixed {len(report['fixed'])}")
+                if report['fixed']:
+                    st.json(report['fixed'])
+    
+    with st.sidebar.expander("💸 Pending Refunds"):
+        st.caption("Charges whose booking failed and whose refund the gateway has not accepted yet.")
+        try:
+            st.metric("Refunds owed", pending_refund_count())
+            if st.button("Retry Refunds"):
+                result = retry_pending_refunds()
+                st.success(f"Refunded {result['refunded']} of {result['tried']}")
+        except Error as e:
+            st.error(f"Could not read pending refunds: {e}")
+    
+    if st.sidebar.toggle("🐞 Query debug panel", key="show_query_debug"):
+        render_query_debug_panel()
+    
     # Logout button
     if st.sidebar.button("Logout"):
         for key in list(st.session_state.keys()):
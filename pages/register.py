@@ -1,7 +1,8 @@
 import streamlit as st
 import streamlit_extras.switch_page_button as spb
 import hashlib
-from db_utils import execute_query, execute_update
+from mysql.connector import Error
+from db_utils import execute_query, transaction
 
 def main():
     st.set_page_config(page_title="Register", page_icon="📝", initial_sidebar_state="collapsed")
@@ -32,46 +33,32 @@ def main():
             if existing_user:
                 st.error("Username or email already exists")
             else:
-                # First create customer record
-                customer_query = """
-                INSERT INTO customer (first_name, last_name, customer_contact) 
-                VALUES (%s, %s, %s)
-                """
-                customer_result = execute_update(customer_query, (first_name, last_name, email))
-                
-                if customer_result > 0:
-                    # Get the new customer ID
-                    customer_id_query = "SELECT LAST_INSERT_ID() as customer_id"
-                    customer_id_result = execute_query(customer_id_query)
-                    
-                    if customer_id_result:
-                        customer_id = customer_id_result[0]['customer_id']
-                        
+                # Customer, customer_cpy and user rows are written together or not at all
+                try:
+                    with transaction() as uow:
+                        customer_id = uow.insert("""
+                        INSERT INTO customer (first_name, last_name, customer_contact) 
+                        VALUES (%s, %s, %s)
+                        """, (first_name, last_name, email))
+
                         # Add to customer_cpy table
-                        customer_cpy_query = """
+                        uow.execute("""
                         INSERT INTO customer_cpy (customer_id, customer_contact) 
                         VALUES (%s, %s)
-                        """
-                        execute_update(customer_cpy_query, (customer_id, contact))
-                        
+                        """, (customer_id, contact))
+
                         # Create user account
                         # In a real app, you would hash the password properly
-                        user_query = """
+                        uow.execute("""
                         INSERT INTO users (username, email, password, customer_id, created_at) 
                         VALUES (%s, %s, %s, %s, NOW())
-                        """
-                        user_result = execute_update(user_query, (username, email, password, customer_id))
-                        
-                        if user_result > 0:
-                            st.success("Registration successful! Please login.")
-                            if st.button("Go to Login"):
-                                spb.switch_page("Login")
-                        else:
-                            st.error("Failed to create user account")
-                    else:
-                        st.error("Failed to retrieve customer ID")
+                        """, (username, email, password, customer_id))
+                except Error as e:
+                    st.error(f"Registration failed: {e}")
                 else:
-                    st.error("Failed to create customer record")
+                    st.success("Registration successful! Please login.")
+                    if st.button("Go to Login"):
+                        spb.switch_page("Login")
 
     # Login link
     st.markdown("---")
@@ -1,9 +1,23 @@
 import streamlit as st
 from datetime import datetime as dt
 import datetime
-import random
+import time
 import streamlit_extras.switch_page_button as spb
-from db_utils import execute_query, execute_update
+from db_utils import begin_query_run, run_parallel
+from query_debug import render_query_debug_panel
+from catalog import get_catalog, get_showtimes, get_movie_screen
+from bookings import MY_TICKETS_PAGE_SIZE, book_held_seats, get_customer_tickets
+from mysql.connector import Error
+from seat_index import ShowOccupancy, split_seats, show_key, get_show_occupancy
+from payments import PENDING, FAILED, submit_payment, get_payment, forget_payment, refund_payment
+from seat_map import seat_map
+from poster_store import poster_image
+from seat_counts import get_show_seat_counts
+from pricing import CONVENIENCE_FEE, GST_RATE, quote
+from seat_holds import SeatUnavailable, new_hold_token, place_hold, release_hold, unavailable_seats
+
+# Seconds between checks on an in-flight payment
+PAYMENT_POLL_INTERVAL = 1
 
 def check_authentication():
     # Check if user is logged in
@@ -11,11 +25,126 @@ def check_authentication():
         st.error("Please login to access this page.")
         st.stop()
 
+def get_hold_token():
+    if "hold_token" not in st.session_state:
+        st.session_state["hold_token"] = new_hold_token()
+    return st.session_state["hold_token"]
+
+def hold_selected_seats(current_show, gold_seats, standard_seats, occupancy):
+    # Reserve the new selection for this session; the old selection stays if a seat was taken
+    if "payment_id" in st.session_state:
+        st.session_state["seat_error"] = "Seats can't be changed while a payment is in progress."
+        return
+    if any(occupancy.is_booked('gold', seat) for seat in gold_seats) or \
+            any(occupancy.is_booked('standard', seat) for seat in standard_seats):
+        st.session_state["seat_error"] = "One or more of the selected seats is already booked."
+        return
+    try:
+        place_hold(current_show, gold_seats, standard_seats, get_hold_token())
+    except SeatUnavailable as e:
+        st.session_state["seat_error"] = str(e)
+        return
+    except Error as e:
+        st.session_state["seat_error"] = f"Error reserving seats: {e}"
+        return
+    st.session_state["held_show"] = current_show
+    st.session_state["selected_gold_seats"] = gold_seats
+    st.session_state["selected_standard_seats"] = standard_seats
+
+# Seats sold or currently held by other users; empty if the lookup fails
+def load_taken_seats(current_show):
+    try:
+        return unavailable_seats(current_show, get_hold_token())
+    except Error as e:
+        st.error(f"Error loading seat holds: {e}")
+        return set()
+
+# Showtime button label with the seats left per class, and whether it is sold
+# out; just the time when the counts or the screen size are not known
+def showtime_label(show, show_time, seat_counts, capacity):
+    if seat_counts is None or capacity is None:
+        return show, False
+    sold = seat_counts.get(show_time, {'gold': 0, 'standard': 0})
+    gold_left = max(capacity[0] - sold['gold'], 0)
+    standard_left = max(capacity[1] - sold['standard'], 0)
+    if gold_left + standard_left == 0:
+        return f"{show} · Sold out", True
+    return f"{show} · {gold_left} gold / {standard_left} standard left", False
+
+def release_held_seats():
+    # Give back seats held for a show the user moved away from,
+    # unless they are being paid for right now
+    if "payment_id" in st.session_state:
+        return
+    held_show = st.session_state.pop("held_show", None)
+    if held_show and "hold_token" in st.session_state:
+        try:
+            release_hold(held_show, st.session_state["hold_token"])
+        except Error:
+            pass  # the hold expires on its own
+
+@st.fragment(run_every=PAYMENT_POLL_INTERVAL)
+def payment_progress(payment_id):
+    payment = get_payment(payment_id)
+    if payment is None or payment["state"] != PENDING:
+        st.rerun()
+    st.info(f"⏳ Processing payment... ({time.time() - payment['submitted_at']:.0f}s)")
+
+# The charge went through but the ticket could not be saved: give the money
+# back and say what happened to it
+def refund_message(payment, reason):
+    try:
+        refund_reference = refund_payment(payment["reference"], payment["amount"], reason)
+    except Error:
+        return (f"We could not refund payment {payment['reference']} automatically. "
+                f"Please contact support with this reference.")
+    if refund_reference is None:
+        return f"Payment {payment['reference']} could not be refunded right away; the refund will be retried."
+    return f"Payment {payment['reference']} has been refunded (refund {refund_reference})."
+
+def complete_booking(booking, payment, customer_id):
+    try:
+        ticket_id = book_held_seats(booking, customer_id, get_hold_token())
+    except SeatUnavailable as e:
+        st.error(f"{e} {refund_message(payment, str(e))}")
+        st.session_state["selected_gold_seats"] = []
+        st.session_state["selected_standard_seats"] = []
+        st.session_state.pop("held_show", None)
+        return
+    except Error as e:
+        st.error(f"Error saving ticket: {e}. {refund_message(payment, f'Error saving ticket: {e}')}")
+        return
+    
+    st.session_state.pop("held_show", None)
+    st.session_state["selected_gold_seats"] = []
+    st.session_state["selected_standard_seats"] = []
+    st.session_state["confirmed_ticket"] = dict(booking, ticket_id=ticket_id, payment_reference=payment["reference"])
+
+def show_ticket_details(ticket):
+    st.success(f"🎉 Payment Successful! Booking Confirmed!")
+    st.markdown("### 🎟️ Ticket Details")
+    st.write(f"**Ticket ID:** {ticket['ticket_id']}")
+    st.write(f"**Movie:** {ticket['movie_title']}")
+    st.write(f"**Date:** {ticket['show_date']}")
+    st.write(f"**Show Time:** {ticket['show_label']}")
+    st.write(f"**Screen:** {ticket['screen_name']}")
+    st.write(f"**Gold Seats:** {sorted(ticket['gold_seats'])}")
+    st.write(f"**Standard Seats:** {sorted(ticket['standard_seats'])}")
+    
+    # Display payment details
+    st.markdown("### 💰 Payment Details")
+    st.write(f"Base Ticket Cost: ₹{ticket['base_cost']}")
+    st.write(f"GST ({GST_RATE:.0%}): ₹{ticket['gst_amount']:.2f}")
+    st.write(f"Convenience Fee: ₹{ticket['convenience_fee']}")
+    st.write(f"**Total Paid: ₹{ticket['total_cost']:.2f}**")
+    st.write(f"**Payment Reference:** {ticket['payment_reference']}")
+
 def main():
     st.set_page_config(page_title="User Dashboard", page_icon="👤", layout="wide", initial_sidebar_state="collapsed")
     
     # Verify user authentication
     check_authentication()
+    begin_query_run()
     
     # Get user information
     customer_id = st.session_state.get('customer_id')
@@ -55,47 +184,29 @@ def main():
     # Get today's date
     today = datetime.date.today()
     
-    # Fetch movies from database with their schedule
-    movies_query = """
-    SELECT DISTINCT m.movie_id, m.movie_title, m.movie_description, m.poster_url,
-        MIN(s.show_date) as start_date, MAX(s.show_date) as stop_date,
-        GROUP_CONCAT(DISTINCT TIME_FORMAT(s.show_time, '%h:%i %p') ORDER BY s.show_time SEPARATOR ',') as show_times,
-        sc.screen_name, sc.screen_number
-    FROM movie m
-    LEFT JOIN schedule s ON m.movie_id = s.movie_id
-    LEFT JOIN movie_played_on_screen mps ON m.movie_id = mps.movie_id
-    LEFT JOIN screen sc ON mps.screen_id = sc.screen_id
-    GROUP BY m.movie_id, sc.screen_name, sc.screen_number
-    """
+    # My Tickets is listed when no movie is selected
+    show_my_tickets = "customer_id" in st.session_state and "selected_movie" not in st.session_state
     
-    movie_data = execute_query(movies_query)
+    # Keys of the pages seen so far; the last one is the page on screen
+    if "ticket_pages" not in st.session_state:
+        st.session_state["ticket_pages"] = [None]
     
-    if not movie_data:
+    # Processed movie list, shared across sessions and refreshed on a TTL. It
+    # does not depend on My Tickets, so both are fetched at the same time.
+    if show_my_tickets:
+        movies, (tickets, next_key) = run_parallel(
+            (get_catalog,),
+            (get_customer_tickets, st.session_state["customer_id"],
+             st.session_state.get("ticket_view", "Upcoming") == "Upcoming",
+             st.session_state["ticket_pages"][-1],
+             st.session_state.get("ticket_page_size", MY_TICKETS_PAGE_SIZE))
+        )
+    else:
+        movies = get_catalog()
+    
+    if not movies:
         st.warning("No movies are currently available.")
     else:
-        # Process movie data
-        movies = []
-        for movie in movie_data:
-            # Format show times
-            show_times = movie['show_times'].split(',') if movie['show_times'] else []
-            
-            # Create details string
-            screen_info = f"{movie['screen_name']} (Screen {movie['screen_number']})" if movie['screen_name'] else "Standard Screen"
-            details = f"{screen_info}"
-            
-            # Create movie dictionary
-            movie_obj = {
-                "id": movie['movie_id'],
-                "name": movie['movie_title'],
-                "details": details,
-                "shows": show_times,
-                "start_date": movie['start_date'],
-                "stop_date": movie['stop_date'],
-                "description": movie['movie_description'],
-                "poster_url": movie['poster_url']
-            }
-            movies.append(movie_obj)
-        
         # Filter available movies (those with start_date <= today <= stop_date)
         available_movies = [movie for movie in movies if movie["stop_date"] and movie["stop_date"] >= today]
         
@@ -109,9 +220,10 @@ def main():
     
                     with cols[j % 6]:
                         if movie.get("poster_url"):
-                            st.image(movie["poster_url"], width=200)
+                            st.image(poster_image(movie["poster_url"], "grid"), width=200)
 
                         if st.button(movie["name"], key=f"movie_{movie['id']}"):
+                            release_held_seats()
                             st.session_state["selected_movie"] = movie  
                             st.session_state["selected_date"] = None  
                             st.session_state["selected_show"] = None  
@@ -120,12 +232,15 @@ def main():
                             st.session_state["num_seats"] = 1  # Default value
                             st.rerun()
 
+    # Screen of the selected movie, looked up once per rerun
+    screen_data = None
+
     # Step 2: Show Movie Details & Date Selection
     if "selected_movie" in st.session_state:
         movie = st.session_state["selected_movie"]
         st.markdown(f"## {movie['name']}")
         if movie.get("poster_url"):
-            st.image(movie["poster_url"], width=300)
+            st.image(poster_image(movie["poster_url"], "detail"), width=300)
         st.write(movie["details"])
         st.write(movie["description"])
 
@@ -145,14 +260,14 @@ def main():
 
         # Step 4: Showtimes Selection
         if "selected_date" in st.session_state:
-            # Get showtimes for this specific date from database
-            show_query = """
-            SELECT TIME_FORMAT(show_time, '%h:%i %p') as formatted_time, show_time 
-            FROM schedule 
-            WHERE movie_id = %s AND show_date = %s
-            ORDER BY show_time
-            """
-            show_data = execute_query(show_query, (movie["id"], st.session_state["selected_date"]))
+            # Showtimes for this date, the screen size and the seats sold per
+            # show do not depend on each other, so they are fetched together
+            show_data, screen_data, seat_counts = run_parallel(
+                (get_showtimes, movie["id"], st.session_state["selected_date"]),
+                (get_movie_screen, movie["id"]),
+                (get_show_seat_counts, movie["id"], st.session_state["selected_date"])
+            )
+            capacity = split_seats(screen_data[0]["number_of_seats"]) if screen_data else None
             
             available_shows = []
             actual_times = []
@@ -179,7 +294,9 @@ def main():
                     show_cols = st.columns(len(available_shows))
                     for i, show in enumerate(available_shows):
                         with show_cols[i]:
-                            if st.button(show, key=f"show_{i}"):
+                            label, sold_out = showtime_label(show, actual_times[i], seat_counts, capacity)
+                            if st.button(label, key=f"show_{i}", disabled=sold_out):
+                                release_held_seats()
                                 st.session_state["selected_show"] = show
                                 st.session_state["actual_show_time"] = actual_times[i] 
                                 st.session_state["selected_gold_seats"] = []
@@ -198,15 +315,25 @@ def main():
         st.markdown(f"## 🎥 Selected Show: {st.session_state['selected_show']} on {st.session_state['selected_date']}")
         st.markdown("### 🏟 Select Your Seats")
 
-        # Get the screen info for this movie
-        screen_query = """
-        SELECT sc.screen_id, sc.screen_name, sc.number_of_seats 
-        FROM screen sc
-        JOIN movie_played_on_screen mps ON sc.screen_id = mps.screen_id
-        WHERE mps.movie_id = %s
-        LIMIT 1
-        """
-        screen_data = execute_query(screen_query, (st.session_state["selected_movie"]["id"],))
+        # Screen info and the seats taken by others are independent lookups
+        current_show = None
+        if "actual_show_time" in st.session_state:
+            current_show = show_key(
+                st.session_state["selected_movie"]["id"],
+                st.session_state["selected_date"],
+                st.session_state["actual_show_time"]
+            )
+            if screen_data is None:
+                screen_data, taken_seats = run_parallel(
+                    (get_movie_screen, st.session_state["selected_movie"]["id"]),
+                    (load_taken_seats, current_show)
+                )
+            else:
+                taken_seats = load_taken_seats(current_show)
+        else:
+            if screen_data is None:
+                screen_data = get_movie_screen(st.session_state["selected_movie"]["id"])
+            taken_seats = set()
         
         if screen_data:
             screen_id = screen_data[0]["screen_id"]
@@ -214,34 +341,18 @@ def main():
             screen_name = screen_data[0]["screen_name"]
             
             # Split seats between gold and standard (e.g., 30% gold, 70% standard)
-            gold_seats_count = int(total_seats * 0.3)
-            standard_seats_count = total_seats - gold_seats_count
+            gold_seats_count, standard_seats_count = split_seats(total_seats)
             
-            # Only fetch booked seats if we have actual_show_time
-            booked_gold_seats = []
-            booked_standard_seats = []
+            # Only look up booked seats if we have actual_show_time; the
+            # occupancy needs the screen size, so it comes after the screen
+            occupancy = ShowOccupancy(gold_seats_count, standard_seats_count)
             
-            if "actual_show_time" in st.session_state:
-                # Get already booked seats for this show
-                booked_query = """
-                SELECT ticket_id, gold_seats, standard_seats
-                FROM tickets
-                WHERE movie_id = %s AND show_date = %s AND show_time = %s
-                """
-                booked_data = execute_query(
-                    booked_query, 
-                    (st.session_state["selected_movie"]["id"], 
-                    st.session_state["selected_date"],
-                    st.session_state["actual_show_time"])
-                )
-                
-                # Process booked seats
-                if booked_data:
-                    for booking in booked_data:
-                        if booking['gold_seats']:
-                            booked_gold_seats.extend([int(x) for x in booking['gold_seats'].split(',')])
-                        if booking['standard_seats']:
-                            booked_standard_seats.extend([int(x) for x in booking['standard_seats'].split(',')])
+            if current_show is not None:
+                occupancy = get_show_occupancy(current_show, gold_seats_count, standard_seats_count)
+                st.caption(f"{occupancy.remaining('gold')} gold and {occupancy.remaining('standard')} standard seats remaining")
+            
+            if "seat_error" in st.session_state:
+                st.error(st.session_state.pop("seat_error"))
             
             # Number of seats selector
             num_seats = st.number_input(
@@ -259,83 +370,75 @@ def main():
             if "selected_standard_seats" not in st.session_state:
                 st.session_state["selected_standard_seats"] = []
             
-            # Gold seats section
-            gold_seats = list(range(1, gold_seats_count + 1))
-            st.markdown("### ⭐ Gold Seats")
-            gold_cols = st.columns(6)
-            for i, seat in enumerate(gold_seats):
-                with gold_cols[i % 6]:
-                    # Check if seat is already booked
-                    is_booked = seat in booked_gold_seats
-                    is_selected = seat in st.session_state["selected_gold_seats"]
-                    
-                    # Determine button color and state
-                    if is_booked:
-                        st.button(f"{seat} 🚫", key=f"gold_{seat}", disabled=True)
-                    else:
-                        button_label = f"{seat} ✅" if is_selected else str(seat)
-                        if st.button(button_label, key=f"gold_{seat}"):
-                            if is_selected:
-                                st.session_state["selected_gold_seats"].remove(seat)
-                            elif len(st.session_state["selected_gold_seats"]) + len(st.session_state["selected_standard_seats"]) < num_seats:
-                                st.session_state["selected_gold_seats"].append(seat)
-                            st.rerun()
-            
-            # Standard seats section
-            standard_seats = list(range(1, standard_seats_count + 1))
-            st.markdown("### 💺 Standard Seats")
-            std_cols = st.columns(6)
-            for i, seat in enumerate(standard_seats):
-                with std_cols[i % 6]:
-                    # Check if seat is already booked
-                    is_booked = seat in booked_standard_seats
-                    is_selected = seat in st.session_state["selected_standard_seats"]
-                    
-                    # Determine button color and state
-                    if is_booked:
-                        st.button(f"{seat} 🚫", key=f"std_{seat}", disabled=True)
-                    else:
-                        button_label = f"{seat} ✅" if is_selected else str(seat)
-                        if st.button(button_label, key=f"std_{seat}"):
-                            if is_selected:
-                                st.session_state["selected_standard_seats"].remove(seat)
-                            elif len(st.session_state["selected_gold_seats"]) + len(st.session_state["selected_standard_seats"]) < num_seats:
-                                st.session_state["selected_standard_seats"].append(seat)
-                            st.rerun()
+            # Whole auditorium in one element; the selection comes back in one round trip
+            round_id = st.session_state.get("seat_map_round", 0)
+            selection = seat_map(
+                occupancy,
+                taken_seats,
+                st.session_state["selected_gold_seats"],
+                st.session_state["selected_standard_seats"],
+                num_seats,
+                round_id=round_id,
+                disabled=current_show is None or "payment_id" in st.session_state,
+                key="seat_map"
+            )
+            if selection and str(selection.get("nonce", "")).startswith(f"{round_id}:"):
+                st.session_state["seat_map_round"] = round_id + 1
+                if len(selection["gold"]) + len(selection["standard"]) > num_seats:
+                    st.session_state["seat_error"] = f"Please select at most {num_seats} seats."
+                else:
+                    hold_selected_seats(current_show, selection["gold"], selection["standard"], occupancy)
+                st.rerun()
             
             # Display selected seats summary
             st.markdown(f"### ✅ Selected Gold Seats: {sorted(st.session_state['selected_gold_seats'])}")
             st.markdown(f"### ✅ Selected Standard Seats: {sorted(st.session_state['selected_standard_seats'])}")
             
-            # Calculate pricing
-           # Calculate pricing
-            gold_price = 150  # Base price for gold seats
-            standard_price = 100  # Base price for standard seats
-
-            total_selected_seats = len(st.session_state["selected_gold_seats"]) + len(st.session_state["selected_standard_seats"])
-            total_gold_cost = len(st.session_state["selected_gold_seats"]) * gold_price
-            total_standard_cost = len(st.session_state["selected_standard_seats"]) * standard_price
-            base_cost = total_gold_cost + total_standard_cost
-
-            # Calculate convenience fee
-            convenience_fee = 10 * total_selected_seats  # Rs. 10 per ticket
-
-            # Calculate GST (18%)
-            gst_amount = 0.18 * base_cost
-
-            # Calculate final total
-            total_cost = base_cost + gst_amount + convenience_fee
+            # Calculate pricing; the price per seat follows the show's demand
+            price = quote(current_show, len(st.session_state["selected_gold_seats"]),
+                          len(st.session_state["selected_standard_seats"]), occupancy)
+            base_cost = price["base_cost"]
+            gst_amount = price["gst_amount"]
+            convenience_fee = price["convenience_fee"]
+            total_cost = price["total_cost"]
 
             # Display pricing breakdown
             st.markdown("### 💰 Pricing Details")
+            st.caption(f"Gold ₹{price['gold_price']} / Standard ₹{price['standard_price']} per seat for this show")
             st.write(f"Base Ticket Cost: ₹{base_cost}")
-            st.write(f"GST (18%): ₹{gst_amount:.2f}")
-            st.write(f"Convenience Fee (₹10/ticket): ₹{convenience_fee}")
+            st.write(f"GST ({GST_RATE:.0%}): ₹{gst_amount:.2f}")
+            st.write(f"Convenience Fee (₹{CONVENIENCE_FEE}/ticket): ₹{convenience_fee}")
             st.write(f"**Total Cost: ₹{total_cost:.2f}**")
 
             # Confirm Booking and Payment
             total_selected = len(st.session_state["selected_gold_seats"]) + len(st.session_state["selected_standard_seats"])
-            if total_selected > 0:
+            if "confirmed_ticket" in st.session_state:
+                show_ticket_details(st.session_state["confirmed_ticket"])
+                
+                # Clear selection after successful booking
+                if st.button("🔄 Book Another Ticket"):
+                    for key in ["selected_movie", "selected_date", "selected_show", "selected_gold_seats", "selected_standard_seats", "confirmed_ticket"]:
+                        if key in st.session_state:
+                            del st.session_state[key]
+                    st.rerun()
+            elif "payment_id" in st.session_state:
+                payment = get_payment(st.session_state["payment_id"])
+                if payment is not None and payment["state"] == PENDING:
+                    # Polls in the background and reruns the page once the gateway answers
+                    payment_progress(st.session_state["payment_id"])
+                else:
+                    st.session_state.pop("payment_id")
+                    booking = st.session_state.pop("pending_booking")
+                    if payment is None:
+                        st.error("Payment status was lost. Please try again.")
+                    elif payment["state"] == FAILED:
+                        st.error(payment["error"])
+                    else:
+                        forget_payment(payment["payment_id"])
+                        complete_booking(booking, payment, customer_id)
+                        if "confirmed_ticket" in st.session_state:
+                            st.rerun()
+            elif total_selected > 0:
                 if total_selected == num_seats:
                     # Add Payment Interface
                     st.markdown("---")
@@ -363,71 +466,26 @@ def main():
                     
                     # Payment button - This replaces the original "Confirm Booking" button
                     if st.button("💰 Make Payment", key="payment_button"):
-                        # Show processing spinner
-                        with st.spinner("Processing payment..."):
-                            import time
-                            time.sleep(5)  # Simulate payment processing
-                            
-                            # Generate ticket ID
-                            ticket_id = f"TKT-{st.session_state['selected_movie']['id']}-{random.randint(1000,9999)}"
-                            
-                            # Save tickets to database
-                            gold_seats_str = ','.join(str(seat) for seat in st.session_state["selected_gold_seats"])
-                            standard_seats_str = ','.join(str(seat) for seat in st.session_state["selected_standard_seats"])
-                            
-                            ticket_query = """
-                            INSERT INTO tickets 
-                            (ticket_id, show_time, show_date, screen_id, cost, base_cost, gst_amount, convenience_fee, 
-                            payment_method, gold_seats, standard_seats, movie_id, movie_title, customer_id) 
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                            """
-                            
-                            ticket_result = execute_update(
-                                ticket_query, 
-                                (
-                                    ticket_id,
-                                    st.session_state["actual_show_time"],
-                                    st.session_state["selected_date"],
-                                    screen_id,
-                                    total_cost,
-                                    base_cost,
-                                    gst_amount,
-                                    convenience_fee,
-                                    payment_method,
-                                    gold_seats_str if gold_seats_str else None,
-                                    standard_seats_str if standard_seats_str else None,
-                                    st.session_state["selected_movie"]["id"],
-                                    st.session_state["selected_movie"]["name"],
-                                    customer_id
-                                )
-                            )
-                            
-                            if ticket_result > 0:
-                                st.success(f"🎉 Payment Successful! Booking Confirmed!")
-                                st.markdown("### 🎟️ Ticket Details")
-                                st.write(f"**Ticket ID:** {ticket_id}")
-                                st.write(f"**Movie:** {st.session_state['selected_movie']['name']}")
-                                st.write(f"**Date:** {st.session_state['selected_date']}")
-                                st.write(f"**Show Time:** {st.session_state['selected_show']}")
-                                st.write(f"**Screen:** {screen_name}")
-                                st.write(f"**Gold Seats:** {sorted(st.session_state['selected_gold_seats'])}")
-                                st.write(f"**Standard Seats:** {sorted(st.session_state['selected_standard_seats'])}")
-                                
-                                # Display payment details
-                                st.markdown("### 💰 Payment Details")
-                                st.write(f"Base Ticket Cost: ₹{base_cost}")
-                                st.write(f"GST (18%): ₹{gst_amount:.2f}")
-                                st.write(f"Convenience Fee: ₹{convenience_fee}")
-                                st.write(f"**Total Paid: ₹{total_cost:.2f}**")
-                                
-                                # Clear selection after successful booking
-                                if st.button("🔄 Book Another Ticket"):
-                                    for key in ["selected_movie", "selected_date", "selected_show", "selected_gold_seats", "selected_standard_seats"]:
-                                        if key in st.session_state:
-                                            del st.session_state[key]
-                                    st.rerun()
-                            else:
-                                st.error("Payment failed. Please try again.")
+                        # The gateway call runs on a background worker; this run returns immediately
+                        st.session_state["pending_booking"] = {
+                            "show": current_show,
+                            "show_label": st.session_state["selected_show"],
+                            "movie_id": st.session_state["selected_movie"]["id"],
+                            "movie_title": st.session_state["selected_movie"]["name"],
+                            "show_date": st.session_state["selected_date"],
+                            "show_time": st.session_state["actual_show_time"],
+                            "screen_id": screen_id,
+                            "screen_name": screen_name,
+                            "gold_seats": list(st.session_state["selected_gold_seats"]),
+                            "standard_seats": list(st.session_state["selected_standard_seats"]),
+                            "base_cost": base_cost,
+                            "gst_amount": gst_amount,
+                            "convenience_fee": convenience_fee,
+                            "total_cost": total_cost,
+                            "payment_method": payment_method
+                        }
+                        st.session_state["payment_id"] = submit_payment(total_cost, payment_method)
+                        st.rerun()
                 else:
                     st.warning(f"Please select exactly {num_seats} seats to continue.")
             else:
@@ -436,31 +494,48 @@ def main():
             st.error("Screen information not available for this movie.")
 
     # Show booked tickets (My Tickets section)
-    if "customer_id" in st.session_state and "selected_movie" not in st.session_state:
+    if show_my_tickets:
         st.markdown("---")
         st.markdown("## 🎟 My Tickets")
         
-        tickets_query = """
-        SELECT ticket_id, movie_title, show_date, TIME_FORMAT(show_time, '%h:%i %p') as formatted_time,
-               gold_seats, standard_seats, cost 
-        FROM tickets 
-        WHERE customer_id = %s
-        ORDER BY show_date DESC, show_time DESC
-        """
-        tickets = execute_query(tickets_query, (st.session_state["customer_id"],))
+        def reset_ticket_pages():
+            st.session_state["ticket_pages"] = [None]
+        
+        col1, col2 = st.columns([3, 1])
+        ticket_view = col1.radio("Show", ["Upcoming", "Past"], horizontal=True, key="ticket_view",
+                                 on_change=reset_ticket_pages)
+        page_size = col2.selectbox("Per page", [5, 10, 25, 50], index=1, key="ticket_page_size",
+                                   on_change=reset_ticket_pages)
+        
+        # tickets and next_key were fetched alongside the catalog above
+        ticket_pages = st.session_state["ticket_pages"]
         
-        if tickets and len(tickets) > 0:
+        if tickets:
+            first = (len(ticket_pages) - 1) * page_size + 1
+            st.caption(f"Showing tickets {first}–{first + len(tickets) - 1}")
             for ticket in tickets:
                 with st.expander(f"🎬 {ticket['movie_title']} - {ticket['show_date']} - {ticket['formatted_time']}"):
                     st.write(f"**Ticket ID:** {ticket['ticket_id']}")
                     st.write(f"**Gold Seats:** {ticket['gold_seats'] if ticket['gold_seats'] else 'None'}")
                     st.write(f"**Standard Seats:** {ticket['standard_seats'] if ticket['standard_seats'] else 'None'}")
                     st.write(f"**Cost:** ₹{ticket['cost']}")
-        else:
-            st.info("You haven't booked any tickets yet.")
+            
+            col1, col2 = st.columns(2)
+            if len(ticket_pages) > 1 and col1.button("⬅ Previous", key="tickets_previous"):
+                ticket_pages.pop()
+                st.rerun()
+            if next_key is not None and col2.button("Load more ➡", key="tickets_more"):
+                ticket_pages.append(next_key)
+                st.rerun()
+        elif tickets is not None:
+            if ticket_view == "Upcoming":
+                st.info("You have no upcoming shows.")
+            else:
+                st.info("You have no past tickets.")
             
     # Go Back Option
-    if "selected_movie" in st.session_state and st.button("🔙 Go Back", key="go_back"):
+    if "selected_movie" in st.session_state and st.button("🔙 Go Back", key="go_back", disabled="payment_id" in st.session_state):
+        release_held_seats()
         st.session_state.pop("selected_movie", None)
         st.session_state.pop("selected_date", None)
         st.session_state.pop("selected_show", None)
@@ -470,7 +545,10 @@ def main():
     
     # Logout button in sidebar
     st.sidebar.title("User Options")
+    if st.session_state.get("is_admin") and st.sidebar.toggle("🐞 Query debug panel", key="show_query_debug"):
+        render_query_debug_panel()
     if st.sidebar.button("Logout"):
+        release_held_seats()
         for key in list(st.session_state.keys()):
             del st.session_state[key]
         spb.switch_page("Login")
@@ -0,0 +1,186 @@
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from db_utils import transaction
+
+# Worker threads that talk to the gateway; script threads never wait on it
+MAX_WORKERS = 32
+
+# Finished payments are kept this long so the page can pick up the result
+RESULT_TTL = 900
+
+PENDING = 'pending'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+class PaymentDeclined(Exception):
+    pass
+
+
+# Gateways implement charge(); it runs on a worker thread, may block, and
+# returns a gateway reference or raises PaymentDeclined. refund() gives back a
+# charge by its reference and returns a refund reference or raises.
+class PaymentGateway:
+    def charge(self, amount, payment_method, details):
+        raise NotImplementedError
+
+    def refund(self, reference, amount):
+        raise NotImplementedError
+
+
+# Local stand-in for a real gateway with configurable latency and failure rate
+class StubGateway(PaymentGateway):
+    def __init__(self, latency=5.0, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    def charge(self, amount, payment_method, details):
+        time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise PaymentDeclined("Payment declined by the bank. Please try again.")
+        return f"STUB-{uuid.uuid4().hex[:12].upper()}"
+
+    def refund(self, reference, amount):
+        if random.random() < self.failure_rate:
+            raise PaymentDeclined("Refund rejected by the bank.")
+        return f"STUB-RF-{uuid.uuid4().hex[:12].upper()}"
+
+
+# Runs charges on a shared thread pool and keeps their status by payment id
+class PaymentProcessor:
+    def __init__(self, gateway, max_workers=MAX_WORKERS, result_ttl=RESULT_TTL):
+        self.gateway = gateway
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="payment")
+        self._payments = {}
+        self._lock = threading.Lock()
+
+    def submit(self, amount, payment_method, details=None, on_complete=None):
+        payment_id = uuid.uuid4().hex
+        with self._lock:
+            self._prune()
+            self._payments[payment_id] = {
+                'payment_id': payment_id,
+                'state': PENDING,
+                'amount': amount,
+                'payment_method': payment_method,
+                'reference': None,
+                'error': None,
+                'submitted_at': time.time(),
+                'completed_at': None
+            }
+        self._executor.submit(self._run, payment_id, amount, payment_method, details or {}, on_complete)
+        return payment_id
+
+    def _run(self, payment_id, amount, payment_method, details, on_complete):
+        try:
+            reference = self.gateway.charge(amount, payment_method, details)
+            update = {'state': SUCCEEDED, 'reference': reference}
+        except PaymentDeclined as e:
+            update = {'state': FAILED, 'error': str(e)}
+        except Exception as e:
+            update = {'state': FAILED, 'error': f"Payment could not be processed: {e}"}
+        update['completed_at'] = time.time()
+
+        with self._lock:
+            payment = self._payments.get(payment_id)
+            if payment is None:
+                return
+            payment.update(update)
+            result = dict(payment)
+        if on_complete is not None:
+            on_complete(result)
+
+    # Snapshot of a payment, or None if it is unknown or was pruned
+    def status(self, payment_id):
+        with self._lock:
+            payment = self._payments.get(payment_id)
+            return dict(payment) if payment else None
+
+    def forget(self, payment_id):
+        with self._lock:
+            self._payments.pop(payment_id, None)
+
+    def _prune(self):
+        cutoff = time.time() - self.result_ttl
+        expired = [payment_id for payment_id, payment in self._payments.items()
+                   if payment['completed_at'] and payment['completed_at'] < cutoff]
+        for payment_id in expired:
+            del self._payments[payment_id]
+
+    def pending_count(self):
+        with self._lock:
+            return sum(1 for payment in self._payments.values() if payment['state'] == PENDING)
+
+
+_processor = None
+_processor_lock = threading.Lock()
+
+def get_processor():
+    global _processor
+    if _processor is None:
+        with _processor_lock:
+            if _processor is None:
+                _processor = PaymentProcessor(StubGateway())
+    return _processor
+
+# Swap in a different gateway, e.g. a real provider or a faster stub for load tests
+def set_gateway(gateway):
+    get_processor().gateway = gateway
+
+def submit_payment(amount, payment_method, details=None, on_complete=None):
+    return get_processor().submit(amount, payment_method, details, on_complete)
+
+def get_payment(payment_id):
+    return get_processor().status(payment_id)
+
+def forget_payment(payment_id):
+    get_processor().forget(payment_id)
+
+# Give back a charge whose booking could not be saved. Returns the refund
+# reference, or None when the gateway did not take the refund; the charge is
+# then kept in pending_refunds for retry_pending_refunds(). Raises Error only
+# if that record cannot be written either.
+def refund_payment(reference, amount, reason):
+    try:
+        return get_processor().gateway.refund(reference, amount)
+    except Exception as e:
+        with transaction() as uow:
+            uow.execute("""
+            INSERT INTO pending_refunds (payment_reference, amount, reason, last_error, created_at)
+            VALUES (%s, %s, %s, %s, NOW())
+            ON DUPLICATE KEY UPDATE last_error = VALUES(last_error)
+            """, (reference, amount, reason[:255], str(e)[:255]))
+        return None
+
+# Try every refund still owed again; returns how many were tried and refunded
+def retry_pending_refunds():
+    with transaction() as uow:
+        pending = uow.fetch("""
+        SELECT payment_reference, amount FROM pending_refunds WHERE refunded_at IS NULL
+        """)
+    refunded = 0
+    for reference, amount in pending:
+        try:
+            refund_reference = get_processor().gateway.refund(reference, amount)
+        except Exception as e:
+            update = ("UPDATE pending_refunds SET last_error = %s WHERE payment_reference = %s",
+                      (str(e)[:255], reference))
+        else:
+            refunded += 1
+            update = ("""
+            UPDATE pending_refunds SET refunded_at = NOW(), refund_reference = %s, last_error = NULL
+            WHERE payment_reference = %s
+            """, (refund_reference, reference))
+        with transaction() as uow:
+            uow.execute(*update)
+    return {'tried': len(pending), 'refunded': refunded}
+
+def pending_refund_count():
+    with transaction() as uow:
+        row = uow.fetch_one("SELECT COUNT(*) FROM pending_refunds WHERE refunded_at IS NULL")
+    return row[0] if row else 0
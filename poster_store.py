@@ -0,0 +1,180 @@
+import hashlib
+import io
+import ipaddress
+import logging
+import os
+import socket
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# Posters are downloaded once and kept on disk as small JPEG thumbnails, one
+# per width the pages draw them at, so sessions are sent a few KB from the
+# app instead of each browser pulling the full image from wherever the admin
+# found it on every rerun.
+POSTER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'posters')
+POSTER_WIDTHS = {'grid': 200, 'detail': 300}
+THUMBNAIL_QUALITY = 85
+
+# Disk budget for thumbnails; the least recently shown are deleted beyond it
+POSTER_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+FETCH_TIMEOUT = 10
+MAX_POSTER_BYTES = 10 * 1024 * 1024
+FETCH_SCHEMES = ('http', 'https')
+READ_CHUNK_BYTES = 64 * 1024
+# A thumbnail's mtime is refreshed at most this often when it is shown
+POSTER_TOUCH_SECONDS = 3600
+# A URL that failed to download is not tried again for this many seconds
+FETCH_RETRY_SECONDS = 300
+
+_log = logging.getLogger('mtbs.posters')
+
+_fetches = ThreadPoolExecutor(max_workers=4, thread_name_prefix='mtbs-poster')
+_pending = {}  # url -> future of a background ingest
+_failed = {}  # url -> monotonic time of the last failed download
+_lock = threading.Lock()
+_evict_lock = threading.Lock()
+
+def _thumbnail_path(url, width):
+    digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    return os.path.join(POSTER_DIR, f"{digest}_{width}.jpg")
+
+# Poster URLs are typed in by admins, so only fetch plain web addresses on
+# public hosts: no file:// or other schemes and nothing that resolves to a
+# loopback, private, link-local (e.g. the 169.254.169.254 metadata service)
+# or otherwise reserved address. Raises ValueError.
+def _check_url(url):
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme.lower() not in FETCH_SCHEMES or not parts.hostname:
+        raise ValueError(f"not an http(s) URL: {url}")
+    port = parts.port or (443 if parts.scheme.lower() == 'https' else 80)
+    for *_, sockaddr in socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP):
+        address = ipaddress.ip_address(sockaddr[0].split('%')[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise ValueError(f"{parts.hostname} resolves to a non-public address ({address})")
+
+# Redirects are checked like the URL itself
+class _CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        _check_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+_opener = urllib.request.build_opener(_CheckedRedirectHandler)
+
+def _download(url):
+    _check_url(url)
+    request = urllib.request.Request(url, headers={'User-Agent': 'MTBS poster cache'})
+    with _opener.open(request, timeout=FETCH_TIMEOUT) as response:
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit() and int(length) > MAX_POSTER_BYTES:
+            raise ValueError(f"poster larger than {MAX_POSTER_BYTES} bytes")
+        data = bytearray()
+        while True:
+            chunk = response.read(READ_CHUNK_BYTES)
+            if not chunk:
+                break
+            data += chunk
+            if len(data) > MAX_POSTER_BYTES:
+                raise ValueError(f"poster larger than {MAX_POSTER_BYTES} bytes")
+    return bytes(data)
+
+# Download a poster and write a thumbnail for every width; returns True on
+# success. Called when an admin adds a movie and in the background the first
+# time a page asks for a poster that is not on disk yet.
+def ingest_poster(url):
+    try:
+        image = Image.open(io.BytesIO(_download(url)))
+        image.load()
+        os.makedirs(POSTER_DIR, exist_ok=True)
+        for width in POSTER_WIDTHS.values():
+            thumbnail = image.convert('RGB')
+            thumbnail.thumbnail((width, width * 3), Image.LANCZOS)
+            path = _thumbnail_path(url, width)
+            # Write then rename so a reader never sees half a file
+            partial = f"{path}.{threading.get_ident()}.tmp"
+            thumbnail.save(partial, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+            os.replace(partial, path)
+    except Exception as e:
+        _log.warning("Could not cache poster %s: %s", url, e)
+        with _lock:
+            _failed[url] = time.monotonic()
+        return False
+    with _lock:
+        _failed.pop(url, None)
+    _evict()
+    return True
+
+def _ingest_in_background(url):
+    with _lock:
+        if url in _pending:
+            return
+        failed_at = _failed.get(url)
+        if failed_at is not None and time.monotonic() - failed_at < FETCH_RETRY_SECONDS:
+            return
+        future = _fetches.submit(ingest_poster, url)
+        _pending[url] = future
+    future.add_done_callback(lambda _: _forget_pending(url))
+
+def _forget_pending(url):
+    with _lock:
+        _pending.pop(url, None)
+
+# What to pass to st.image for a poster drawn at 'grid' or 'detail' size: the
+# cached thumbnail file, or the original URL while the thumbnail is still
+# being made (or could not be made)
+def poster_image(url, size='grid'):
+    path = _thumbnail_path(url, POSTER_WIDTHS[size])
+    try:
+        # The file's mtime is its last use, which is what eviction goes by;
+        # it only needs to be roughly right, so skip the write most of the time
+        if time.time() - os.stat(path).st_mtime > POSTER_TOUCH_SECONDS:
+            os.utime(path)
+        return path
+    except FileNotFoundError:
+        _ingest_in_background(url)
+        return url
+
+# Delete the least recently used thumbnails until the store fits its budget
+def _evict():
+    with _evict_lock:
+        try:
+            names = os.listdir(POSTER_DIR)
+        except FileNotFoundError:
+            return
+        files = []
+        for name in names:
+            if not name.endswith('.jpg'):
+                continue
+            try:
+                stat = os.stat(os.path.join(POSTER_DIR, name))
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= POSTER_CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(os.path.join(POSTER_DIR, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+# Thumbnails on disk and their total size, for the admin stats panel
+def poster_cache_stats():
+    try:
+        sizes = [os.path.getsize(os.path.join(POSTER_DIR, name))
+                 for name in os.listdir(POSTER_DIR) if name.endswith('.jpg')]
+    except FileNotFoundError:
+        sizes = []
+    with _lock:
+        pending, failed = len(_pending), len(_failed)
+    return {'thumbnails': len(sizes), 'bytes': sum(sizes), 'max_bytes': POSTER_CACHE_MAX_BYTES,
+            'downloading': pending, 'failed': failed}
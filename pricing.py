@@ -0,0 +1,229 @@
+import datetime
+import threading
+import time
+
+import numpy as np
+
+from db_utils import execute_query, run_parallel
+from seat_index import split_seats
+
+# Ticket prices follow demand. Every upcoming show gets a multiplier on the
+# base price of each seat class from how full that class is, the day of the
+# week, the time of day and how far away the show is. Prices for the whole
+# catalog are computed at once with NumPy arrays and kept in a process-wide
+# price book; a booking reprices just its own show.
+
+BASE_PRICES = {'gold': 150, 'standard': 100}
+GST_RATE = 0.18
+CONVENIENCE_FEE = 10  # per ticket
+
+# Fraction of a class sold -> multiplier, interpolated between the points
+OCCUPANCY_POINTS = [0.0, 0.5, 0.8, 1.0]
+OCCUPANCY_MULTIPLIERS = [0.9, 1.0, 1.15, 1.3]
+# Monday .. Sunday
+WEEKDAY_MULTIPLIERS = [0.95, 0.95, 0.95, 1.0, 1.1, 1.2, 1.15]
+# Shows starting from each hour on (morning, afternoon, evening, late night)
+TIME_SLOT_HOURS = [0, 12, 17, 22]
+TIME_SLOT_MULTIPLIERS = [0.9, 1.0, 1.1, 1.0]
+# Days until the show -> multiplier; booking early is slightly cheaper
+LEAD_DAYS_POINTS = [0, 1, 7, 14]
+LEAD_DAYS_MULTIPLIERS = [1.05, 1.0, 0.95, 0.9]
+# Whatever the factors say, a price stays within these multiples of the base
+MIN_MULTIPLIER = 0.8
+MAX_MULTIPLIER = 1.5
+
+# Shows priced ahead, and how long the book is trusted before it is rebuilt
+# (picks up bookings made by other processes and schedule changes)
+PRICING_HORIZON_DAYS = 60
+PRICE_REFRESH_SECONDS = 300
+
+# Price per seat of each show: arrays in, (gold_prices, standard_prices) out,
+# whole rupees. show_dates are date ordinals, show_minutes minutes after
+# midnight, *_sold and *_capacity seats per class; today is a date.
+def price_shows(show_dates, show_minutes, gold_sold, gold_capacity, standard_sold, standard_capacity, today):
+    show_dates = np.asarray(show_dates, dtype=np.int64)
+    show_minutes = np.asarray(show_minutes, dtype=np.int64)
+    weekday = (show_dates - 1) % 7  # date ordinal 1 (0001-01-01) was a Monday
+    shared = (np.asarray(WEEKDAY_MULTIPLIERS)[weekday]
+              * np.asarray(TIME_SLOT_MULTIPLIERS)[np.digitize(show_minutes // 60, TIME_SLOT_HOURS) - 1]
+              * np.interp(show_dates - today.toordinal(), LEAD_DAYS_POINTS, LEAD_DAYS_MULTIPLIERS))
+    prices = []
+    for seat_class, sold, capacity in (('gold', gold_sold, gold_capacity),
+                                       ('standard', standard_sold, standard_capacity)):
+        capacity = np.maximum(np.asarray(capacity, dtype=np.float64), 1)
+        occupancy = np.clip(np.asarray(sold, dtype=np.float64) / capacity, 0, 1)
+        multiplier = np.clip(shared * np.interp(occupancy, OCCUPANCY_POINTS, OCCUPANCY_MULTIPLIERS),
+                             MIN_MULTIPLIER, MAX_MULTIPLIER)
+        prices.append(np.rint(BASE_PRICES[seat_class] * multiplier).astype(np.int64))
+    return prices[0], prices[1]
+
+def _minutes(show_time):
+    if isinstance(show_time, datetime.timedelta):
+        return int(show_time.total_seconds()) // 60
+    return show_time.hour * 60 + show_time.minute
+
+
+# Prices of every upcoming show, keyed like seat_index.show_key. Alongside each
+# price the inputs are kept, so a booking reprices its show without a query.
+class PriceBook:
+    def __init__(self, horizon_days=PRICING_HORIZON_DAYS, max_age=PRICE_REFRESH_SECONDS):
+        self.horizon_days = horizon_days
+        self.max_age = max_age
+        self._shows = {}  # show_key -> [date_ordinal, minutes, gold_sold, gold_capacity, standard_sold, standard_capacity]
+        self._prices = {}  # show_key -> (gold_price, standard_price)
+        self._built_at = None
+        self._built_on = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def _load(self, today):
+        until = today + datetime.timedelta(days=self.horizon_days)
+        rules, exceptions, counts, screens = run_parallel(
+            (execute_query, """
+            SELECT r.movie_id, r.start_date, r.end_date, rt.show_time
+            FROM schedule_rules r
+            JOIN schedule_rule_times rt ON rt.rule_id = r.rule_id
+            WHERE r.end_date >= %s AND r.start_date <= %s
+            """, (today, until), 'pricing.rules'),
+            (execute_query, """
+            SELECT movie_id, show_date, show_time, action
+            FROM schedule_exceptions
+            WHERE show_date BETWEEN %s AND %s
+            """, (today, until), 'pricing.exceptions'),
+            (execute_query, """
+            SELECT movie_id, show_date, show_time, gold_booked, standard_booked
+            FROM show_seat_counts
+            WHERE show_date BETWEEN %s AND %s
+            """, (today, until), 'pricing.seat_counts'),
+            (execute_query, """
+            SELECT mps.movie_id, MIN(sc.number_of_seats) as number_of_seats
+            FROM movie_played_on_screen mps
+            JOIN screen sc ON sc.screen_id = mps.screen_id
+            GROUP BY mps.movie_id
+            """, None, 'pricing.screens')
+        )
+        if rules is None or exceptions is None or counts is None or screens is None:
+            return None
+
+        # Expand every rule into one show per day of it inside the horizon
+        first = np.array([max(rule['start_date'], today).toordinal() for rule in rules], dtype=np.int64)
+        last = np.array([min(rule['end_date'], until).toordinal() for rule in rules], dtype=np.int64)
+        days = np.maximum(last - first + 1, 0)
+        rule_of_show = np.repeat(np.arange(len(rules)), days)
+        day_offsets = np.arange(days.sum()) - np.repeat(np.cumsum(days) - days, days)
+        show_dates = first[rule_of_show] + day_offsets
+
+        keys = {(rules[rule]['movie_id'], datetime.date.fromordinal(int(show_date)), rules[rule]['show_time'])
+                for rule, show_date in zip(rule_of_show.tolist(), show_dates.tolist())}
+        for row in exceptions:
+            key = (row['movie_id'], row['show_date'], row['show_time'])
+            if row['action'] == 'cancel':
+                keys.discard(key)
+            else:
+                keys.add(key)
+
+        seats = {row['movie_id']: split_seats(row['number_of_seats']) for row in screens}
+        sold = {(row['movie_id'], row['show_date'], row['show_time']): (row['gold_booked'], row['standard_booked'])
+                for row in counts}
+        shows = {}
+        for key in keys:
+            if key[0] in seats:
+                gold_sold, standard_sold = sold.get(key, (0, 0))
+                gold_capacity, standard_capacity = seats[key[0]]
+                shows[key] = [key[1].toordinal(), _minutes(key[2]), gold_sold, gold_capacity,
+                              standard_sold, standard_capacity]
+        return shows
+
+    @staticmethod
+    def _price(shows, today):
+        if not shows:
+            return {}
+        keys = list(shows)
+        columns = np.array([shows[key] for key in keys], dtype=np.int64).T
+        gold_prices, standard_prices = price_shows(*columns, today)
+        return dict(zip(keys, zip(gold_prices.tolist(), standard_prices.tolist())))
+
+    # Rebuild the whole book: four queries and one vectorised pass
+    def refresh(self):
+        today = datetime.date.today()
+        shows = self._load(today)
+        if shows is None:
+            return False
+        prices = self._price(shows, today)
+        with self._lock:
+            self._shows, self._prices = shows, prices
+            self._built_at, self._built_on = time.monotonic(), today
+        return True
+
+    def _stale(self):
+        return (self._built_at is None or time.monotonic() - self._built_at > self.max_age
+                or self._built_on != datetime.date.today())
+
+    # {'gold': price, 'standard': price} per seat of one show. A show the book
+    # does not know yet (added since the last refresh) is priced from occupancy
+    # (a seat_index.ShowOccupancy) and kept.
+    def get(self, show_key, occupancy=None):
+        if self._stale() and self._refresh_lock.acquire(blocking=self._built_at is None):
+            try:
+                if self._stale():
+                    self.refresh()
+            finally:
+                self._refresh_lock.release()
+        with self._lock:
+            prices = self._prices.get(show_key)
+        if prices is None:
+            gold_capacity = occupancy.capacity('gold') if occupancy else 0
+            standard_capacity = occupancy.capacity('standard') if occupancy else 0
+            inputs = [show_key[1].toordinal(), _minutes(show_key[2]),
+                      gold_capacity - occupancy.remaining('gold') if occupancy else 0, gold_capacity,
+                      standard_capacity - occupancy.remaining('standard') if occupancy else 0, standard_capacity]
+            prices = self._price({show_key: inputs}, datetime.date.today())[show_key]
+            if occupancy is not None:
+                with self._lock:
+                    self._shows[show_key] = inputs
+                    self._prices[show_key] = prices
+        return {'gold': prices[0], 'standard': prices[1]}
+
+    # A booking sold seats of a show: update its occupancy and reprice it alone
+    def seats_sold(self, show_key, gold_count, standard_count):
+        with self._lock:
+            inputs = self._shows.get(show_key)
+            if inputs is None:
+                return
+            inputs[2] += gold_count
+            inputs[4] += standard_count
+            self._prices[show_key] = self._price({show_key: inputs}, datetime.date.today())[show_key]
+
+    def stats(self):
+        with self._lock:
+            return {'shows': len(self._prices), 'built_on': self._built_on,
+                    'age': None if self._built_at is None else round(time.monotonic() - self._built_at, 1)}
+
+
+_book = PriceBook()
+
+def get_show_prices(show_key, occupancy=None):
+    return _book.get(show_key, occupancy)
+
+def note_seats_sold(show_key, gold_count, standard_count):
+    _book.seats_sold(show_key, gold_count, standard_count)
+
+def price_book_stats():
+    return _book.stats()
+
+# Checkout breakdown for the selected seats of a show; the same figures are
+# stored on the ticket. Before a show time is picked (show_key None) the base
+# prices are shown.
+def quote(show_key, gold_count, standard_count, occupancy=None):
+    prices = BASE_PRICES if show_key is None else get_show_prices(show_key, occupancy)
+    base_cost = prices['gold'] * gold_count + prices['standard'] * standard_count
+    gst_amount = round(GST_RATE * base_cost, 2)
+    convenience_fee = CONVENIENCE_FEE * (gold_count + standard_count)
+    return {
+        'gold_price': prices['gold'],
+        'standard_price': prices['standard'],
+        'base_cost': base_cost,
+        'gst_amount': gst_amount,
+        'convenience_fee': convenience_fee,
+        'total_cost': round(base_cost + gst_amount + convenience_fee, 2)
+    }
@@ -0,0 +1,39 @@
+import time
+
+import streamlit as st
+
+from db_utils import get_query_run, get_query_site_stats, SLOW_QUERY_THRESHOLD
+
+# Admin-only panel: queries and DB time of this rerun, plus process-wide hot spots
+def render_query_debug_panel():
+    run = get_query_run()
+    st.markdown("---")
+    st.markdown("### 🐞 Query Debug")
+
+    if run is None:
+        st.info("No queries recorded for this run.")
+        return
+
+    elapsed = time.perf_counter() - run['started']
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Queries this rerun", run['queries'])
+    col2.metric("DB time", f"{run['db_time'] * 1000:.1f} ms")
+    col3.metric("Script time", f"{elapsed * 1000:.1f} ms")
+
+    sites = sorted(run['sites'].items(), key=lambda item: item[1]['time'], reverse=True)
+    st.dataframe(
+        [{'call site': label, 'calls': site['calls'], 'time (ms)': round(site['time'] * 1000, 2), 'rows': site['rows']}
+         for label, site in sites],
+        use_container_width=True
+    )
+
+    with st.expander("Since process start"):
+        totals = sorted(get_query_site_stats().items(), key=lambda item: item[1]['time'], reverse=True)
+        st.dataframe(
+            [{'call site': label, 'calls': site['calls'], 'total (ms)': round(site['time'] * 1000, 1),
+              'avg (ms)': round(site['time'] * 1000 / site['calls'], 2), 'max (ms)': round(site['max_time'] * 1000, 2),
+              'rows': site['rows']}
+             for label, site in totals[:50]],
+            use_container_width=True
+        )
+        st.caption(f"Queries slower than {SLOW_QUERY_THRESHOLD * 1000:.0f} ms are written to the slow query log.")
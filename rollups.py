@@ -0,0 +1,153 @@
+# Pre-aggregated sales for the admin analytics view.
+#
+# daily_sales has one row per show date, movie, screen and show slot with the
+# tickets, seats and revenue sold for it, plus how many shows sold anything and
+# their seats (for occupancy). Every booking adds to its row in the booking
+# transaction, so reports sum a few rows per day instead of scanning tickets.
+# rebuild() recomputes rows from the live and archived tickets, e.g. after a
+# manual data fix:
+#
+#     python rollups.py --from 2024-01-01 --to 2024-12-31
+import argparse
+import datetime
+import json
+import time
+
+from db_utils import execute_query, transaction
+
+# Slot of a show by the hour it starts at: (first hour, slot)
+SHOW_SLOTS = [(0, 'morning'), (12, 'afternoon'), (17, 'evening'), (22, 'late')]
+
+# Days recomputed per transaction by rebuild()
+REBUILD_BATCH_DAYS = 31
+
+# The report dimensions: label -> (column of daily_sales, display expression, join)
+DIMENSIONS = {
+    'Movie': ('ds.movie_id', "COALESCE(m.movie_title, CONCAT('Movie ', ds.movie_id))",
+              "LEFT JOIN movie m ON m.movie_id = ds.movie_id"),
+    'Screen': ('ds.screen_id', "COALESCE(sc.screen_name, 'Unknown screen')",
+               "LEFT JOIN screen sc ON sc.screen_id = ds.screen_id"),
+    'Day': ('ds.show_date', "ds.show_date", ""),
+    'Show slot': ('ds.slot', "ds.slot", ""),
+}
+
+def show_slot(show_time):
+    if isinstance(show_time, datetime.timedelta):
+        hour = int(show_time.total_seconds()) // 3600
+    else:
+        hour = show_time.hour
+    slot = SHOW_SLOTS[0][1]
+    for first_hour, name in SHOW_SLOTS:
+        if hour >= first_hour:
+            slot = name
+    return slot
+
+def _slot_sql(column):
+    cases = " ".join(f"WHEN HOUR({column}) >= {first_hour} THEN '{name}'" for first_hour, name in reversed(SHOW_SLOTS))
+    return f"CASE {cases} END"
+
+def _seat_count_sql(column):
+    return f"IF(COALESCE({column}, '') = '', 0, CHAR_LENGTH({column}) - CHAR_LENGTH(REPLACE({column}, ',', '')) + 1)"
+
+# Add one booking to its rollup row; call inside the booking transaction.
+# first_sale is True when this is the show's first ticket, which adds the show
+# and its seats to the row's capacity.
+def record_sale(uow, booking, first_sale):
+    capacity = 0
+    if first_sale:
+        screen = uow.fetch_one("SELECT number_of_seats FROM screen WHERE screen_id = %s", (booking["screen_id"],))
+        capacity = screen[0] if screen else 0
+    uow.execute("""
+    INSERT INTO daily_sales (show_date, movie_id, screen_id, slot, tickets, gold_seats, standard_seats,
+                             revenue, shows, capacity)
+    VALUES (%s, %s, %s, %s, 1, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE tickets = tickets + 1,
+                            gold_seats = gold_seats + VALUES(gold_seats),
+                            standard_seats = standard_seats + VALUES(standard_seats),
+                            revenue = revenue + VALUES(revenue),
+                            shows = shows + VALUES(shows),
+                            capacity = capacity + VALUES(capacity)
+    """, (booking["show_date"], booking["movie_id"], booking["screen_id"] or 0, show_slot(booking["show_time"]),
+          len(booking["gold_seats"]), len(booking["standard_seats"]), booking["total_cost"],
+          1 if first_sale else 0, capacity))
+
+# Recompute the rows of show dates from_date..to_date from the tickets
+def rebuild_range(uow, from_date, to_date):
+    uow.execute("DELETE FROM daily_sales WHERE show_date BETWEEN %s AND %s", (from_date, to_date))
+    return uow.execute(f"""
+    INSERT INTO daily_sales (show_date, movie_id, screen_id, slot, tickets, gold_seats, standard_seats,
+                             revenue, shows, capacity)
+    SELECT per_show.show_date, per_show.movie_id, per_show.screen_id, per_show.slot,
+           SUM(per_show.tickets), SUM(per_show.gold_seats), SUM(per_show.standard_seats),
+           SUM(per_show.revenue), COUNT(*), SUM(COALESCE(sc.number_of_seats, 0))
+    FROM (
+        SELECT t.show_date, t.movie_id, COALESCE(t.screen_id, 0) as screen_id, {_slot_sql('t.show_time')} as slot,
+               COUNT(*) as tickets, SUM({_seat_count_sql('t.gold_seats')}) as gold_seats,
+               SUM({_seat_count_sql('t.standard_seats')}) as standard_seats, SUM(COALESCE(t.cost, 0)) as revenue
+        FROM (
+            SELECT show_date, show_time, movie_id, screen_id, gold_seats, standard_seats, cost
+            FROM tickets WHERE show_date BETWEEN %s AND %s
+            UNION ALL
+            SELECT show_date, show_time, movie_id, screen_id, gold_seats, standard_seats, cost
+            FROM tickets_history WHERE show_date BETWEEN %s AND %s
+        ) t
+        GROUP BY t.show_date, t.movie_id, COALESCE(t.screen_id, 0), t.show_time
+    ) per_show
+    LEFT JOIN screen sc ON sc.screen_id = per_show.screen_id
+    GROUP BY per_show.show_date, per_show.movie_id, per_show.screen_id, per_show.slot
+    """, (from_date, to_date, from_date, to_date))
+
+# Rebuild every show date from from_date to to_date (default: all tickets),
+# REBUILD_BATCH_DAYS per transaction. Returns the dates covered and rows written.
+def rebuild(from_date=None, to_date=None):
+    started = time.perf_counter()
+    if from_date is None or to_date is None:
+        bounds = execute_query("""
+        SELECT MIN(first_date) as first_date, MAX(last_date) as last_date FROM (
+            SELECT MIN(show_date) as first_date, MAX(show_date) as last_date FROM tickets
+            UNION ALL
+            SELECT MIN(show_date), MAX(show_date) FROM tickets_history
+        ) dates
+        """, primary=True)
+        if not bounds or bounds[0]['first_date'] is None:
+            return {'from_date': from_date, 'to_date': to_date, 'rows': 0, 'elapsed': 0.0}
+        from_date = from_date or bounds[0]['first_date']
+        to_date = to_date or bounds[0]['last_date']
+    rows = 0
+    batch_start = from_date
+    while batch_start <= to_date:
+        batch_end = min(batch_start + datetime.timedelta(days=REBUILD_BATCH_DAYS - 1), to_date)
+        with transaction() as uow:
+            rows += rebuild_range(uow, batch_start, batch_end)
+        batch_start = batch_end + datetime.timedelta(days=1)
+    return {'from_date': from_date, 'to_date': to_date, 'rows': rows,
+            'elapsed': round(time.perf_counter() - started, 3)}
+
+# Sales between two show dates grouped by one of DIMENSIONS, best selling
+# first: name, tickets, seats, revenue and occupancy of the shows that sold
+def sales_report(dimension, from_date, to_date):
+    column, name, join = DIMENSIONS[dimension]
+    return execute_query(f"""
+    SELECT {name} as name, SUM(ds.tickets) as tickets, SUM(ds.gold_seats + ds.standard_seats) as seats,
+           SUM(ds.revenue) as revenue, SUM(ds.shows) as shows,
+           ROUND(100 * SUM(ds.gold_seats + ds.standard_seats) / NULLIF(SUM(ds.capacity), 0), 1) as occupancy
+    FROM daily_sales ds
+    {join}
+    WHERE ds.show_date BETWEEN %s AND %s
+    GROUP BY {column}, {name}
+    ORDER BY revenue DESC
+    """, (from_date, to_date))
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the daily_sales rollup from the tickets.")
+    parser.add_argument('--from', dest='from_date', type=datetime.date.fromisoformat,
+                        help="first show date (default: earliest ticket)")
+    parser.add_argument('--to', dest='to_date', type=datetime.date.fromisoformat,
+                        help="last show date (default: latest ticket)")
+    args = parser.parse_args()
+
+    print(json.dumps(rebuild(args.from_date, args.to_date), indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+import time
+
+from db_utils import transaction
+from schedules import add_schedule_rule
+
+# Insert a movie together with its screen link and schedule rule in a single
+# transaction. Returns the new movie id, shows scheduled, rows written and
+# elapsed seconds; on any database error everything is rolled back and the
+# error re-raised.
+def add_movie_with_schedule(movie_title, movie_desc, poster_url, admin_id, web_id,
+                            screen_id, release_date, screen_till, show_times):
+    started = time.perf_counter()
+    with transaction() as uow:
+        movie_id = uow.insert("""
+        INSERT INTO movie (movie_title, movie_description, poster_url, customer_id, web_id)
+        VALUES (%s, %s, %s, %s, %s)
+        """, (movie_title, movie_desc, poster_url, admin_id, web_id))
+        rows_written = 1
+
+        rows_written += uow.execute("""
+        INSERT INTO movie_played_on_screen (movie_id, screen_id)
+        VALUES (%s, %s)
+        """, (movie_id, screen_id))
+
+        # The whole run is one rule; shows are not stored one by one
+        rows_written += add_schedule_rule(uow, movie_id, release_date, screen_till, show_times)
+
+        rows_written += uow.bulk_insert(
+            "INSERT IGNORE INTO movie_played_on_schedule (show_time, movie_id)",
+            [(show_time, movie_id) for show_time in show_times]
+        )
+
+    return {
+        'movie_id': movie_id,
+        'rows_written': rows_written,
+        'shows_scheduled': ((screen_till - release_date).days + 1) * len(set(show_times)),
+        'elapsed': time.perf_counter() - started
+    }
@@ -0,0 +1,277 @@
+import datetime
+
+from db_utils import execute_query, transaction
+
+# A movie's shows are stored as rules rather than one row per show: a rule is
+# a date range (schedule_rules) plus the times played every day of it
+# (schedule_rule_times). Single shows are cancelled or added on top of the
+# rules with schedule_exceptions. A 120-day run with three show times is four
+# rows; occurrences are only worked out for the date being looked at.
+
+
+class ShowClash(Exception):
+    pass
+
+
+# A show to be moved or cancelled already has tickets sold or seats held
+class ShowHasSales(Exception):
+    pass
+
+
+# Insert one rule; returns the number of rows written
+def add_schedule_rule(uow, movie_id, start_date, end_date, show_times):
+    rule_id = uow.insert("""
+    INSERT INTO schedule_rules (movie_id, start_date, end_date)
+    VALUES (%s, %s, %s)
+    """, (movie_id, start_date, end_date))
+    return 1 + uow.bulk_insert(
+        "INSERT IGNORE INTO schedule_rule_times (rule_id, show_time)",
+        [(rule_id, show_time) for show_time in sorted(set(show_times))]
+    )
+
+# Group (show_date, show_time) pairs into rules: consecutive dates that play
+# exactly the same times share a rule. Returns (start_date, end_date, times).
+def group_into_rules(shows):
+    times_by_date = {}
+    for show_date, show_time in shows:
+        times_by_date.setdefault(show_date, set()).add(show_time)
+
+    rules = []
+    for show_date in sorted(times_by_date):
+        times = times_by_date[show_date]
+        if rules and rules[-1][2] == times and rules[-1][1] + datetime.timedelta(days=1) == show_date:
+            rules[-1] = (rules[-1][0], show_date, times)
+        else:
+            rules.append((show_date, show_date, times))
+    return [(start_date, end_date, sorted(times)) for start_date, end_date, times in rules]
+
+# TIME columns come back as timedelta, time inputs give datetime.time
+def _as_time(value):
+    if isinstance(value, datetime.timedelta):
+        return (datetime.datetime.min + value).time()
+    return value
+
+# {rule_id: (start_date, end_date, {show_time, ...})} for a movie's rules that
+# overlap the date range (all of them when no range is given)
+def _load_rules(uow, movie_id, from_date=None, to_date=None, lock=False):
+    query = """
+    SELECT r.rule_id, r.start_date, r.end_date, rt.show_time
+    FROM schedule_rules r
+    JOIN schedule_rule_times rt ON rt.rule_id = r.rule_id
+    WHERE r.movie_id = %s
+    """
+    params = [movie_id]
+    if from_date is not None:
+        query += " AND r.end_date >= %s AND r.start_date <= %s"
+        params += [from_date, to_date]
+    if lock:
+        query += " FOR UPDATE"
+    rules = {}
+    for rule_id, start_date, end_date, show_time in uow.fetch(query, params):
+        rules.setdefault(rule_id, (start_date, end_date, set()))[2].add(_as_time(show_time))
+    return rules
+
+def _covered(rules, show_date, show_time):
+    return any(start_date <= show_date <= end_date and show_time in times
+               for start_date, end_date, times in rules.values())
+
+# Every show of a movie between two dates, worked out from the rules and
+# exceptions overlapping the range: a list of {'show_date', 'show_time',
+# 'extra'} sorted by date and time. Two queries however long the range is.
+def get_shows(movie_id, from_date, to_date):
+    # One transaction so rules and exceptions are read from the same snapshot
+    with transaction() as uow:
+        rules = _load_rules(uow, movie_id, from_date, to_date)
+        exceptions = uow.fetch("""
+        SELECT show_date, show_time, action
+        FROM schedule_exceptions
+        WHERE movie_id = %s AND show_date BETWEEN %s AND %s
+        """, (movie_id, from_date, to_date))
+
+    shows = {}
+    for start_date, end_date, times in rules.values():
+        show_date = max(start_date, from_date)
+        while show_date <= min(end_date, to_date):
+            for show_time in times:
+                shows[(show_date, show_time)] = False
+            show_date += datetime.timedelta(days=1)
+    for show_date, show_time, action in exceptions:
+        if action == 'cancel':
+            shows.pop((show_date, _as_time(show_time)), None)
+        else:
+            shows[(show_date, _as_time(show_time))] = True
+    return [{'show_date': show_date, 'show_time': show_time, 'extra': extra}
+            for (show_date, show_time), extra in sorted(shows.items())]
+
+# Make the shows in remove disappear and the shows in add appear, as sets of
+# (show_date, show_time). A show a rule already covers is cancelled or
+# restored through an exception, any other show is an extra. Whatever the
+# number of shows this is one rules read, one DELETE and one multi-row upsert.
+def _apply_changes(uow, movie_id, remove, add):
+    remove = {(show_date, _as_time(show_time)) for show_date, show_time in remove}
+    add = {(show_date, _as_time(show_time)) for show_date, show_time in add}
+    # A show in both sets is left as it is
+    remove, add = remove - add, add - remove
+    if not remove and not add:
+        return 0
+
+    rules = _load_rules(uow, movie_id, lock=True)
+    clear = [show for show in remove if not _covered(rules, *show)] + \
+            [show for show in add if _covered(rules, *show)]
+    upsert = [(movie_id, show_date, show_time, 'cancel') for show_date, show_time in remove
+              if _covered(rules, show_date, show_time)] + \
+             [(movie_id, show_date, show_time, 'add') for show_date, show_time in add
+              if not _covered(rules, show_date, show_time)]
+
+    if clear:
+        marks = ", ".join(["(%s, %s)"] * len(clear))
+        uow.execute(f"""
+        DELETE FROM schedule_exceptions
+        WHERE movie_id = %s AND (show_date, show_time) IN ({marks})
+        """, [movie_id] + [value for show in clear for value in show])
+    if upsert:
+        uow.bulk_insert(
+            "INSERT INTO schedule_exceptions (movie_id, show_date, show_time, action)",
+            upsert,
+            suffix="ON DUPLICATE KEY UPDATE action = VALUES(action)"
+        )
+    _record_show_times(uow, movie_id, {show_time for _, show_time in add})
+    return len(remove) + len(add)
+
+# Keep movie_played_on_schedule listing every time the movie plays at
+def _record_show_times(uow, movie_id, show_times):
+    uow.bulk_insert(
+        "INSERT IGNORE INTO movie_played_on_schedule (show_time, movie_id)",
+        [(show_time, movie_id) for show_time in sorted(show_times)]
+    )
+
+# "2024-05-01 07:00 PM, ... and 3 more" for error messages
+def _list_shows(shows, limit=5):
+    listed = ", ".join(f"{show_date} {show_time.strftime('%I:%M %p')}" for show_date, show_time in shows[:limit])
+    return listed + (f" and {len(shows) - limit} more" if len(shows) > limit else "")
+
+# The (show_date, show_time) shows of a movie between two dates that have
+# tickets or live seat holds (sold seats keep their hold with no expiry).
+# The hold rows are locked, and with them the gaps between them, so no new
+# hold can land in the range before the transaction ends.
+def _shows_with_sales(uow, movie_id, from_date, to_date):
+    rows = uow.fetch("""
+    SELECT DISTINCT show_date, show_time
+    FROM seat_holds
+    WHERE movie_id = %s AND show_date BETWEEN %s AND %s
+      AND (expires_at IS NULL OR expires_at > NOW())
+    FOR UPDATE
+    """, (movie_id, from_date, to_date))
+    rows += uow.fetch("""
+    SELECT DISTINCT show_date, show_time
+    FROM tickets
+    WHERE movie_id = %s AND show_date BETWEEN %s AND %s
+    """, (movie_id, from_date, to_date))
+    return {(show_date, _as_time(show_time)) for show_date, show_time in rows}
+
+# Raise ShowHasSales if any of these shows has tickets or held seats
+def _refuse_sold(uow, movie_id, shows, from_date=None, to_date=None):
+    if from_date is None:
+        if not shows:
+            return
+        from_date, to_date = min(shows)[0], max(shows)[0]
+    sold = _shows_with_sales(uow, movie_id, from_date, to_date)
+    if shows is not None:
+        sold &= set(shows)
+    if sold:
+        raise ShowHasSales(f"tickets sold or seats held for {_list_shows(sorted(sold))}")
+
+# Cancel the given (show_date, show_time) shows; returns how many changed.
+# Raises ShowHasSales, changing nothing, if any of them has sales.
+def cancel_shows(movie_id, shows):
+    shows = [(show_date, _as_time(show_time)) for show_date, show_time in shows]
+    with transaction() as uow:
+        _refuse_sold(uow, movie_id, shows)
+        return _apply_changes(uow, movie_id, shows, [])
+
+# The (show_date, show_time) shows of this set that currently play: covered
+# by a rule and not cancelled, or added as an extra
+def _scheduled(uow, movie_id, shows):
+    if not shows:
+        return set()
+    rules = _load_rules(uow, movie_id, min(shows)[0], max(shows)[0], lock=True)
+    marks = ", ".join(["(%s, %s)"] * len(shows))
+    actions = {(show_date, _as_time(show_time)): action for show_date, show_time, action in uow.fetch(f"""
+    SELECT show_date, show_time, action
+    FROM schedule_exceptions
+    WHERE movie_id = %s AND (show_date, show_time) IN ({marks})
+    """, [movie_id] + [value for show in shows for value in show])}
+    return {show for show in shows
+            if actions.get(show) == 'add' or (_covered(rules, *show) and actions.get(show) != 'cancel')}
+
+# Move the given shows by a number of minutes (a show can cross midnight).
+# Raises ShowClash, changing nothing, if a show would land on one that
+# already plays and is not itself being moved, and ShowHasSales if one of
+# them has sales.
+def shift_shows(movie_id, shows, minutes):
+    shows = [(show_date, _as_time(show_time)) for show_date, show_time in shows]
+    moved = []
+    for show_date, show_time in shows:
+        start = datetime.datetime.combine(show_date, show_time) + datetime.timedelta(minutes=minutes)
+        moved.append((start.date(), start.time()))
+    with transaction() as uow:
+        _refuse_sold(uow, movie_id, shows)
+        clashes = sorted(_scheduled(uow, movie_id, set(moved) - set(shows)))
+        if clashes:
+            raise ShowClash(f"already scheduled at {_list_shows(clashes)}")
+        return _apply_changes(uow, movie_id, shows, moved)
+
+# Cancel every show of a movie from from_date to to_date. Rules are trimmed
+# or split around the range instead of cancelling shows one by one, so a
+# long range costs the same as a single day. Raises ShowHasSales, changing
+# nothing, if a show in the range has sales.
+def cancel_date_range(movie_id, from_date, to_date):
+    with transaction() as uow:
+        _refuse_sold(uow, movie_id, None, from_date, to_date)
+        rules = _load_rules(uow, movie_id, from_date, to_date, lock=True)
+        for rule_id, (start_date, end_date, times) in rules.items():
+            if from_date <= start_date and end_date <= to_date:
+                uow.execute("DELETE FROM schedule_rule_times WHERE rule_id = %s", (rule_id,))
+                uow.execute("DELETE FROM schedule_rules WHERE rule_id = %s", (rule_id,))
+                continue
+            if end_date > to_date and start_date < from_date:
+                # The range is in the middle of the rule: keep the tail as a new rule
+                add_schedule_rule(uow, movie_id, to_date + datetime.timedelta(days=1), end_date, times)
+            if start_date < from_date:
+                uow.execute("UPDATE schedule_rules SET end_date = %s WHERE rule_id = %s",
+                            (from_date - datetime.timedelta(days=1), rule_id))
+            else:
+                uow.execute("UPDATE schedule_rules SET start_date = %s WHERE rule_id = %s",
+                            (to_date + datetime.timedelta(days=1), rule_id))
+        # No rule covers the range any more, so its exceptions are moot
+        uow.execute("""
+        DELETE FROM schedule_exceptions
+        WHERE movie_id = %s AND show_date BETWEEN %s AND %s
+        """, (movie_id, from_date, to_date))
+
+# Play the movie at show_times every day from from_date to to_date, as one new
+# rule. Earlier cancellations of those shows in the range are dropped and extra
+# shows the rule now covers are folded into it.
+def add_date_range(movie_id, from_date, to_date, show_times):
+    show_times = sorted({_as_time(show_time) for show_time in show_times})
+    with transaction() as uow:
+        add_schedule_rule(uow, movie_id, from_date, to_date, show_times)
+        marks = ", ".join(["%s"] * len(show_times))
+        uow.execute(f"""
+        DELETE FROM schedule_exceptions
+        WHERE movie_id = %s AND show_date BETWEEN %s AND %s AND show_time IN ({marks})
+        """, [movie_id, from_date, to_date] + show_times)
+        _record_show_times(uow, movie_id, show_times)
+
+# Rules of a movie with their show times, oldest first
+def get_schedule_rules(movie_id):
+    rules_query = """
+    SELECT r.rule_id, r.start_date, r.end_date,
+           GROUP_CONCAT(TIME_FORMAT(rt.show_time, '%h:%i %p') ORDER BY rt.show_time SEPARATOR ', ') as show_times
+    FROM schedule_rules r
+    JOIN schedule_rule_times rt ON rt.rule_id = r.rule_id
+    WHERE r.movie_id = %s
+    GROUP BY r.rule_id, r.start_date, r.end_date
+    ORDER BY r.start_date
+    """
+    return execute_query(rules_query, (movie_id,))
@@ -0,0 +1,571 @@
+# Versioned schema for the MTBS database.
+#
+# Every table the app reads or writes is created here, together with the
+# indexes its hot queries rely on. Migrations are numbered and recorded in
+# schema_migrations; each one is written to be safe to re-run against a
+# database that was created by hand, so tables use IF NOT EXISTS and indexes
+# are only added when no existing index already covers the same columns.
+#
+#     python schema.py migrate     # apply pending migrations
+#     python schema.py status      # list applied / pending migrations
+#     python schema.py check       # EXPLAIN the known queries, flag full scans
+import argparse
+import datetime
+import logging
+import sys
+
+from mysql.connector import Error
+
+from catalog import SHOWTIMES_QUERY
+from db_utils import UnitOfWork, pooled_connection, bulk_insert, timed_execute
+import rollups
+from schedules import add_schedule_rule, group_into_rules
+
+logger = logging.getLogger('mtbs.schema')
+
+TABLES = {
+    'website': """
+    CREATE TABLE IF NOT EXISTS website (
+        web_id INT AUTO_INCREMENT PRIMARY KEY,
+        web_name VARCHAR(100) NOT NULL
+    )
+    """,
+    'admin': """
+    CREATE TABLE IF NOT EXISTS admin (
+        admin_id INT PRIMARY KEY,
+        admin_role VARCHAR(50) NOT NULL
+    )
+    """,
+    'customer': """
+    CREATE TABLE IF NOT EXISTS customer (
+        customer_id INT AUTO_INCREMENT PRIMARY KEY,
+        first_name VARCHAR(50) NOT NULL,
+        last_name VARCHAR(50),
+        customer_contact VARCHAR(100)
+    )
+    """,
+    'customer_cpy': """
+    CREATE TABLE IF NOT EXISTS customer_cpy (
+        customer_id INT PRIMARY KEY,
+        customer_contact VARCHAR(20)
+    )
+    """,
+    'users': """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INT AUTO_INCREMENT PRIMARY KEY,
+        username VARCHAR(50) NOT NULL,
+        email VARCHAR(100) NOT NULL,
+        password VARCHAR(255) NOT NULL,
+        customer_id INT,
+        created_at DATETIME
+    )
+    """,
+    'movie': """
+    CREATE TABLE IF NOT EXISTS movie (
+        movie_id INT AUTO_INCREMENT PRIMARY KEY,
+        movie_title VARCHAR(255) NOT NULL,
+        movie_description TEXT,
+        poster_url VARCHAR(500),
+        customer_id INT,
+        web_id INT
+    )
+    """,
+    'screen': """
+    CREATE TABLE IF NOT EXISTS screen (
+        screen_id INT AUTO_INCREMENT PRIMARY KEY,
+        screen_name VARCHAR(100) NOT NULL,
+        screen_number INT,
+        number_of_seats INT NOT NULL
+    )
+    """,
+    'movie_played_on_screen': """
+    CREATE TABLE IF NOT EXISTS movie_played_on_screen (
+        movie_id INT NOT NULL,
+        screen_id INT NOT NULL,
+        PRIMARY KEY (movie_id, screen_id)
+    )
+    """,
+    'schedule': """
+    CREATE TABLE IF NOT EXISTS schedule (
+        schedule_id INT AUTO_INCREMENT PRIMARY KEY,
+        show_time TIME NOT NULL,
+        show_date DATE NOT NULL,
+        movie_id INT NOT NULL
+    )
+    """,
+    'movie_played_on_schedule': """
+    CREATE TABLE IF NOT EXISTS movie_played_on_schedule (
+        show_time TIME NOT NULL,
+        movie_id INT NOT NULL
+    )
+    """,
+    'tickets': """
+    CREATE TABLE IF NOT EXISTS tickets (
+        ticket_id VARCHAR(32) PRIMARY KEY,
+        show_time TIME NOT NULL,
+        show_date DATE NOT NULL,
+        screen_id INT,
+        cost DECIMAL(10, 2),
+        base_cost DECIMAL(10, 2),
+        gst_amount DECIMAL(10, 2),
+        convenience_fee DECIMAL(10, 2),
+        payment_method VARCHAR(20),
+        gold_seats TEXT,
+        standard_seats TEXT,
+        movie_id INT NOT NULL,
+        movie_title VARCHAR(255),
+        customer_id INT
+    )
+    """,
+    # One row per held or sold seat. The primary key is the seat itself, so two
+    # sessions can never hold the same seat and contention is limited to the rows
+    # of the seats being fought over rather than the whole tickets table.
+    # Holds carry an expiry; converting a hold into a ticket clears expires_at and
+    # records the ticket_id, which keeps the seat taken for good.
+    'seat_holds': """
+    CREATE TABLE IF NOT EXISTS seat_holds (
+        movie_id INT NOT NULL,
+        show_date DATE NOT NULL,
+        show_time TIME NOT NULL,
+        seat_class ENUM('gold', 'standard') NOT NULL,
+        seat_number SMALLINT UNSIGNED NOT NULL,
+        hold_token CHAR(32) NOT NULL,
+        expires_at DATETIME NULL,
+        ticket_id VARCHAR(32) NULL,
+        PRIMARY KEY (movie_id, show_date, show_time, seat_class, seat_number),
+        KEY idx_seat_holds_token (hold_token),
+        KEY idx_seat_holds_expiry (expires_at)
+    )
+    """,
+    # One row per sold seat. The primary key makes a seat of a show sellable
+    # once; a second ticket for it fails with a duplicate key error.
+    # tickets.gold_seats / standard_seats are still written for older readers.
+    'ticket_seats': """
+    CREATE TABLE IF NOT EXISTS ticket_seats (
+        movie_id INT NOT NULL,
+        show_date DATE NOT NULL,
+        show_time TIME NOT NULL,
+        seat_class ENUM('gold', 'standard') NOT NULL,
+        seat_number SMALLINT UNSIGNED NOT NULL,
+        ticket_id VARCHAR(32) NOT NULL,
+        PRIMARY KEY (movie_id, show_date, show_time, seat_class, seat_number),
+        KEY idx_ticket_seats_ticket (ticket_id)
+    )
+    """,
+    # Seats sold per show, kept up to date by every booking (see seat_counts.py)
+    'show_seat_counts': """
+    CREATE TABLE IF NOT EXISTS show_seat_counts (
+        movie_id INT NOT NULL,
+        show_date DATE NOT NULL,
+        show_time TIME NOT NULL,
+        gold_booked SMALLINT NOT NULL DEFAULT 0,
+        standard_booked SMALLINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (movie_id, show_date, show_time)
+    )
+    """,
+    # Sales per show date, movie, screen and show slot, kept up to date by
+    # every booking (see rollups.py)
+    'daily_sales': """
+    CREATE TABLE IF NOT EXISTS daily_sales (
+        show_date DATE NOT NULL,
+        movie_id INT NOT NULL,
+        screen_id INT NOT NULL,
+        slot ENUM('morning', 'afternoon', 'evening', 'late') NOT NULL,
+        tickets INT NOT NULL DEFAULT 0,
+        gold_seats INT NOT NULL DEFAULT 0,
+        standard_seats INT NOT NULL DEFAULT 0,
+        revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+        shows INT NOT NULL DEFAULT 0,
+        capacity INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (show_date, movie_id, screen_id, slot)
+    )
+    """,
+    # Charges whose booking failed and whose refund the gateway has not yet
+    # accepted (see payments.refund_payment)
+    'pending_refunds': """
+    CREATE TABLE IF NOT EXISTS pending_refunds (
+        payment_reference VARCHAR(64) PRIMARY KEY,
+        amount DECIMAL(10, 2) NOT NULL,
+        reason VARCHAR(255) NOT NULL,
+        last_error VARCHAR(255),
+        created_at DATETIME NOT NULL,
+        refunded_at DATETIME NULL,
+        refund_reference VARCHAR(64) NULL
+    )
+    """,
+    # A run of a movie: every day from start_date to end_date at each of the
+    # rule's schedule_rule_times. Replaces the one-row-per-show schedule table.
+    'schedule_rules': """
+    CREATE TABLE IF NOT EXISTS schedule_rules (
+        rule_id INT AUTO_INCREMENT PRIMARY KEY,
+        movie_id INT NOT NULL,
+        start_date DATE NOT NULL,
+        end_date DATE NOT NULL,
+        KEY idx_schedule_rules_movie (movie_id, start_date, end_date)
+    )
+    """,
+    'schedule_rule_times': """
+    CREATE TABLE IF NOT EXISTS schedule_rule_times (
+        rule_id INT NOT NULL,
+        show_time TIME NOT NULL,
+        PRIMARY KEY (rule_id, show_time)
+    )
+    """,
+    # Single shows cancelled from, or added on top of, a movie's rules
+    'schedule_exceptions': """
+    CREATE TABLE IF NOT EXISTS schedule_exceptions (
+        movie_id INT NOT NULL,
+        show_date DATE NOT NULL,
+        show_time TIME NOT NULL,
+        action ENUM('cancel', 'add') NOT NULL,
+        PRIMARY KEY (movie_id, show_date, show_time)
+    )
+    """,
+    # Archived rows (see archive.py), same columns and indexes as the live tables
+    'tickets_history': "CREATE TABLE IF NOT EXISTS tickets_history LIKE tickets",
+    'ticket_seats_history': "CREATE TABLE IF NOT EXISTS ticket_seats_history LIKE ticket_seats",
+    'schedule_rules_history': "CREATE TABLE IF NOT EXISTS schedule_rules_history LIKE schedule_rules",
+    'schedule_rule_times_history': "CREATE TABLE IF NOT EXISTS schedule_rule_times_history LIKE schedule_rule_times",
+    'schedule_exceptions_history': "CREATE TABLE IF NOT EXISTS schedule_exceptions_history LIKE schedule_exceptions"
+}
+
+# Indexes as (table, index name, columns, unique). Column order follows the
+# access path: equality columns first, then the ORDER BY columns.
+INDEXES = [
+    # Old one-row-per-show schedule: WHERE movie_id = ? AND show_date = ?, and
+    # unique because its writers relied on INSERT IGNORE skipping repeats.
+    # Migration 5 moves it to schedule_rules.
+    ('schedule', 'uq_schedule_show', ('movie_id', 'show_date', 'show_time'), True),
+    ('movie_played_on_schedule', 'uq_movie_played_on_schedule', ('movie_id', 'show_time'), True),
+    ('movie_played_on_screen', 'idx_mps_screen', ('screen_id',), False),
+    # Seat occupancy: WHERE movie_id = ? AND show_date = ? AND show_time = ?
+    ('tickets', 'idx_tickets_show', ('movie_id', 'show_date', 'show_time'), False),
+    # My Tickets: WHERE customer_id = ? ORDER BY show_date DESC, show_time DESC
+    ('tickets', 'idx_tickets_customer', ('customer_id', 'show_date', 'show_time'), False),
+    # Login and registration lookups
+    ('users', 'uq_users_username', ('username',), True),
+    ('users', 'idx_users_email', ('email',), False),
+    ('users', 'idx_users_customer', ('customer_id',), False),
+]
+
+# The admin Movie List pages through movies in title order
+MOVIE_LIST_INDEXES = [
+    ('movie', 'idx_movie_title', ('movie_title',), False),
+]
+
+# Date indexes the archive job walks to find rows older than its horizon
+ARCHIVE_INDEXES = [
+    ('tickets', 'idx_tickets_show_date', ('show_date',), False),
+    ('seat_holds', 'idx_seat_holds_show_date', ('show_date',), False),
+    ('schedule_rules', 'idx_schedule_rules_end', ('end_date',), False),
+    ('schedule_exceptions', 'idx_schedule_exceptions_date', ('show_date',), False),
+]
+
+def _create_tables(*names):
+    def apply(connection, cursor):
+        for name in names:
+            timed_execute(cursor, TABLES[name], label='schema')
+    return apply
+
+def _create_indexes(indexes):
+    def apply(connection, cursor):
+        for table, name, columns, unique in indexes:
+            ensure_index(cursor, table, name, columns, unique)
+    return apply
+
+# Copy the seats of existing tickets out of the CSV columns, walking tickets
+# in ticket_id order so memory stays flat. If old data sold a seat twice the
+# first ticket keeps it; the clashes are counted and logged.
+def _backfill_ticket_seats(cursor, batch_size=5000):
+    last_ticket_id = ''
+    duplicates = 0
+    while True:
+        tickets = timed_execute(cursor, """
+        SELECT ticket_id, movie_id, show_date, show_time, gold_seats, standard_seats
+        FROM tickets
+        WHERE ticket_id > %s
+        ORDER BY ticket_id
+        LIMIT %s
+        """, (last_ticket_id, batch_size), label='schema', fetch=True)
+        if not tickets:
+            break
+        rows = []
+        for ticket_id, movie_id, show_date, show_time, gold_seats, standard_seats in tickets:
+            for seat_class, seats in (('gold', gold_seats), ('standard', standard_seats)):
+                for seat in (seats or '').split(','):
+                    if seat.strip():
+                        rows.append((movie_id, show_date, show_time, seat_class, int(seat), ticket_id))
+        written = bulk_insert(cursor, "INSERT IGNORE INTO ticket_seats "
+                                      "(movie_id, show_date, show_time, seat_class, seat_number, ticket_id)",
+                              rows, label='schema')
+        duplicates += len(rows) - written
+        last_ticket_id = tickets[-1][0]
+    if duplicates:
+        logger.warning("ticket_seats backfill skipped %d seats that were already taken "
+                       "(double bookings or an earlier backfill)", duplicates)
+
+def _ticket_seats(connection, cursor):
+    timed_execute(cursor, TABLES['ticket_seats'], label='schema')
+    _backfill_ticket_seats(cursor)
+
+# Turn the rows of the old schedule table into rules, one movie at a time.
+# Movies that already have rules are skipped, so this can be re-run; the old
+# table is left in place but nothing reads it any more.
+def _schedule_rules(connection, cursor):
+    for name in ('schedule_rules', 'schedule_rule_times', 'schedule_exceptions'):
+        timed_execute(cursor, TABLES[name], label='schema')
+    movie_ids = timed_execute(cursor, """
+    SELECT DISTINCT s.movie_id
+    FROM schedule s
+    WHERE NOT EXISTS (SELECT 1 FROM schedule_rules r WHERE r.movie_id = s.movie_id)
+    """, label='schema', fetch=True)
+    for (movie_id,) in movie_ids:
+        shows = timed_execute(cursor, "SELECT show_date, show_time FROM schedule WHERE movie_id = %s",
+                              (movie_id,), label='schema', fetch=True)
+        # Same connection as the migration (it holds the migrate lock)
+        uow = UnitOfWork(connection)
+        try:
+            connection.start_transaction()
+            for start_date, end_date, show_times in group_into_rules(shows):
+                add_schedule_rule(uow, movie_id, start_date, end_date, show_times)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            uow.cursor.close()
+
+def _show_seat_counts(connection, cursor):
+    timed_execute(cursor, TABLES['show_seat_counts'], label='schema')
+    timed_execute(cursor, """
+    INSERT INTO show_seat_counts (movie_id, show_date, show_time, gold_booked, standard_booked)
+    SELECT movie_id, show_date, show_time, SUM(seat_class = 'gold'), SUM(seat_class = 'standard')
+    FROM ticket_seats
+    GROUP BY movie_id, show_date, show_time
+    ON DUPLICATE KEY UPDATE gold_booked = VALUES(gold_booked), standard_booked = VALUES(standard_booked)
+    """, label='schema')
+
+def _daily_sales(connection, cursor):
+    timed_execute(cursor, TABLES['daily_sales'], label='schema')
+    rollups.rebuild()
+
+# (version, description, apply(connection, cursor)); append only, never renumber
+MIGRATIONS = [
+    (1, 'base tables', _create_tables('website', 'admin', 'customer', 'customer_cpy', 'users', 'movie',
+                                      'screen', 'movie_played_on_screen', 'schedule',
+                                      'movie_played_on_schedule', 'tickets')),
+    (2, 'seat holds', _create_tables('seat_holds')),
+    (3, 'indexes for the hot lookups', _create_indexes(INDEXES)),
+    (4, 'ticket_seats, backfilled from the tickets seat columns', _ticket_seats),
+    (5, 'schedule rules, converted from the schedule table', _schedule_rules),
+    (6, 'history tables for archiving', _create_tables(
+        'tickets_history', 'ticket_seats_history', 'schedule_rules_history',
+        'schedule_rule_times_history', 'schedule_exceptions_history')),
+    (7, 'date indexes for archiving', _create_indexes(ARCHIVE_INDEXES)),
+    (8, 'movie title index for the admin movie list', _create_indexes(MOVIE_LIST_INDEXES)),
+    (9, 'seats sold per show, counted from ticket_seats', _show_seat_counts),
+    (10, 'daily sales rollup, built from the tickets', _daily_sales),
+    (11, 'refunds owed for bookings that failed after payment', _create_tables('pending_refunds')),
+]
+
+# The queries the pages run on every booking, with representative parameters.
+# check_query_plans() EXPLAINs each of them. The modules are imported here
+# rather than at the top because seat_holds imports this one.
+def known_queries():
+    from accounts import ADMIN_LOGIN_QUERY, USER_LOGIN_QUERY
+    from bookings import customer_tickets_query
+    from catalog import MOVIE_SCREEN_QUERY
+    from seat_counts import SHOW_SEAT_COUNTS_QUERY
+    from seat_holds import UNAVAILABLE_SEATS_QUERY
+    from seat_index import BOOKED_SEATS_QUERY
+
+    today = datetime.date.today()
+    show_key = (1, today, datetime.time(19, 0))
+    # Live tier of a later "Past" page
+    customer_tickets, customer_tickets_params = customer_tickets_query(
+        1, upcoming=False, after=(today, datetime.time(19, 0), 'TKT-00000-00000-00000-00000'))
+    return [
+        ('catalog.get_showtimes', SHOWTIMES_QUERY, {'movie_id': 1, 'show_date': today}),
+        ('catalog.get_movie_screen', MOVIE_SCREEN_QUERY, (1,)),
+        ('seat_index.booked_seats', BOOKED_SEATS_QUERY, show_key),
+        ('seat_counts.get_show_seat_counts', SHOW_SEAT_COUNTS_QUERY, (1, today)),
+        ('seat_holds.unavailable_seats', UNAVAILABLE_SEATS_QUERY, (*show_key, '')),
+        ('bookings.customer_tickets', customer_tickets, customer_tickets_params),
+        ('login.user', USER_LOGIN_QUERY, ('someone',)),
+        ('login.admin', ADMIN_LOGIN_QUERY, ('someone',)),
+    ]
+
+# Every index on the table, as {index name: ((columns...), unique)}
+def _existing_indexes(cursor, table):
+    rows = timed_execute(cursor, """
+    SELECT index_name, column_name, non_unique
+    FROM information_schema.statistics
+    WHERE table_schema = DATABASE() AND table_name = %s
+    ORDER BY index_name, seq_in_index
+    """, (table,), label='schema', fetch=True)
+    indexes = {}
+    for index_name, column_name, non_unique in rows:
+        indexes.setdefault(index_name, ([], not int(non_unique)))[0].append(column_name.lower())
+    return {index_name: (tuple(columns), unique) for index_name, (columns, unique) in indexes.items()}
+
+# Tables whose duplicate rows are plain repeats a unique index may drop, with
+# the column that decides which copy stays (the lowest); None when the copies
+# are identical. Any other table with duplicates stops the migration.
+DEDUPLICATE_BEFORE_UNIQUE = {
+    'schedule': 'schedule_id',
+    'movie_played_on_schedule': None,
+}
+
+# Make the rows unique on columns so a unique index can be added: drop the
+# repeats of tables in DEDUPLICATE_BEFORE_UNIQUE, otherwise raise an Error
+# naming the duplicate values. Returns the number of rows deleted.
+def _remove_duplicates(cursor, table, columns):
+    column_list = ", ".join(columns)
+    not_null = " AND ".join(f"{column} IS NOT NULL" for column in columns)
+    groups = timed_execute(cursor, f"""
+    SELECT {column_list}, COUNT(*) FROM {table}
+    WHERE {not_null}
+    GROUP BY {column_list}
+    HAVING COUNT(*) > 1
+    """, label='schema', fetch=True)
+    if not groups:
+        return 0
+    if table not in DEDUPLICATE_BEFORE_UNIQUE:
+        listed = "; ".join(", ".join(map(str, group[:-1])) for group in groups[:10])
+        raise Error(f"{table} has {len(groups)} duplicate ({column_list}) values, e.g. {listed}. "
+                    f"Resolve them by hand and run the migration again.")
+    keep_lowest = DEDUPLICATE_BEFORE_UNIQUE[table]
+    order = f" ORDER BY {keep_lowest} DESC" if keep_lowest else ""
+    match = " AND ".join(f"{column} = %s" for column in columns)
+    deleted = 0
+    for *values, count in groups:
+        deleted += timed_execute(cursor, f"DELETE FROM {table} WHERE {match}{order} LIMIT {int(count) - 1}",
+                                 values, label='schema')
+    logger.warning("Removed %d duplicate rows from %s before adding a unique index on (%s)",
+                   deleted, table, column_list)
+    return deleted
+
+# Add the index unless an equivalent one already exists, e.g. one created by
+# hand: for a plain index any index starting with the same columns, for a
+# unique one a unique index on exactly those columns. A same-named index that
+# is not unique enough is replaced. Returns True if added.
+def ensure_index(cursor, table, name, columns, unique=False):
+    columns = tuple(columns)
+    existing_indexes = _existing_indexes(cursor, table)
+    for existing, existing_unique in existing_indexes.values():
+        if existing == columns and existing_unique:
+            return False
+        if not unique and existing[:len(columns)] == columns:
+            return False
+    if unique:
+        _remove_duplicates(cursor, table, columns)
+    kind = 'UNIQUE INDEX' if unique else 'INDEX'
+    drop = f"DROP INDEX {name}, " if name in existing_indexes else ""
+    timed_execute(cursor, f"ALTER TABLE {table} {drop}ADD {kind} {name} ({', '.join(columns)})", label='schema')
+    return True
+
+def _ensure_migrations_table(cursor):
+    timed_execute(cursor, """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        description VARCHAR(255) NOT NULL,
+        applied_at DATETIME NOT NULL
+    )
+    """, label='schema')
+
+def applied_versions(cursor):
+    _ensure_migrations_table(cursor)
+    return {row[0] for row in timed_execute(cursor, "SELECT version FROM schema_migrations", label='schema', fetch=True)}
+
+# Apply every pending migration in order; returns the versions applied.
+# MySQL commits DDL implicitly, so a failed migration is not rolled back; it
+# stays pending and is retried (idempotently) on the next run.
+def migrate():
+    applied = []
+    with pooled_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            # Serialise concurrent migrators (e.g. two app processes starting together)
+            locked = timed_execute(cursor, "SELECT GET_LOCK('mtbs_schema_migrate', 60)", label='schema', fetch=True)
+            if not locked or locked[0][0] != 1:
+                raise Error("Timed out waiting for another schema migration to finish")
+            try:
+                done = applied_versions(cursor)
+                for version, description, apply in MIGRATIONS:
+                    if version in done:
+                        continue
+                    apply(connection, cursor)
+                    timed_execute(cursor, """
+                    INSERT INTO schema_migrations (version, description, applied_at)
+                    VALUES (%s, %s, NOW())
+                    """, (version, description), label='schema')
+                    applied.append(version)
+            finally:
+                timed_execute(cursor, "SELECT RELEASE_LOCK('mtbs_schema_migrate')", label='schema', fetch=True)
+        finally:
+            cursor.close()
+    return applied
+
+# Create one table from TABLES if it is missing; used by modules that need
+# their own table before the migrations have been run.
+def ensure_table(name):
+    with pooled_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            timed_execute(cursor, TABLES[name], label='schema')
+        finally:
+            cursor.close()
+
+# EXPLAIN every known query. Returns one dict per plan row; full_scan is set
+# when MySQL reads a whole table (type ALL) or a whole index (type index).
+# On nearly empty tables the optimizer may prefer a scan anyway, so run this
+# against realistic data (bench/seed_data.py).
+def check_query_plans():
+    results = []
+    with pooled_connection() as connection:
+        cursor = connection.cursor(dictionary=True)
+        try:
+            for name, query, params in known_queries():
+                for row in timed_execute(cursor, "EXPLAIN " + query, params, label='schema', fetch=True):
+                    results.append({
+                        'query': name,
+                        'table': row.get('table'),
+                        'type': row.get('type'),
+                        'key': row.get('key'),
+                        'rows': row.get('rows'),
+                        'extra': row.get('Extra'),
+                        'full_scan': row.get('type') in ('ALL', 'index')
+                    })
+        finally:
+            cursor.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the MTBS database schema.")
+    parser.add_argument('command', choices=['migrate', 'status', 'check'])
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        applied = migrate()
+        print(f"Applied migrations: {', '.join(map(str, applied))}" if applied else "Schema is up to date.")
+    elif args.command == 'status':
+        with pooled_connection() as connection:
+            cursor = connection.cursor()
+            try:
+                done = applied_versions(cursor)
+            finally:
+                cursor.close()
+        for version, description, _ in MIGRATIONS:
+            print(f"{version:>4}  {'applied' if version in done else 'pending':8s} {description}")
+    else:
+        plans = check_query_plans()
+        for plan in plans:
+            flag = 'FULL SCAN' if plan['full_scan'] else 'ok'
+            print(f"{flag:9s} {plan['query']:30s} table={plan['table']} type={plan['type']} "
+                  f"key={plan['key']} rows={plan['rows']}")
+        if any(plan['full_scan'] for plan in plans):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# Seats sold per show, kept in show_seat_counts so the showtime buttons can
+# say how many seats are left without reading every booked seat.
+#
+# Counters are bumped in the same transaction that writes a ticket's
+# ticket_seats rows. reconcile() recounts from ticket_seats and corrects any
+# counter that drifted (e.g. rows written by hand); run it periodically:
+#
+#     python seat_counts.py --from 2024-01-01
+import argparse
+import datetime
+import json
+import time
+from collections import Counter
+
+from db_utils import execute_query, transaction
+
+# Add (or with negative deltas, remove) sold seats of one show; call inside
+# the transaction that books or cancels them. Returns True when the show had
+# no counter yet, i.e. this is its first sale.
+def adjust_seat_counts(uow, show_key, gold_delta, standard_delta):
+    if not gold_delta and not standard_delta:
+        return False
+    # An upsert reports 1 for a new row and 2 for an updated one
+    return uow.execute("""
+    INSERT INTO show_seat_counts (movie_id, show_date, show_time, gold_booked, standard_booked)
+    VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE gold_booked = gold_booked + VALUES(gold_booked),
+                            standard_booked = standard_booked + VALUES(standard_booked)
+    """, (*show_key, gold_delta, standard_delta)) == 1
+
+SHOW_SEAT_COUNTS_QUERY = """
+SELECT show_time, gold_booked, standard_booked
+FROM show_seat_counts
+WHERE movie_id = %s AND show_date = %s
+"""
+
+# Seats sold for every show of a movie on one date, in one query:
+# {show_time: {'gold': n, 'standard': n}}; None if the query failed
+def get_show_seat_counts(movie_id, show_date):
+    rows = execute_query(SHOW_SEAT_COUNTS_QUERY, (movie_id, show_date))
+    if rows is None:
+        return None
+    return {row['show_time']: {'gold': row['gold_booked'], 'standard': row['standard_booked']}
+            for row in rows}
+
+def _count_rows(uow, query, params):
+    return {(movie_id, show_date, show_time): (int(gold), int(standard))
+            for movie_id, show_date, show_time, gold, standard in uow.fetch(query, params)}
+
+# Recount sold seats of every show from from_date on and fix the counters
+# that disagree. Each correction locks its counter row first, so a booking
+# committing at the same time is neither lost nor counted twice.
+def reconcile(from_date=None):
+    from_date = from_date or datetime.date.today()
+    started = time.perf_counter()
+    with transaction() as uow:
+        actual = _count_rows(uow, """
+        SELECT movie_id, show_date, show_time,
+               SUM(seat_class = 'gold'), SUM(seat_class = 'standard')
+        FROM ticket_seats
+        WHERE show_date >= %s
+        GROUP BY movie_id, show_date, show_time
+        """, (from_date,))
+        counted = _count_rows(uow, """
+        SELECT movie_id, show_date, show_time, gold_booked, standard_booked
+        FROM show_seat_counts
+        WHERE show_date >= %s
+        """, (from_date,))
+
+    suspects = [key for key in set(actual) | set(counted) if actual.get(key, (0, 0)) != counted.get(key, (0, 0))]
+    fixed = []
+    for key in sorted(suspects):
+        with transaction() as uow:
+            row = uow.fetch_one("""
+            SELECT gold_booked, standard_booked FROM show_seat_counts
+            WHERE movie_id = %s AND show_date = %s AND show_time = %s
+            FOR UPDATE
+            """, key)
+            stored = (int(row[0]), int(row[1])) if row else (0, 0)
+            seats = Counter(seat_class for (seat_class,) in uow.fetch("""
+            SELECT seat_class FROM ticket_seats
+            WHERE movie_id = %s AND show_date = %s AND show_time = %s
+            """, key))
+            recounted = (seats['gold'], seats['standard'])
+            if recounted != stored:
+                uow.execute("""
+                INSERT INTO show_seat_counts (movie_id, show_date, show_time, gold_booked, standard_booked)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE gold_booked = VALUES(gold_booked),
+                                        standard_booked = VALUES(standard_booked)
+                """, (*key, *recounted))
+                fixed.append({'show': key, 'counted': stored, 'actual': recounted})
+    return {
+        'from_date': from_date,
+        'shows_checked': len(set(actual) | set(counted)),
+        'fixed': fixed,
+        'elapsed': round(time.perf_counter() - started, 3)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the seats-sold counters against ticket_seats and fix drift.")
+    parser.add_argument('--from', dest='from_date', type=datetime.date.fromisoformat,
+                        help="first show date to check (default today)")
+    args = parser.parse_args()
+
+    print(json.dumps(reconcile(args.from_date), indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+import threading
+import time
+import uuid
+
+from mysql.connector import Error, errorcode
+
+from db_utils import transaction
+from schema import ensure_table
+from seat_counts import adjust_seat_counts
+
+# How long selected seats stay reserved for a session before anyone else can take them
+HOLD_TTL_SECONDS = 300
+
+# How often a booking request also sweeps expired holds of every show
+SWEEP_INTERVAL = 60
+SWEEP_BATCH_SIZE = 1000
+
+
+class SeatUnavailable(Exception):
+    pass
+
+
+_table_ready = False
+_last_sweep = 0.0
+_sweep_lock = threading.Lock()
+
+def new_hold_token():
+    return uuid.uuid4().hex
+
+def ensure_seat_holds_table():
+    global _table_ready
+    if not _table_ready:
+        ensure_table('seat_holds')
+        _table_ready = True
+
+def _seat_rows(gold_seats, standard_seats):
+    # Sorted in primary key order so concurrent inserts lock rows in the same order
+    return sorted([('gold', int(seat)) for seat in gold_seats] +
+                  [('standard', int(seat)) for seat in standard_seats])
+
+def _is_conflict(error):
+    return error.errno in (errorcode.ER_DUP_ENTRY, errorcode.ER_LOCK_DEADLOCK, errorcode.ER_LOCK_WAIT_TIMEOUT)
+
+# Replace the holds of this token on the show with exactly the given seats and
+# restart their TTL. Raises SeatUnavailable if any seat is held or sold by
+# someone else; in that case the token's previous holds are left untouched.
+def place_hold(show_key, gold_seats, standard_seats, hold_token, ttl=HOLD_TTL_SECONDS):
+    seats = _seat_rows(gold_seats, standard_seats)
+    ensure_seat_holds_table()
+    try:
+        with transaction() as uow:
+            uow.execute("""
+            DELETE FROM seat_holds
+            WHERE movie_id = %s AND show_date = %s AND show_time = %s
+              AND hold_token = %s AND expires_at IS NOT NULL
+            """, (*show_key, hold_token))
+
+            if seats:
+                # Reclaim expired holds on the requested seats before claiming them
+                seat_filter = ", ".join(["(%s, %s)"] * len(seats))
+                uow.execute(f"""
+                DELETE FROM seat_holds
+                WHERE movie_id = %s AND show_date = %s AND show_time = %s
+                  AND expires_at < NOW()
+                  AND (seat_class, seat_number) IN ({seat_filter})
+                """, (*show_key, *[value for seat in seats for value in seat]))
+
+                uow.bulk_insert(
+                    "INSERT INTO seat_holds (movie_id, show_date, show_time, seat_class, seat_number, hold_token, expires_at)",
+                    [(*show_key, seat_class, seat_number, hold_token, ttl) for seat_class, seat_number in seats],
+                    placeholder="(%s, %s, %s, %s, %s, %s, NOW() + INTERVAL %s SECOND)"
+                )
+    except Error as e:
+        if _is_conflict(e):
+            raise SeatUnavailable("One or more of the selected seats was just taken by someone else.") from e
+        raise
+    _maybe_sweep()
+
+UNAVAILABLE_SEATS_QUERY = """
+SELECT seat_class, seat_number
+FROM seat_holds
+WHERE movie_id = %s AND show_date = %s AND show_time = %s
+  AND (expires_at IS NULL OR expires_at > NOW())
+  AND hold_token <> %s
+"""
+
+# Seats of this show that are sold or held by anyone other than hold_token,
+# as a set of (seat_class, seat_number)
+def unavailable_seats(show_key, hold_token=None):
+    ensure_seat_holds_table()
+    with transaction() as uow:
+        rows = uow.fetch(UNAVAILABLE_SEATS_QUERY, (*show_key, hold_token or ''))
+    return {(seat_class, seat_number) for seat_class, seat_number in rows}
+
+# Turn the token's holds into a ticket and its ticket_seats rows in one
+# transaction. The holds are locked first; if any of them expired or is missing,
+# or a seat turns out to be sold already, nothing is written and
+# SeatUnavailable is raised. on_confirm(uow, first_sale), if given, runs last
+# in the same transaction (first_sale: no seat of the show was sold before).
+def confirm_hold(show_key, gold_seats, standard_seats, hold_token, ticket_id, ticket_query, ticket_params,
+                 on_confirm=None):
+    seats = _seat_rows(gold_seats, standard_seats)
+    ensure_seat_holds_table()
+    try:
+        with transaction() as uow:
+            rows = uow.fetch("""
+            SELECT seat_class, seat_number
+            FROM seat_holds
+            WHERE movie_id = %s AND show_date = %s AND show_time = %s
+              AND hold_token = %s AND expires_at > NOW()
+            FOR UPDATE
+            """, (*show_key, hold_token))
+            held = sorted((seat_class, int(seat_number)) for seat_class, seat_number in rows)
+            if held != seats:
+                raise SeatUnavailable("Your seat hold has expired. Please select your seats again.")
+
+            uow.execute(ticket_query, ticket_params)
+            # The ticket_seats primary key rejects a seat that is already sold
+            uow.bulk_insert(
+                "INSERT INTO ticket_seats (movie_id, show_date, show_time, seat_class, seat_number, ticket_id)",
+                [(*show_key, seat_class, seat_number, ticket_id) for seat_class, seat_number in seats]
+            )
+            gold_count = sum(1 for seat_class, _ in seats if seat_class == 'gold')
+            first_sale = adjust_seat_counts(uow, show_key, gold_count, len(seats) - gold_count)
+
+            uow.execute("""
+            UPDATE seat_holds
+            SET expires_at = NULL, ticket_id = %s
+            WHERE movie_id = %s AND show_date = %s AND show_time = %s
+              AND hold_token = %s AND expires_at IS NOT NULL
+            """, (ticket_id, *show_key, hold_token))
+
+            if on_confirm is not None:
+                on_confirm(uow, first_sale)
+    except Error as e:
+        if _is_conflict(e):
+            raise SeatUnavailable("One or more of the selected seats was just taken by someone else.") from e
+        raise
+
+# Drop the token's unconverted holds on a show, e.g. when the user goes back
+def release_hold(show_key, hold_token):
+    ensure_seat_holds_table()
+    with transaction() as uow:
+        uow.execute("""
+        DELETE FROM seat_holds
+        WHERE movie_id = %s AND show_date = %s AND show_time = %s
+          AND hold_token = %s AND expires_at IS NOT NULL
+        """, (*show_key, hold_token))
+
+# Delete expired holds across all shows in small batches; returns rows removed
+def reclaim_expired(batch_size=SWEEP_BATCH_SIZE):
+    ensure_seat_holds_table()
+    removed = 0
+    while True:
+        with transaction() as uow:
+            deleted = uow.execute("DELETE FROM seat_holds WHERE expires_at < NOW() LIMIT %s", (batch_size,))
+        removed += deleted
+        if deleted < batch_size:
+            return removed
+
+def _maybe_sweep():
+    global _last_sweep
+    now = time.monotonic()
+    if now - _last_sweep < SWEEP_INTERVAL or not _sweep_lock.acquire(blocking=False):
+        return
+    try:
+        _last_sweep = now
+        reclaim_expired()
+    except Error:
+        pass
+    finally:
+        _sweep_lock.release()
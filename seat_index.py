@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import OrderedDict
+
+from db_utils import execute_query
+
+SEAT_CLASSES = ('gold', 'standard')
+
+# Shows kept in memory and how long a snapshot is trusted before it is rebuilt
+# from tickets (picks up bookings made by other processes)
+MAX_SHOWS = 2000
+MAX_AGE = 60
+
+BOOKED_SEATS_QUERY = """
+SELECT seat_class, seat_number
+FROM ticket_seats
+WHERE movie_id = %s AND show_date = %s AND show_time = %s
+"""
+
+# Split a screen's seats between gold and standard (30% gold, 70% standard)
+def split_seats(total_seats):
+    gold_seats_count = int(total_seats * 0.3)
+    return gold_seats_count, total_seats - gold_seats_count
+
+
+# One bit per seat number, seats are numbered from 1
+class SeatBitmap:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.bits = bytearray((capacity >> 3) + 1)
+        self.count = 0
+
+    def is_set(self, seat):
+        if seat < 1 or seat > self.capacity:
+            return False
+        return bool(self.bits[seat >> 3] & (1 << (seat & 7)))
+
+    def set(self, seat):
+        if seat < 1 or seat > self.capacity or self.is_set(seat):
+            return False
+        self.bits[seat >> 3] |= 1 << (seat & 7)
+        self.count += 1
+        return True
+
+
+# Booked seats of a single show, one bitmap per seat class
+class ShowOccupancy:
+    def __init__(self, gold_capacity, standard_capacity):
+        self.seats = {
+            'gold': SeatBitmap(gold_capacity),
+            'standard': SeatBitmap(standard_capacity)
+        }
+        self.built_at = time.monotonic()
+
+    def is_booked(self, seat_class, seat):
+        return self.seats[seat_class].is_set(seat)
+
+    def remaining(self, seat_class):
+        bitmap = self.seats[seat_class]
+        return bitmap.capacity - bitmap.count
+
+    def capacity(self, seat_class):
+        return self.seats[seat_class].capacity
+
+    def mark_booked(self, seat_class, seats):
+        bitmap = self.seats[seat_class]
+        for seat in seats:
+            bitmap.set(int(seat))
+
+
+# Process-wide occupancy for every show someone has looked at, keyed by
+# (movie_id, show_date, show_time)
+class SeatOccupancyIndex:
+    def __init__(self, max_shows=MAX_SHOWS, max_age=MAX_AGE):
+        self.max_shows = max_shows
+        self.max_age = max_age
+        self._shows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self, show_key, gold_capacity, standard_capacity):
+        occupancy = ShowOccupancy(gold_capacity, standard_capacity)
+        booked_data = execute_query(BOOKED_SEATS_QUERY, show_key)
+        if booked_data is None:
+            return None
+        for seat in booked_data:
+            occupancy.mark_booked(seat['seat_class'], [seat['seat_number']])
+        return occupancy
+
+    def get(self, show_key, gold_capacity, standard_capacity):
+        with self._lock:
+            occupancy = self._shows.get(show_key)
+            if occupancy is not None:
+                fresh = time.monotonic() - occupancy.built_at <= self.max_age
+                same_screen = (occupancy.capacity('gold') == gold_capacity
+                               and occupancy.capacity('standard') == standard_capacity)
+                if fresh and same_screen:
+                    self._shows.move_to_end(show_key)
+                    return occupancy
+
+        occupancy = self._load(show_key, gold_capacity, standard_capacity)
+        if occupancy is None:
+            # Query failed; an empty map is better than no map
+            return ShowOccupancy(gold_capacity, standard_capacity)
+
+        with self._lock:
+            self._shows[show_key] = occupancy
+            self._shows.move_to_end(show_key)
+            while len(self._shows) > self.max_shows:
+                self._shows.popitem(last=False)
+        return occupancy
+
+    # Apply a just-inserted ticket so the next seat map sees it without a reload
+    def mark_booked(self, show_key, gold_seats, standard_seats):
+        with self._lock:
+            occupancy = self._shows.get(show_key)
+            if occupancy is not None:
+                occupancy.mark_booked('gold', gold_seats)
+                occupancy.mark_booked('standard', standard_seats)
+
+    def invalidate(self, show_key=None):
+        with self._lock:
+            if show_key is None:
+                self._shows.clear()
+            else:
+                self._shows.pop(show_key, None)
+
+
+_index = SeatOccupancyIndex()
+
+def show_key(movie_id, show_date, show_time):
+    return (movie_id, show_date, show_time)
+
+def get_show_occupancy(key, gold_capacity, standard_capacity):
+    return _index.get(key, gold_capacity, standard_capacity)
+
+def mark_seats_booked(key, gold_seats, standard_seats):
+    _index.mark_booked(key, gold_seats, standard_seats)
+
+def invalidate_show(key=None):
+    _index.invalidate(key)
@@ -0,0 +1,42 @@
+import os
+
+import streamlit.components.v1 as components
+
+# Static frontend in components/seat_map; no build step needed
+_seat_map = components.declare_component(
+    "seat_map",
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "seat_map")
+)
+
+# Seats per row in the rendered auditorium
+SEAT_COLUMNS = 20
+
+# Bitmap of unavailable seats as hex, bit n = seat n (the layout SeatBitmap uses)
+def _unavailable_hex(bitmap, extra_seats):
+    bits = bytearray(bitmap.bits)
+    for seat in extra_seats:
+        if 1 <= seat <= bitmap.capacity:
+            bits[seat >> 3] |= 1 << (seat & 7)
+    return bits.hex()
+
+# Draw the whole auditorium in one element. Seat clicks stay in the browser;
+# the selection comes back once, as {"gold": [...], "standard": [...], "nonce": ...},
+# when the user confirms. Returns None until then.
+def seat_map(occupancy, taken_seats, gold_selected, standard_selected, max_selected,
+             round_id=0, disabled=False, key=None):
+    gold = occupancy.seats['gold']
+    standard = occupancy.seats['standard']
+    return _seat_map(
+        gold_count=gold.capacity,
+        standard_count=standard.capacity,
+        gold_booked=_unavailable_hex(gold, [seat for seat_class, seat in taken_seats if seat_class == 'gold']),
+        standard_booked=_unavailable_hex(standard, [seat for seat_class, seat in taken_seats if seat_class == 'standard']),
+        gold_selected=sorted(gold_selected),
+        standard_selected=sorted(standard_selected),
+        max_selected=max_selected,
+        columns=SEAT_COLUMNS,
+        session_nonce=round_id,
+        disabled=disabled,
+        key=key,
+        default=None
+    )
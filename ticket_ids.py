@@ -0,0 +1,145 @@
+# Ticket ids, made in-process without asking the database.
+#
+# An id packs the time in milliseconds, an instance id of the process that
+# made it and a per-millisecond sequence into 99 bits, written in Crockford
+# base32 (no I, L, O or U) after "TKT-":
+#
+#     TKT-0MHST-CWA7C-CKQ5S-SGE00
+#
+# The instance id is 48 random bits drawn when a process (or a forked child)
+# makes its first id, so processes need no coordination and share nothing
+# that containers or hosts tend to have in common, like pid 1 or a host name.
+# With NODE_ID set, its top bits are the node and only the rest is random,
+# which rules out a clash between machines altogether. Ids from one process
+# only ever increase and ids of all processes sort by the millisecond they
+# were made in, so new tickets are appended to the end of the primary key
+# index instead of splitting pages all over it.
+import datetime
+import os
+import secrets
+import threading
+import time
+
+TICKET_PREFIX = "TKT-"
+
+# Node of this machine, 0-255, or None. Giving every machine its own value
+# makes ids from different machines distinct by construction rather than by
+# 48 random bits.
+NODE_ID = None
+
+EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+TIME_BITS = 41  # milliseconds, until 2093
+NODE_BITS = 8
+INSTANCE_BITS = 48  # NODE_BITS of node (when set) and random bits
+SEQUENCE_BITS = 10  # ids per millisecond per process before borrowing the next one
+
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+ID_CHARS = -(-(TIME_BITS + INSTANCE_BITS + SEQUENCE_BITS) // 5)  # 5 bits per character
+GROUPS = (5, 5, 5, 5)
+
+_EPOCH_MS = int(EPOCH.timestamp() * 1000)
+
+
+def new_instance_id(node_id=None):
+    if node_id is None:
+        return secrets.randbits(INSTANCE_BITS)
+    if not 0 <= node_id < 1 << NODE_BITS:
+        raise ValueError(f"node_id must be between 0 and {(1 << NODE_BITS) - 1}")
+    random_bits = INSTANCE_BITS - NODE_BITS
+    return node_id << random_bits | secrets.randbits(random_bits)
+
+
+class TicketIdGenerator:
+    def __init__(self, node_id=None, instance_id=None):
+        self.instance_id = new_instance_id(node_id) if instance_id is None else instance_id
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def _next(self):
+        now = time.time_ns() // 1_000_000 - _EPOCH_MS
+        with self._lock:
+            if now > self._last_ms:
+                self._last_ms, self._sequence = now, 0
+            else:
+                # Same millisecond, or the clock went back: keep counting on
+                # the last one and borrow the next when its sequence runs out
+                self._sequence += 1
+                if self._sequence >> SEQUENCE_BITS:
+                    self._last_ms, self._sequence = self._last_ms + 1, 0
+            return (self._last_ms << INSTANCE_BITS | self.instance_id) << SEQUENCE_BITS | self._sequence
+
+    def new_id(self):
+        return format_ticket_id(self._next())
+
+
+# Two base32 characters for every 10 bits, so formatting is a few lookups
+_PAIRS = [first + second for first in ALPHABET for second in ALPHABET]
+_PAIR_SHIFTS = tuple(range((ID_CHARS // 2 - 1) * 10, -1, -10))
+
+def format_ticket_id(value):
+    text = "".join([_PAIRS[value >> shift & 1023] for shift in _PAIR_SHIFTS])
+    if ID_CHARS % 2:
+        text = ALPHABET[value >> (ID_CHARS // 2 * 10)] + text
+    groups, start = [], 0
+    for size in GROUPS:
+        groups.append(text[start:start + size])
+        start += size
+    return TICKET_PREFIX + "-".join(groups)
+
+# The number behind a ticket id made here; ValueError for any other id
+# (including the older TKT-<movie>-<random> ones)
+def parse_ticket_id(ticket_id):
+    text = ticket_id.upper()
+    if not text.startswith(TICKET_PREFIX):
+        raise ValueError(f"'{ticket_id}' is not a ticket id")
+    text = text[len(TICKET_PREFIX):]
+    if [len(group) for group in text.split("-")] != list(GROUPS):
+        raise ValueError(f"'{ticket_id}' is not a ticket id")
+    value = 0
+    for char in text.replace("-", ""):
+        digit = ALPHABET.find(char)
+        if digit < 0:
+            raise ValueError(f"'{ticket_id}' is not a ticket id")
+        value = value * 32 + digit
+    return value
+
+# When and by which process a ticket id was made, for support and debugging
+def describe_ticket_id(ticket_id):
+    value = parse_ticket_id(ticket_id)
+    sequence = value & ((1 << SEQUENCE_BITS) - 1)
+    value >>= SEQUENCE_BITS
+    instance_id = value & ((1 << INSTANCE_BITS) - 1)
+    return {
+        'created_at': EPOCH + datetime.timedelta(milliseconds=value >> INSTANCE_BITS),
+        'instance_id': f"{instance_id:012x}",
+        'sequence': sequence
+    }
+
+
+_generator = None
+_generator_lock = threading.Lock()
+
+def _reset_after_fork():
+    global _generator, _generator_lock
+    # A forked child must draw its own instance id, not continue the parent's
+    _generator, _generator_lock = None, threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+# Use node_id for this process from now on (e.g. read from the deployment's config)
+def configure_ticket_ids(node_id):
+    global _generator
+    with _generator_lock:
+        _generator = TicketIdGenerator(node_id)
+
+def new_ticket_id():
+    global _generator
+    generator = _generator
+    if generator is None:
+        with _generator_lock:
+            if _generator is None:
+                _generator = TicketIdGenerator(NODE_ID)
+            generator = _generator
+    return generator.new_id()